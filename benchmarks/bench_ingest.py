@@ -0,0 +1,104 @@
+"""Benchmark the peak memory of the job ingestion.
+
+Compare decoding the whole job document, as the request parser used to do,
+with the streaming `squash.ingest.JobLoader` for job documents of increasing
+size. The documents are built by replicating the measurements and blobs of
+``tests/data/verify_job_with_null.json``.
+
+The jobs are loaded in an in-memory SQLite database so that the benchmark
+does not depend on MySQL.
+"""
+
+import json
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from squash.config import Testing
+from squash.ingest import JobDocument, JobLoader
+from squash.models import MetricModel
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "tests" / "data"
+FIXTURE = DATA_DIR / "verify_job_with_null.json"
+
+
+class Benchmark(Testing):
+    """In-memory database configuration."""
+
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    # The single connection of the in-memory database is not pooled
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_ECHO = False
+    SQUASH_CACHE_TYPE = "null"
+
+
+def make_document(f, copies):
+    """Write a job document with ``copies`` times the fixture content."""
+    with open(FIXTURE) as fixture:
+        data = json.load(fixture)
+
+    measurements = []
+    blobs = []
+    for i in range(copies):
+        for blob in data["blobs"]:
+            blobs.append(dict(blob, identifier=f"{blob['identifier']}{i}"))
+        for meas in data["measurements"]:
+            refs = [f"{ref}{i}" for ref in meas["blob_refs"]]
+            measurements.append(dict(meas, blob_refs=refs))
+
+    document = dict(data, measurements=measurements, blobs=blobs)
+    f.write(json.dumps(document).encode())
+    f.flush()
+    return data["metrics"]
+
+
+def measure(func):
+    """Return the elapsed time and the peak memory of func()."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(sizes=(1, 10, 50), batch_size=1000):
+    """Run the benchmark."""
+    from squash.app import create_app
+
+    app = create_app(Benchmark)
+
+    print(
+        f"{'size (MB)':>10} {'method':10} {'time (s)':>10} {'peak (MB)':>10}"
+    )
+    with app.app_context():
+        for copies in sizes:
+            with tempfile.NamedTemporaryFile() as f:
+                metrics = make_document(f, copies)
+                for metric in metrics:
+                    if not MetricModel.find_by_name(metric["name"]):
+                        MetricModel(metric["name"]).save_to_db()
+
+                size = pathlib.Path(f.name).stat().st_size / 1024**2
+
+                def load():
+                    f.seek(0)
+                    json.load(f)
+
+                def stream():
+                    f.seek(0)
+                    JobLoader(JobDocument(f), batch_size).run()
+
+                for name, func in [("json.load", load), ("streaming", stream)]:
+                    elapsed, peak = measure(func)
+                    print(
+                        f"{size:10.1f} {name:10} {elapsed:10.2f} "
+                        f"{peak / 1024**2:10.2f}"
+                    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
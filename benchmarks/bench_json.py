@@ -0,0 +1,52 @@
+"""Benchmark the JSON encoding of the API responses.
+
+Compare the standard library json module used by flask-restful with
+`squash.representations.dumps` for the test job documents.
+"""
+
+import json
+import pathlib
+import timeit
+import tracemalloc
+
+from squash.representations import dumps
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "tests" / "data"
+FIXTURES = [
+    "job-768.json",
+    "verify_job_with_nan.json",
+    "verify_job_with_null.json",
+]
+
+
+def stdlib_dumps(obj):
+    """Encode like the default flask-restful representation."""
+    return json.dumps(obj).encode()
+
+
+def peak_memory(func, obj):
+    """Return the peak memory in bytes allocated by func(obj)."""
+    tracemalloc.start()
+    func(obj)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main(number=20):
+    """Run the benchmark."""
+    print(f"{'fixture':30} {'encoder':8} {'time (ms)':>10} {'peak (MB)':>10}")
+    for filename in FIXTURES:
+        with open(DATA_DIR / filename) as f:
+            data = json.load(f)
+        for name, func in [("json", stdlib_dumps), ("squash", dumps)]:
+            elapsed = timeit.timeit(lambda: func(data), number=number)
+            peak = peak_memory(func, data)
+            print(
+                f"{filename:30} {name:8} {elapsed / number * 1e3:10.2f} "
+                f"{peak / 1024**2:10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from flask_restful import Resource, reqparse
+
+from squash.cache import cache
+
+from ..models import ChangePointModel, MetricModel
+
+
+class ChangePointList(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument("job_id", type=int, location="args")
+    parser.add_argument("metric", type=str, location="args")
+    parser.add_argument("dataset", type=str, location="args")
+    parser.add_argument("ci_name", type=str, location="args")
+    parser.add_argument("limit", type=int, location="args", default=100)
+
+    @cache.cached("change_points")
+    def get(self):
+        """
+        Retrieve the change points flagged in the metric time series.
+        A series is the measurements of a metric for a dataset and a CI
+        pipeline. A change point flags the job whose measurement shifted
+        the series mean, the most recent first.
+        ---
+        tags:
+          - Metrics
+        parameters:
+        - name: job_id
+          in: query
+          type: integer
+          description: ID of the job that introduced the change.
+        - name: metric
+          in: query
+          type: string
+          description: Full qualified name of the metric, e.g. validate_drp.AM1
+        - name: dataset
+          in: query
+          type: string
+          description: Name of the dataset, e.g. HSC
+        - name: ci_name
+          in: query
+          type: string
+          description: Name of the CI pipeline, e.g. validate_drp
+        - name: limit
+          in: query
+          type: integer
+          description: Maximum number of change points returned, 100 by default.
+        responses:
+          200:
+            description: >
+                List of change points successfully retrieved. Each change
+                point reports the measurement value, the mean and standard
+                deviation of the series before the change, the direction of
+                the shift, up or down, and the CUSUM statistic.
+        """
+        args = self.parser.parse_args()
+
+        query = ChangePointModel.query
+        if args["job_id"] is not None:
+            query = query.filter(ChangePointModel.job_id == args["job_id"])
+        if args["metric"] is not None:
+            query = query.join(
+                MetricModel, ChangePointModel.metric_id == MetricModel.id
+            ).filter(MetricModel.name == args["metric"])
+        if args["dataset"] is not None:
+            query = query.filter(ChangePointModel.dataset == args["dataset"])
+        if args["ci_name"] is not None:
+            query = query.filter(ChangePointModel.ci_name == args["ci_name"])
+
+        change_points = (
+            query.order_by(ChangePointModel.job_id.desc())
+            .limit(args["limit"])
+            .all()
+        )
+        return {
+            "change_points": [
+                change_point.json() for change_point in change_points
+            ]
+        }
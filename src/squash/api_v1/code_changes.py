@@ -1,9 +1,15 @@
+from flask import current_app as app
 from flask_restful import Resource, reqparse
+from sqlalchemy import and_, or_, select
 
+from squash.cache import cache
+from squash.compare import diff_packages
 from squash.decorators import time_this
 
 from ..models import EnvModel as Env
 from ..models import JobModel as Job
+from ..models import PackageModel as Package
+from ..models import db
 
 
 class CodeChanges(Resource):
@@ -57,16 +63,7 @@ class CodeChanges(Resource):
         """Return the packages in the current job that changed
         wrt the previous job.
 
-        Notes
-        -----
-        The code changes are computed like this:
-
-        - packages present in the current job but not
-        in the previous one
-        - packages present in the previous job but
-        removed in the current one
-        - packages present in both but the git commit
-        sha has change
+        See `squash.compare.diff_packages`.
 
         Parameters
         ----------
@@ -82,22 +79,12 @@ class CodeChanges(Resource):
             number of packages that changed.
         """
 
-        prev_pkgs = set(
-            [(p.name, p.git_sha, p.git_url) for p in previous.packages]
-        )
-
-        curr_pkgs = set(
-            [(p.name, p.git_sha, p.git_url) for p in current.packages]
+        return diff_packages(
+            [(p.name, p.git_sha, p.git_url) for p in previous.packages],
+            [(p.name, p.git_sha, p.git_url) for p in current.packages],
         )
 
-        diff_pkgs = list(curr_pkgs.difference(prev_pkgs))
-
-        code_changes = {"packages": [], "counts": 0}
-        if diff_pkgs:
-            code_changes = {"packages": diff_pkgs, "counts": len(diff_pkgs)}
-
-        return code_changes
-
+    @cache.cached("code_changes")
     def get(self, ci_id):
         """
         Retrieve the list of packages that changed wrt to the
@@ -149,3 +136,191 @@ class CodeChanges(Resource):
             "packages": code_changes["packages"],
             "counts": code_changes["counts"],
         }
+
+
+class CodeChangesRange(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument(
+        "ci_name",
+        type=str,
+        location="args",
+        required=True,
+        help="This field cannot be left blank.",
+    )
+    parser.add_argument(
+        "start",
+        type=str,
+        location="args",
+        required=True,
+        help="You must provide the ci_id of the first run.",
+    )
+    parser.add_argument(
+        "end",
+        type=str,
+        location="args",
+        required=True,
+        help="You must provide the ci_id of the last run.",
+    )
+
+    @staticmethod
+    def _jobs(ci_name, *columns):
+        """Return the query for the jobs of a CI pipeline in run order."""
+        env_id = select(Env.id).where(Env.name == "jenkins").scalar_subquery()
+        return (
+            db.session.query(*columns)
+            .filter(Job.env_id == env_id)
+            .filter(Job.env["ci_name"].as_string() == ci_name)
+            .order_by(Job.date_created.asc(), Job.id.asc())
+        )
+
+    @staticmethod
+    def _from(job, first=True):
+        """Select the jobs from a job on, including the job.
+
+        If ``first`` is `False`, select the jobs up to the job instead.
+        """
+        date_created, job_id = job
+        if first:
+            return or_(
+                Job.date_created > date_created,
+                and_(Job.date_created == date_created, Job.id >= job_id),
+            )
+        return or_(
+            Job.date_created < date_created,
+            and_(Job.date_created == date_created, Job.id <= job_id),
+        )
+
+    @time_this
+    def get_bounds(self, ci_name, start, end):
+        """Return the date and id of the first jobs of two runs.
+
+        Returns
+        -------
+        first, last : `tuple` or `None`
+            The date and id of the first job of the start and end runs,
+            `None` if the run is not found.
+        """
+        ci_id = Job.env["ci_id"].as_string()
+        bounds = {}
+        for date_created, job_id, run in self._jobs(
+            ci_name, Job.date_created, Job.id, ci_id
+        ).filter(ci_id.in_([start, end])):
+            bounds.setdefault(run, (date_created, job_id))
+        return bounds.get(start), bounds.get(end)
+
+    @time_this
+    def get_runs(self, ci_name, first, last):
+        """Return the job id and ci_id of the runs between two jobs.
+
+        Only the jobs between the first jobs of the two runs are read. Runs
+        are ordered by date, the first job of each run in this window is
+        used.
+        """
+        jobs = self._jobs(
+            ci_name, Job.id, Job.env["ci_id"].as_string()
+        ).filter(self._from(first), self._from(last, first=False))
+
+        runs = []
+        ci_ids = set()
+        for job_id, ci_id in jobs:
+            if ci_id in ci_ids:
+                continue
+            ci_ids.add(ci_id)
+            runs.append((job_id, ci_id))
+        return runs
+
+    @time_this
+    def get_packages(self, job_ids):
+        """Return the packages of each job, loaded in a single query."""
+        packages = {job_id: [] for job_id in job_ids}
+        for job_id, *package in db.session.query(
+            Package.job_id, Package.name, Package.git_sha, Package.git_url
+        ).filter(Package.job_id.in_(job_ids)):
+            packages[job_id].append(tuple(package))
+        return packages
+
+    @cache.cached("code_changes")
+    def get(self):
+        """
+        Retrieve the packages that changed in a range of runs of a CI
+        pipeline.
+        ---
+        tags:
+          - Apps
+        parameters:
+        - name: ci_name
+          in: query
+          type: string
+          description: Name of the CI pipeline, e.g. validate_drp
+          required: true
+        - name: start
+          in: query
+          type: string
+          description: ci_id of the first run of the range.
+          required: true
+        - name: end
+          in: query
+          type: string
+          description: ci_id of the last run of the range.
+          required: true
+        responses:
+          200:
+            description: >
+                Package changes successfully computed. The net changes
+                are the packages that changed between the first and the
+                last run, the steps are the packages that changed in each
+                run with respect to the previous run in the range.
+          400:
+            description: >
+                Too many runs in the range or the start run is after the
+                end run.
+          404:
+            description: Run not found.
+        """
+        args = self.parser.parse_args()
+
+        first, last = self.get_bounds(
+            args["ci_name"], args["start"], args["end"]
+        )
+        runs = []
+        if first is not None and last is not None:
+            if first > last:
+                return {"message": "start must precede end."}, 400
+            runs = self.get_runs(args["ci_name"], first, last)
+        if not runs:
+            message = "Run `{}` or `{}` not found for `{}`.".format(
+                args["start"], args["end"], args["ci_name"]
+            )
+            return {"message": message}, 404
+
+        max_runs = app.config["SQUASH_CODE_CHANGES_MAX_RUNS"]
+        if len(runs) > max_runs:
+            message = f"At most {max_runs} runs can be compared at once."
+            return {"message": message}, 400
+
+        packages = self.get_packages([job_id for job_id, _ in runs])
+
+        steps = []
+        for (previous_id, previous_ci_id), (job_id, ci_id) in zip(
+            runs, runs[1:]
+        ):
+            code_changes = diff_packages(
+                packages[previous_id], packages[job_id]
+            )
+            steps.append(
+                {
+                    "ci_id": ci_id,
+                    "id": job_id,
+                    "previous_ci_id": previous_ci_id,
+                    "previous_id": previous_id,
+                    **code_changes,
+                }
+            )
+
+        first_id, last_id = runs[0][0], runs[-1][0]
+        return {
+            "ci_name": args["ci_name"],
+            "runs": len(runs),
+            "net": diff_packages(packages[first_id], packages[last_id]),
+            "steps": steps,
+        }
@@ -0,0 +1,98 @@
+from flask_restful import Resource, reqparse
+
+from squash.cache import cache
+from squash.compare import align_measurements, compare_specs, diff_packages
+from squash.evaluation import evaluate_jobs, load_measurements
+from squash.series import to_json
+
+from ..models import JobModel, PackageModel, db
+
+
+class Compare(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument(
+        "base",
+        type=int,
+        location="args",
+        required=True,
+        help="You must provide the ID of the base job.",
+    )
+    parser.add_argument(
+        "head",
+        type=int,
+        location="args",
+        required=True,
+        help="You must provide the ID of the head job.",
+    )
+
+    @cache.cached("compare")
+    def get(self):
+        """
+        Compare the measurements of two verification jobs.
+        Measurements are aligned by metric name and returned as parallel
+        arrays with the base and head values and their deltas. Also
+        return the metric specifications whose status changed and the
+        packages that changed in the head job.
+        ---
+        tags:
+          - Jobs
+        parameters:
+        - name: base
+          in: query
+          type: integer
+          description: ID of the base job, e.g. the last nightly.
+          required: true
+        - name: head
+          in: query
+          type: integer
+          description: ID of the head job, e.g. a ticket branch build.
+          required: true
+        responses:
+          200:
+            description: >
+                Jobs successfully compared. Deltas are head - base values,
+                in the unit of the base measurement, relative deltas are
+                divided by the absolute base value. Missing values are
+                null. Specification status is pass, fail, unknown or empty
+                if the specification does not apply to the job.
+          404:
+            description: Job not found.
+        """
+        args = self.parser.parse_args()
+        base_id, head_id = args["base"], args["head"]
+
+        metas = dict(
+            db.session.query(JobModel.id, JobModel.meta)
+            .filter(JobModel.id.in_([base_id, head_id]))
+            .all()
+        )
+        for job_id in [base_id, head_id]:
+            if job_id not in metas:
+                return {"message": f"Job `{job_id}` not found."}, 404
+
+        base = load_measurements([base_id])
+        head = load_measurements([head_id])
+
+        specs, summary = compare_specs(
+            evaluate_jobs([base_id], base, metas),
+            evaluate_jobs([head_id], head, metas),
+        )
+
+        packages = {base_id: [], head_id: []}
+        for job_id, *package in db.session.query(
+            PackageModel.job_id,
+            PackageModel.name,
+            PackageModel.git_sha,
+            PackageModel.git_url,
+        ).filter(PackageModel.job_id.in_([base_id, head_id])):
+            packages[job_id].append(tuple(package))
+
+        return {
+            "base": base_id,
+            "head": head_id,
+            "measurements": to_json(align_measurements(base, head)),
+            "specs": {**to_json(specs), "summary": summary},
+            "code_changes": diff_packages(
+                packages[base_id], packages[head_id]
+            ),
+        }
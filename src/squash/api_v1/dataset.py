@@ -1,11 +1,13 @@
 from flask import current_app as app
-from flask import jsonify
 from flask_restful import Resource
 
+from squash.cache import cache
+
 from ..models import JobModel as Job
 
 
 class DatasetList(Resource):
+    @cache.cached("datasets")
     def get(self):
         """
         Retrieve the list of datasets used in SQuaSH.
@@ -22,4 +24,4 @@ class DatasetList(Resource):
         except StopIteration:
             app.logger.warn("No datasets found.")
 
-        return jsonify({"datasets": datasets})
+        return {"datasets": datasets}
@@ -0,0 +1,81 @@
+from flask import current_app as app
+from flask_restful import Resource, reqparse
+
+from squash.cache import cache
+from squash.evaluation import evaluate_jobs, summarize
+from squash.series import to_json
+
+
+class Evaluation(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument(
+        "job_id",
+        type=int,
+        location="args",
+        action="append",
+        required=True,
+        help="You must provide at least one job id.",
+    )
+    parser.add_argument("summary", type=int, location="args", default=0)
+
+    @cache.cached("evaluation")
+    def get(self):
+        """
+        Evaluate the measurements of jobs against the metric specifications.
+        Return parallel arrays with one element per measurement and
+        applicable specification. A specification applies to the
+        measurements of its metric in the jobs whose metadata match its
+        metadata query.
+        ---
+        tags:
+          - Metric Specifications
+        parameters:
+        - name: job_id
+          in: query
+          type: array
+          items:
+            type: integer
+          collectionFormat: multi
+          description: ID of the jobs, e.g. job_id=1&job_id=2
+          required: true
+        - name: summary
+          in: query
+          type: integer
+          description: >
+            If 1, return the number of measurements that passed, failed or
+            could not be evaluated and the failed evaluations of each job.
+        responses:
+          200:
+            description: >
+                Evaluation successfully computed. status is pass, fail, or
+                unknown if the measurement value is missing or its unit is
+                not comparable with the threshold unit. thresholds are
+                converted to the measurement unit, margins are the distance
+                of the values to the thresholds, positive if the measurement
+                passes.
+          400:
+            description: Too many jobs requested.
+        """
+        args = self.parser.parse_args()
+        job_ids = args["job_id"]
+
+        max_jobs = app.config["SQUASH_EVALUATION_MAX_JOBS"]
+        if len(job_ids) > max_jobs:
+            message = f"At most {max_jobs} jobs can be evaluated at once."
+            return {"message": message}, 400
+
+        results = evaluate_jobs(job_ids)
+        if not args["summary"]:
+            return to_json(results)
+
+        return {
+            "jobs": {
+                str(job_id): summarize(
+                    {
+                        name: column[results["job_ids"] == job_id]
+                        for name, column in results.items()
+                    }
+                )
+                for job_id in job_ids
+            }
+        }
@@ -1,11 +1,14 @@
 from flask_restful import Resource, reqparse
 
+from squash.cache import cache
+
 from ..models import EnvModel, JobModel
 
 
 class Jenkins(Resource):
     parser = reqparse.RequestParser()
 
+    @cache.cached("jenkins")
     def get(self, ci_id):
         """
         Retrieve a verification job from the jenkins environment.
@@ -1,26 +1,57 @@
-import json
-import warnings
-
 from flask import current_app as app
-from flask import url_for
+from flask import request, url_for
 from flask_jwt import jwt_required
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 
-from squash.decorators import time_this
+from squash.cache import cache
 from squash.error import ApiError
+from squash.evaluation import evaluate_jobs, summarize
+from squash.ingest import JobDocument, JobLoader, spool
+from squash.retention import delete_jobs
+from squash.staging import get_staging
 from squash.tasks.influxdb import job_to_influxdb
+from squash.tasks.ingest import ingest_job
+
+from ..models import JobModel, db
+
+
+def to_bool(value):
+    """Convert a query string value to a boolean."""
+    return value.lower() in ["true", "1", "yes"]
+
+
+def invalidate_job(job_id):
+    """Invalidate the cached responses that depend on a given job."""
+    invalidate_jobs([job_id])
 
-from ..models import (
-    BlobModel,
-    EnvModel,
-    JobModel,
-    MeasurementModel,
-    MetricModel,
-    PackageModel,
-)
+
+def invalidate_jobs(job_ids=None):
+    """Invalidate the cached responses that depend on given jobs.
+
+    If ``job_ids`` is `None`, the responses of every job are invalidated.
+    """
+    if job_ids is None:
+        cache.invalidate("job")
+        cache.invalidate("measurement")
+    elif job_ids:
+        cache.invalidate("job", *job_ids)
+        cache.invalidate("measurement", *job_ids)
+    for resource in [
+        "jobs",
+        "jenkins",
+        "datasets",
+        "code_changes",
+        "series",
+        "evaluation",
+        "change_points",
+        "compare",
+        "package_history",
+    ]:
+        cache.invalidate(resource)
 
 
 class JobWithArg(Resource):
+    @cache.cached("job", item="job_id")
     def get(self, job_id):
         """
         Retrieve a verification job.
@@ -71,38 +102,21 @@ class JobWithArg(Resource):
                 valid access token.
         """
 
-        job = JobModel.find_by_id(job_id)
+        # Do not load the job, its measurements are deleted with a single
+        # statement instead of the ORM cascade
+        job = db.session.query(JobModel.id).filter_by(id=job_id).first()
 
         if not job:
             message = "Job `{}` does not exist.".format(job_id)
             return {"message": message}, 404
 
-        job.delete_from_db()
+        delete_jobs([job_id])
+        invalidate_job(job_id)
+
         return {"message": "Job deleted."}
 
 
 class Job(Resource):
-    parser = reqparse.RequestParser()
-    # accept multiple values
-    # http://flask-restful.readthedocs.io/en/0.3.5/reqparse.html
-    parser.add_argument(
-        "measurements",
-        type=dict,
-        default=[],
-        action="append",
-    )
-    parser.add_argument(
-        "meta",
-        default={},
-        type=dict,
-    )
-    parser.add_argument(
-        "blobs",
-        type=dict,
-        default=[],
-        action="append",
-    )
-
     @jwt_required()
     def post(self):
         """
@@ -113,6 +127,20 @@ class Job(Resource):
         tags:
           - Jobs
         parameters:
+        - name: async
+          in: query
+          type: boolean
+          description: >
+            Validate and stage the job document, and load it in the
+            background. By default set by the SQUASH_INGEST_ASYNC
+            configuration.
+        - name: evaluate
+          in: query
+          type: boolean
+          description: >
+            Evaluate the job measurements against the metric
+            specifications and report the failures with the ingest status.
+            By default set by the SQUASH_INGEST_EVALUATE configuration.
         - in: body
           name: "Request body:"
           schema:
@@ -139,31 +167,30 @@ class Job(Resource):
           500:
             description: An error occurred creating this job.
         """
-        self.data = Job.parser.parse_args()
-
-        try:
-            env_id = self.check_or_create_env()
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
-
-        try:
-            job_id = self.create_job(env_id)
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
-
-        try:
-            self.insert_packages(job_id)
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
+        ingest_async = request.args.get(
+            "async", app.config["SQUASH_INGEST_ASYNC"], type=to_bool
+        )
+        evaluate = request.args.get(
+            "evaluate", app.config["SQUASH_INGEST_EVALUATE"], type=to_bool
+        )
+
+        # The job document is read iteratively from a spooled copy of the
+        # request body, large documents are never held in memory.
+        with spool(request.stream, app.config["SQUASH_SPOOL_DIR"]) as f:
+            loader = JobLoader(
+                JobDocument(f),
+                app.config["SQUASH_INGEST_BATCH_SIZE"],
+                detect=app.config["SQUASH_DETECTION"],
+            )
+            try:
+                if ingest_async:
+                    return self.stage(loader, f, evaluate)
+                job_id = loader.run()
+            except ApiError as err:
+                app.logger.error(err.message)
+                return {"message": err.message}, err.status_code
 
-        try:
-            self.insert_measurements(job_id)
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
+        invalidate_job(job_id)
 
         # async celery task
         try:
@@ -174,162 +201,49 @@ class Job(Resource):
 
         # see DM-16391 for improving task status report
         message = "Request for creating Job `{}` received".format(job_id)
-        return {
+        response = {
             "message": message,
             "status": url_for("status", task_id=task.id, _external=True),
-        }, 202
+        }
+        if evaluate:
+            response["evaluation"] = summarize(evaluate_jobs([job_id]))
+        return response, 202
 
-    @time_this
-    def check_or_create_env(self):
-        """Check if env (e.g. Jenkins) exists in the db,
-        if not create it.
-        """
-        if "env" in self.data["meta"]:
-            env = self.data["meta"]["env"]
-            if "env_name" in env:
-                e = EnvModel.find_by_name(env["env_name"])
-                if not e:
-                    e = EnvModel(env["env_name"])
-                    try:
-                        e.save_to_db()
-                    except Exception:
-                        raise ApiError(
-                            "An error ocurred creating " "the env object.", 500
-                        )
-            else:
-                raise ApiError("Missing `env_name` in env metadata.", 400)
-        else:
-            # allows for unknown environment
-            e = EnvModel.find_by_name("unknown")
-            if not e:
-                e = EnvModel("unknown")
-                try:
-                    e.save_to_db()
-                except Exception:
-                    raise ApiError(
-                        "An error ocurred creating " "the env object.", 500
-                    )
-
-        return e.id
-
-    @time_this
-    def create_job(self, env_id):
-        """Creates the job object
+    def stage(self, loader, f, evaluate=False):
+        """Validate and stage the job document, then enqueue its ingest.
 
         Parameters
         ----------
-        env_id : `int`
-            id of the environment associated with the job.
-
-        Return
-        ------
-        job_id : `int`
-            id of the job created
+        loader : `squash.ingest.JobLoader`
+            The loader for the job document.
+        f : file-like
+            The spooled job document.
+        evaluate : `bool`
+            Evaluate the job against the metric specifications once loaded.
         """
+        loader.scan()
 
-        # job metadata contains arbitrary metadata plus
-        # env metadata and packages
-        meta = self.data["meta"].copy()
-
-        # we extract the env metadata
-        if "env" in meta:
-            env = meta.pop("env")
-        else:
-            env = {}
-
-        # and remove the packages, they will be inserted later.
-        if "packages" in meta:
-            del meta["packages"]
-        else:
-            raise ApiError("Missing packages metadata.", 400)
-
-        # what remains in meta is the arbitrary metadata we want to save
-        j = JobModel(env_id, env, meta)
-
+        staging = get_staging(
+            app.config["SQUASH_STAGING_URL"], app.config["SQUASH_SPOOL_DIR"]
+        )
+        f.seek(0)
         try:
-            j.save_to_db()
-        except Exception:
-            raise ApiError(
-                "An error occurred creating " "the job object.", 500
-            )
-
-        return j.id
+            uri = staging.put(f)
+        except Exception as err:
+            app.logger.error(err)
+            raise ApiError("An error occurred staging the job.", 500)
 
-    @time_this
-    def insert_packages(self, job_id):
-        """Insert packages associated with the job.
+        task = ingest_job.delay(uri, evaluate)
 
-        Parameters
-        ----------
-        job_id : `int`
-            id of the job object previously created.
-        """
-        meta = self.data["meta"]
-        if "packages" in meta:
-            packages = meta["packages"]
-        else:
-            raise ApiError("Missing packages metadata.", 400)
-
-        for package in packages:
-            p = PackageModel(job_id, **packages[package])
-            try:
-                p.save_to_db()
-            except Exception:
-                raise ApiError("An error occurred inserting packages", 500)
-
-    @time_this
-    def insert_measurements(self, job_id):
-        """Insert measurements associated with the job.
-
-        Parameters
-        ----------
-        job_id : `int`
-            id of the job object previously created.
-        """
-        measurements = self.data["measurements"]
-
-        for measurement in measurements:
-            if measurement and "metric" in measurement:
-                metric_name = measurement["metric"]
-            else:
-                raise ApiError(
-                    "You must provide a list of measurements "
-                    "and the associated metric name.",
-                    400,
-                )
-
-            metric = MetricModel.find_by_name(metric_name)
-
-            if metric:
-                m = MeasurementModel(job_id, metric.id, **measurement)
-                # Insert data blobs associated with this measurement
-                blobs = self.data["blobs"]
-                m.blobs = []
-
-                for blob in blobs:
-                    if blob and "identifier" in blob and "name" in blob:
-                        identifier = blob["identifier"]
-                        if identifier in measurement["blob_refs"]:
-                            name = blob["name"]
-                            b = BlobModel(identifier, name)
-                            m.blobs.append(b)
-
-                try:
-                    m.save_to_db()
-                except Exception:
-                    raise ApiError(
-                        "An error occurred inserting " "measurements", 500
-                    )
-
-            else:
-                warnings.warn(
-                    "Metric `{}` not found, it looks like "
-                    "the metrics definition is out of "
-                    "date.".format(metric_name)
-                )
+        message = "Request for ingesting Job received"
+        return {
+            "message": message,
+            "status": url_for("status", task_id=task.id, _external=True),
+        }, 202
 
 
 class JobList(Resource):
+    @cache.cached("jobs")
     def get(self):
         """
         Retrieve the complete list of job ids.
@@ -0,0 +1,106 @@
+from flask import current_app as app
+from flask_restful import Resource, reqparse
+
+from squash.matrix import FORMATS, MatrixQuery, encode
+
+from .series import to_datetime
+
+
+class JobMatrix(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument("dataset", type=str, location="args")
+    parser.add_argument("ci_name", type=str, location="args")
+    parser.add_argument("start", type=to_datetime, location="args")
+    parser.add_argument("end", type=to_datetime, location="args")
+    parser.add_argument("metric", type=str, location="args", action="append")
+    parser.add_argument(
+        "format",
+        type=str,
+        location="args",
+        default="npz",
+        choices=list(FORMATS),
+        help="Format must be one of npz, arrow or parquet.",
+    )
+
+    def get(self):
+        """
+        Retrieve the matrix of the measurement values of jobs.
+        Return a dense jobs by metrics matrix with the job metadata, for
+        the jobs matching the filter, ordered by time.
+        ---
+        tags:
+          - Jobs
+        parameters:
+        - name: dataset
+          in: query
+          type: string
+          description: Name of the dataset, e.g. HSC
+        - name: ci_name
+          in: query
+          type: string
+          description: Name of the CI pipeline that ran the jobs
+        - name: start
+          in: query
+          type: string
+          description: Include jobs created at this date or later
+        - name: end
+          in: query
+          type: string
+          description: Include jobs created before this date
+        - name: metric
+          in: query
+          type: array
+          items:
+            type: string
+          collectionFormat: multi
+          description: >
+            Full qualified name of the metrics to include, e.g.
+            metric=validate_drp.AM1&metric=validate_drp.AM2. By default all
+            the metrics measured by the jobs.
+        - name: format
+          in: query
+          type: string
+          enum: [npz, arrow, parquet]
+          description: >
+            Output format, a compressed NumPy npz archive (default) with
+            the job_ids, timestamps, datasets, ci_names, ci_ids,
+            filter_names, metrics, units and values arrays, or an Arrow IPC
+            stream or a Parquet file with the job metadata columns and one
+            column per metric.
+        responses:
+          200:
+            description: >
+                Matrix successfully retrieved. Missing values are NaN in
+                npz and null in arrow and parquet.
+          400:
+            description: Invalid query parameter or too many jobs.
+        """
+        args = self.parser.parse_args()
+
+        query = MatrixQuery(
+            dataset=args["dataset"],
+            ci_name=args["ci_name"],
+            start=args["start"],
+            end=args["end"],
+            metrics=args["metric"],
+        )
+
+        max_jobs = app.config["SQUASH_MATRIX_MAX_JOBS"]
+        if query.count() > max_jobs:
+            message = (
+                f"More than {max_jobs} jobs match the filter, restrict the "
+                "date range or use the squash export-matrix command."
+            )
+            return {"message": message}, 400
+
+        output = args["format"]
+        try:
+            data = encode(query.matrix(), output)
+        except RuntimeError as err:
+            return {"message": str(err)}, 400
+
+        response = app.response_class(data, mimetype=FORMATS[output])
+        response.headers["Content-Disposition"] = (
+            f"attachment; filename=matrix.{output}"
+        )
+        return response
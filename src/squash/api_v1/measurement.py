@@ -1,7 +1,10 @@
 from flask_jwt import jwt_required
 from flask_restful import Resource, reqparse
 
+from squash.cache import cache
+
 from ..models import JobModel, MeasurementModel, MetricModel
+from .job import invalidate_jobs
 
 
 class Measurement(Resource):
@@ -26,6 +29,7 @@ class Measurement(Resource):
         "to the measurement.",
     )
 
+    @cache.cached("measurement", item="job_id")
     def get(self, job_id):
         """
         Retrieve all measurements performed by a verification job.
@@ -118,6 +122,8 @@ class Measurement(Resource):
 
         if metric:
             measurement = MeasurementModel(job.id, metric.id, **data)
+            # the job date selects the measurement in the time windows
+            measurement.date_created = job.date_created
         else:
             message = "Metric `{}` not found.".format(metric_name)
             return {"message": message}, 404
@@ -129,6 +135,8 @@ class Measurement(Resource):
                 "message": "An error occurred inserting the " "measurement."
             }, 500
 
+        invalidate_jobs([job.id])
+
         return measurement.json(), 201
 
 
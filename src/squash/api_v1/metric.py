@@ -2,7 +2,24 @@ from flask_jwt import jwt_required
 from flask_restful import Resource, reqparse
 from sqlalchemy.orm import noload
 
+from squash.cache import cache
+
 from ..models import MetricModel
+from .job import invalidate_jobs
+
+
+def invalidate_metric(name):
+    """Invalidate the cached responses that depend on a given metric."""
+    cache.invalidate("metric", name)
+    for resource in [
+        "metrics",
+        "packages",
+        "specs",
+        "series",
+        "evaluation",
+        "compare",
+    ]:
+        cache.invalidate(resource)
 
 
 class Metric(Resource):
@@ -20,6 +37,7 @@ class Metric(Resource):
     parser.add_argument("tags", type=str, action="append")
     parser.add_argument("reference", type=dict)
 
+    @cache.cached("metric", item="name")
     def get(self, name):
         """
         Retrieve a metric from its name.
@@ -111,6 +129,8 @@ class Metric(Resource):
             message = "An error ocurred creating metric `{}`.".format(name)
             return {"message": message}, 500
 
+        invalidate_metric(name)
+
         return metric.json(), 201
 
     @jwt_required()
@@ -173,6 +193,8 @@ class Metric(Resource):
             message = "An error ocurred updating metric `{}`.".format(name)
             return {"message": message}, 500
 
+        invalidate_metric(name)
+
         return metric.json(), 200
 
     @jwt_required()
@@ -204,6 +226,10 @@ class Metric(Resource):
             return {"message": "Metric `{}` not found.".format(name)}, 404
 
         metric.delete_from_db()
+        invalidate_metric(name)
+        # the measurements of the metric are deleted from every job
+        invalidate_jobs()
+
         return {"message": "Metric deleted."}
 
 
@@ -212,6 +238,7 @@ class MetricList(Resource):
     parser.add_argument("metrics", type=dict, action="append")
     parser.add_argument("package")
 
+    @cache.cached("metrics")
     def get(self):
         """
         Retrieve the complete list of metrics.
@@ -288,4 +315,6 @@ class MetricList(Resource):
 
                 return {"message": message, "error": str(error)}, 500
 
+            invalidate_metric(name)
+
         return {"message": "List of metrics successfully created."}, 201
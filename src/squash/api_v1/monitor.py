@@ -0,0 +1,24 @@
+from flask import Response
+from flask_restful import Resource
+
+from ..instrumentation import generate_metrics
+
+
+class Monitor(Resource):
+    def get(self):
+        """
+        Retrieve the API performance metrics in the Prometheus format.
+        Request latency, response size, number and time of SQL statements
+        per endpoint, duration of the job ingest stages and response cache
+        hits and misses.
+        ---
+        tags:
+          - Misc
+        produces:
+          - text/plain
+        responses:
+          200:
+            description: Metrics successfully retrieved
+        """
+        data, content_type = generate_metrics()
+        return Response(data, content_type=content_type)
@@ -1,11 +1,17 @@
 from flask import current_app as app
-from flask import jsonify
-from flask_restful import Resource
+from flask_restful import Resource, reqparse
+from sqlalchemy import func
 
+from squash.cache import cache
+
+from ..models import JobModel as Job
 from ..models import MetricModel as Metric
+from ..models import PackageModel as Package
+from ..models import db
 
 
 class PackageList(Resource):
+    @cache.cached("packages")
     def get(self):
         """
         Retrieve the list of verification packages used in SQuaSH.
@@ -22,4 +28,82 @@ class PackageList(Resource):
         except StopIteration:
             app.logger.warn("No packages found.")
 
-        return jsonify({"packages": packages})
+        return {"packages": packages}
+
+
+class PackageHistory(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument("ci_name", type=str, location="args")
+
+    @cache.cached("package_history", item="name")
+    def get(self, name):
+        """
+        Retrieve the history of the versions of an eups package.
+        Return the distinct git commits of the package in the order they
+        were first used, with the first and last jobs that used each one.
+        ---
+        tags:
+          - Apps
+        parameters:
+        - name: name
+          in: path
+          type: string
+          description: Name of the eups package, e.g. pipe_tasks
+          required: true
+        - name: ci_name
+          in: query
+          type: string
+          description: >
+            Only consider the jobs of this CI pipeline, e.g. validate_drp
+        responses:
+          200:
+            description: Package history successfully retrieved.
+          404:
+            description: Package not found.
+        """
+        args = self.parser.parse_args()
+
+        first_job_id = func.min(Package.job_id)
+        last_job_id = func.max(Package.job_id)
+        query = db.session.query(
+            Package.git_sha,
+            func.max(Package.git_url),
+            first_job_id,
+            last_job_id,
+            func.count(Package.job_id),
+        ).filter(Package.name == name)
+        if args["ci_name"] is not None:
+            query = query.join(Job, Package.job_id == Job.id).filter(
+                Job.env["ci_name"].as_string() == args["ci_name"]
+            )
+        versions = query.group_by(Package.git_sha).order_by(first_job_id).all()
+
+        if not versions:
+            message = "Package `{}` not found.".format(name)
+            return {"message": message}, 404
+
+        job_ids = {job_id for version in versions for job_id in version[2:4]}
+        dates = dict(
+            db.session.query(Job.id, Job.date_created).filter(
+                Job.id.in_(job_ids)
+            )
+        )
+
+        def date(job_id):
+            return dates[job_id].strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        return {
+            "name": name,
+            "versions": [
+                {
+                    "git_sha": git_sha,
+                    "git_url": git_url,
+                    "first_job_id": first,
+                    "first_date": date(first),
+                    "last_job_id": last,
+                    "last_date": date(last),
+                    "jobs": count,
+                }
+                for git_sha, git_url, first, last, count in versions
+            ],
+        }
@@ -0,0 +1,115 @@
+from flask import current_app as app
+from flask import url_for
+from flask_jwt import jwt_required
+from flask_restful import Resource, reqparse
+
+from squash.retention import RetentionPolicy, plan
+from squash.tasks.retention import purge_jobs
+
+
+class Purge(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument("job_ids", type=int, action="append")
+    parser.add_argument("policies", type=dict, action="append")
+    parser.add_argument("dry_run", type=bool, default=False)
+    parser.add_argument("archive", type=bool, default=False)
+
+    @jwt_required()
+    def post(self):
+        """
+        Purge old verification jobs.
+        Jobs are selected by ID or by retention policies, by default the
+        retention policies configured with SQUASH_RETENTION_POLICIES. They
+        are optionally archived, then deleted in batches by a background
+        task.
+        ---
+        tags:
+          - Jobs
+        parameters:
+        - in: body
+          name: "Request body:"
+          schema:
+            type: object
+            properties:
+              job_ids:
+                type: array
+                items:
+                  type: integer
+                description: IDs of the jobs to purge.
+              policies:
+                type: array
+                items:
+                  type: object
+                  properties:
+                    env_name:
+                      type: string
+                    ci_name:
+                      type: string
+                    dataset:
+                      type: string
+                    keep_days:
+                      type: integer
+                      minimum: 0
+                    keep_runs:
+                      type: integer
+                      minimum: 1
+                description: >
+                  Retention policies, each keeps the jobs of an env, a CI
+                  pipeline and a dataset created in the last keep_days
+                  days or the last keep_runs jobs, whichever keeps more.
+              dry_run:
+                type: boolean
+                description: >
+                  Report the jobs the policies would purge without
+                  deleting them.
+              archive:
+                type: boolean
+                description: >
+                  Archive the jobs to SQUASH_RETENTION_ARCHIVE_DIR before
+                  deleting them, the archive can be loaded with
+                  squash import.
+        responses:
+          200:
+            description: >
+                Dry run, report the number of jobs and measurements to
+                purge and the dates of the oldest and newest of these jobs,
+                per policy.
+          202:
+            description: Request for purging the jobs received.
+          400:
+            description: Invalid policy or no archive directory configured.
+          401:
+            description: >
+                Authorization Required. Request does not contain a
+                valid access token.
+        """
+        data = self.parser.parse_args()
+
+        job_ids = data["job_ids"]
+        policies = data["policies"]
+        if job_ids is None and policies is None:
+            policies = app.config["SQUASH_RETENTION_POLICIES"]
+
+        if policies is not None:
+            try:
+                retention = [RetentionPolicy.from_dict(p) for p in policies]
+            except ValueError as err:
+                return {"message": str(err)}, 400
+
+        if data["dry_run"]:
+            if job_ids is not None:
+                return {"message": "Dry run requires policies."}, 400
+            job_ids, report = plan(retention)
+            return {"jobs": len(job_ids), "report": report}, 200
+
+        if data["archive"] and not app.config["SQUASH_RETENTION_ARCHIVE_DIR"]:
+            message = "No archive directory configured."
+            return {"message": message}, 400
+
+        task = purge_jobs.delay(job_ids, policies, data["archive"])
+
+        message = "Request for purging jobs received"
+        return {
+            "message": message,
+            "status": url_for("status", task_id=task.id, _external=True),
+        }, 202
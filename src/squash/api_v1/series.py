@@ -0,0 +1,139 @@
+from dateutil.parser import parse
+from flask import current_app as app
+from flask_restful import Resource, reqparse
+
+from squash.cache import cache
+from squash.downsample import METHODS, downsample
+from squash.series import FORMATS, SeriesQuery, to_arrow, to_json, to_npy
+
+from ..models import MetricModel
+
+
+def to_datetime(value):
+    """Parse a date, e.g. 2020-01-31 or 2020-01-31T12:00:00Z."""
+    return parse(value)
+
+
+class MetricSeries(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument("dataset", type=str, location="args")
+    parser.add_argument("ci_name", type=str, location="args")
+    parser.add_argument("filter_name", type=str, location="args")
+    parser.add_argument("start", type=to_datetime, location="args")
+    parser.add_argument("end", type=to_datetime, location="args")
+    parser.add_argument(
+        "downsample",
+        type=str,
+        location="args",
+        choices=METHODS,
+        help="Downsampling method must be one of lttb, minmax or aggregate.",
+    )
+    parser.add_argument("points", type=int, location="args")
+    parser.add_argument(
+        "format",
+        type=str,
+        location="args",
+        default="json",
+        choices=list(FORMATS),
+        help="Format must be one of json, npy or arrow.",
+    )
+
+    @cache.cached("series")
+    def get(self, name):
+        """
+        Retrieve the time series of the measurements of a metric.
+        Return parallel arrays with the job timestamps, measurement values,
+        job ids and measurement units, ordered by time.
+        ---
+        tags:
+          - Metrics
+        parameters:
+        - name: name
+          in: path
+          type: string
+          description: Full qualified name of the metric, e.g. validate_drp.AM1
+          required: true
+        - name: dataset
+          in: query
+          type: string
+          description: Name of the dataset, e.g. HSC
+        - name: ci_name
+          in: query
+          type: string
+          description: Name of the CI pipeline that ran the jobs
+        - name: filter_name
+          in: query
+          type: string
+          description: Name of the filter (band), e.g. r
+        - name: start
+          in: query
+          type: string
+          description: Include jobs created at this date or later
+        - name: end
+          in: query
+          type: string
+          description: Include jobs created before this date
+        - name: downsample
+          in: query
+          type: string
+          enum: [lttb, minmax, aggregate]
+          description: >
+            Reduce the series to at most `points` points. lttb (default)
+            and minmax select the points that preserve the shape or the
+            extreme values of the series. aggregate returns the mean,
+            median, min, max and count of the values in time buckets of
+            equal duration. Missing values are ignored.
+        - name: points
+          in: query
+          type: integer
+          description: >
+            Maximum number of points returned when downsampling, by
+            default set by the SQUASH_SERIES_DEFAULT_POINTS configuration.
+        - name: format
+          in: query
+          type: string
+          enum: [json, npy, arrow]
+          description: >
+            Output format, json (default), a NumPy structured array in npy
+            format or an Arrow IPC stream.
+        responses:
+          200:
+            description: Time series successfully retrieved.
+          400:
+            description: Invalid query parameter.
+          404:
+            description: Metric not found.
+        """
+        args = self.parser.parse_args()
+
+        metric = MetricModel.find_by_name(name)
+        if not metric:
+            return {"message": "Metric `{}` not found.".format(name)}, 404
+
+        columns = SeriesQuery(
+            metric.id,
+            dataset=args["dataset"],
+            ci_name=args["ci_name"],
+            filter_name=args["filter_name"],
+            start=args["start"],
+            end=args["end"],
+        ).columns()
+
+        method, points = args["downsample"], args["points"]
+        if method or points is not None:
+            if points is None:
+                points = app.config["SQUASH_SERIES_DEFAULT_POINTS"]
+            if points < 1:
+                return {"message": "Points must be a positive integer."}, 400
+            columns = downsample(columns, method or "lttb", points)
+
+        output = args["format"]
+        if output == "json":
+            return {"metric": name, **to_json(columns)}
+
+        try:
+            data = to_npy(columns) if output == "npy" else to_arrow(columns)
+        except RuntimeError as err:
+            return {"message": str(err)}, 400
+
+        return app.response_class(data, mimetype=FORMATS[output])
@@ -2,9 +2,19 @@ from flask_jwt import jwt_required
 from flask_restful import Resource, reqparse
 from sqlalchemy import func
 
+from squash.cache import cache
+
 from ..models import MetricModel, SpecificationModel
 
 
+def invalidate_spec(name):
+    """Invalidate the cached responses that depend on a given spec."""
+    cache.invalidate("spec", name)
+    cache.invalidate("specs")
+    cache.invalidate("evaluation")
+    cache.invalidate("compare")
+
+
 class Specification(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument("threshold", type=dict)
@@ -13,6 +23,7 @@ class Specification(Resource):
     parser.add_argument("tags", type=str, action="append")
     parser.add_argument("metadata_query", type=dict)
 
+    @cache.cached("spec", item="name")
     def get(self, name):
         """
         Retrieve a metric specification.
@@ -118,6 +129,8 @@ class Specification(Resource):
             message = "An error ocurred creating `{}`".format(name)
             return {"message": message}, 500
 
+        invalidate_spec(name)
+
         return spec.json(), 201
 
     @jwt_required()
@@ -177,6 +190,8 @@ class Specification(Resource):
             message = "An error ocurred updating `{}`".format(name)
             return {"message": message}, 500
 
+        invalidate_spec(name)
+
         return spec.json(), 200
 
     @jwt_required()
@@ -211,6 +226,8 @@ class Specification(Resource):
             return {"message": message}, 404
 
         spec.delete_from_db()
+        invalidate_spec(name)
+
         return {"message": "Metric specification deleted."}
 
 
@@ -218,6 +235,7 @@ class SpecificationList(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument("specs", type=dict, action="append")
 
+    @cache.cached("specs")
     def get(self):
         """
         Retrieve the complete list of metric specifications.
@@ -312,6 +330,8 @@ class SpecificationList(Resource):
 
                 return {"message": message}, 500
 
+            invalidate_spec(name)
+
         return {
             "message": "List of metric specificationss successfully "
             "created."
@@ -1,5 +1,7 @@
 from flask_restful import Resource
 
+from squash.cache import cache
+
 from ..models import JobModel as Job
 from ..models import MeasurementModel as Measurement
 from ..models import MetricModel as Metric
@@ -33,4 +35,4 @@ class Stats(Resource):
         stats["number_of_metrics"] = number_of_metrics
         stats["number_of_measurements"] = number_of_measurements
 
-        return {"stats": stats}
+        return {"stats": stats, "cache": cache.stats()}
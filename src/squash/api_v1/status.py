@@ -1,7 +1,43 @@
-from flask import jsonify
 from flask_restful import Resource
 
-from squash.tasks.influxdb import job_to_influxdb
+from squash.tasks.celery import squash_tasks
+
+
+def task_status(task_id):
+    """Return the status of an upload, ingest or export task."""
+    result = squash_tasks.AsyncResult(task_id)
+
+    if result.state in ["PENDING", "STARTED", "RETRY", "FAILURE"]:
+        return {"status": result.state}
+
+    if result.state == "PROGRESS":
+        return {"status": result.state, **result.info}
+
+    response = {
+        "status": result.state,
+        "message": result.info["message"],
+        "status_code": result.info["status_code"],
+    }
+
+    # Stage timings and throughput of the export to InfluxDB
+    if "stats" in result.info:
+        response["stats"] = result.info["stats"]
+
+    # Failures of the job evaluation, if requested at ingest
+    if "evaluation" in result.info:
+        response["evaluation"] = result.info["evaluation"]
+
+    # Number of rows deleted per table by a purge
+    if "report" in result.info:
+        response["report"] = result.info["report"]
+
+    # An ingest task is followed by the export of the job to InfluxDB
+    if "job_id" in result.info:
+        response["job_id"] = result.info["job_id"]
+    if "export_task_id" in result.info:
+        response["export"] = task_status(result.info["export_task_id"])
+
+    return response
 
 
 class Status(Resource):
@@ -20,33 +56,20 @@ class Status(Resource):
         responses:
           200:
             description: >
-                InfluxDB task status successfully retrieved.
+                Task status successfully retrieved.
                 PENDING: the task did not start yet.
                 STARTED: the task has started.
+                PROGRESS: the job is being ingested, the current ingest
+                step is reported.
                 FAILURE: something went wrong.
                 On sucess report a message and status code for the request.
+                For jobs ingested asynchronously, the ID of the job and
+                the status of its export to InfluxDB are also reported,
+                and the summary of the job evaluation if requested.
+                Purges report the number of rows deleted per table.
+                Exports report the timings of each stage, the write
+                batches, the number of lines, bytes and retries and the
+                write throughput.
 
         """
-        result = job_to_influxdb.AsyncResult(task_id)
-
-        if result.state == "PENDING":
-            response = {
-                "status": result.state,
-            }
-
-        if result.state == "STARTED":
-            response = {
-                "status": result.state,
-            }
-
-        elif result.state == "FAILURE":
-            response = {
-                "status": result.state,
-            }
-        else:
-            response = {
-                "message": result.info["message"],
-                "status_code": result.info["status_code"],
-            }
-
-        return jsonify(response)
+        return task_status(task_id)
@@ -13,7 +13,6 @@ and `flask run` will enable the interactive debugger and reloader.
 See app/config.py for the app configuration.
 """
 
-
 __all__ = ["create_app"]
 
 import os
@@ -22,21 +21,36 @@ from flask import Flask
 from flask_jwt import JWT
 from flask_restful import Api
 
-from squash.api_v1.code_changes import CodeChanges
+from squash.api_v1.change_point import ChangePointList
+from squash.api_v1.code_changes import CodeChanges, CodeChangesRange
+from squash.api_v1.compare import Compare
 from squash.api_v1.dataset import DatasetList
+from squash.api_v1.evaluation import Evaluation
 from squash.api_v1.jenkins import Jenkins
 from squash.api_v1.job import Job, JobList, JobWithArg
+from squash.api_v1.matrix import JobMatrix
 from squash.api_v1.measurement import Measurement, MeasurementList
 from squash.api_v1.metric import Metric, MetricList
-from squash.api_v1.package import PackageList
+from squash.api_v1.monitor import Monitor
+from squash.api_v1.package import PackageHistory, PackageList
+from squash.api_v1.retention import Purge
 from squash.api_v1.root import Root
+from squash.api_v1.series import MetricSeries
 from squash.api_v1.specification import Specification, SpecificationList
 from squash.api_v1.stats import Stats
 from squash.api_v1.status import Status
 from squash.api_v1.user import Register, User, UserList
 from squash.api_v1.version import Version
 from squash.auth import authenticate, identity
+from squash.cache import cache
+from squash.compression import compression
+from squash.instrumentation import instrumentation
 from squash.models import UserModel
+from squash.pool import pool
+from squash.profiling import profiler
+from squash.representations import output_json
+from squash.routing import routing
+from squash.tracing import tracing
 
 
 def create_app(profile):
@@ -61,6 +75,30 @@ def create_app(profile):
 
     db.init_app(app)
 
+    # instrument the connection pools, recreated after the uwsgi fork
+    pool.init_app(app)
+
+    # route the reads of the read-only requests to the read replicas
+    routing.init_app(app)
+
+    # trace requests, registered first so that the request span covers
+    # the other request hooks
+    tracing.init_app(app)
+
+    # initialize the response cache
+    cache.init_app(app)
+
+    # record request latency and SQL statements, registered before
+    # compression so that the compressed response size is recorded
+    instrumentation.init_app(app)
+
+    # accept compressed request bodies and compress large responses
+    compression.init_app(app)
+
+    # profile requests on demand, registered last so that the profile
+    # covers the view function and the response serialization
+    profiler.init_app(app)
+
     with app.app_context():
         db.create_all()
 
@@ -77,6 +115,7 @@ def create_app(profile):
 
     # register api resources
     api = Api(app)
+    api.representations["application/json"] = output_json
 
     # Redirect root url to api documentation
     api.add_resource(Root, "/")
@@ -92,6 +131,9 @@ def create_app(profile):
     # https://github.com/rochacbruno/flasgger/issues/174
     api.add_resource(JobWithArg, "/job/<int:job_id>", endpoint="jobwitharg")
     api.add_resource(JobList, "/jobs", endpoint="jobs")
+    api.add_resource(Compare, "/compare", endpoint="compare")
+    api.add_resource(JobMatrix, "/matrix", endpoint="matrix")
+    api.add_resource(Purge, "/purge", endpoint="purge")
 
     # Resource for jobs in the jenkins enviroment
     api.add_resource(Jenkins, "/jenkins/<string:ci_id>", endpoint="jenkins")
@@ -107,10 +149,17 @@ def create_app(profile):
     # Metric resources
     api.add_resource(Metric, "/metric/<string:name>", endpoint="metric")
     api.add_resource(MetricList, "/metrics", endpoint="metrics")
+    api.add_resource(
+        MetricSeries, "/metric/<string:name>/series", endpoint="series"
+    )
+    api.add_resource(
+        ChangePointList, "/change_points", endpoint="change_points"
+    )
 
     # Metric specifications resources
     api.add_resource(Specification, "/spec/<string:name>", endpoint="spec")
     api.add_resource(SpecificationList, "/specs", endpoint="specs")
+    api.add_resource(Evaluation, "/evaluation", endpoint="evaluation")
 
     # Metric measurement resources
     api.add_resource(
@@ -121,13 +170,22 @@ def create_app(profile):
     # Apps
     api.add_resource(DatasetList, "/datasets", endpoint="datasets")
     api.add_resource(PackageList, "/packages", endpoint="packages")
+    api.add_resource(
+        PackageHistory,
+        "/package/<string:name>/history",
+        endpoint="package_history",
+    )
     api.add_resource(
         CodeChanges, "/code_changes/<string:ci_id>", endpoint="code_changes"
     )
+    api.add_resource(
+        CodeChangesRange, "/code_changes", endpoint="code_changes_range"
+    )
 
     # Miscellaneous
     api.add_resource(Version, "/version", endpoint="version")
     api.add_resource(Stats, "/stats", endpoint="stats")
+    api.add_resource(Monitor, "/monitor", endpoint="monitor")
 
     return app
 
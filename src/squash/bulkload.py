@@ -0,0 +1,147 @@
+"""Implement the bulk load of lsst.verify job documents.
+
+Historical jobs are loaded straight into the database from a directory of
+job documents, without going through the API. Each document is validated
+and loaded with `squash.ingest.JobLoader`, the same code that ingests the
+jobs posted to the API, in a pool of worker processes. Each worker creates
+its own app and database connections.
+
+The change points and the InfluxDB export are not updated per job, they are
+run once after the load, see ``squash load``.
+"""
+
+__all__ = ["find_documents", "validate_document", "BulkLoader"]
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .error import ApiError
+from .ingest import JobDocument, JobLoader
+
+# App of the worker process
+_app = None
+
+
+def find_documents(directory, pattern="*.json"):
+    """Return the job documents in a directory and its sub-directories.
+
+    Returns
+    -------
+    paths : `list` [`str`]
+        Paths of the documents, sorted.
+    """
+    return sorted(
+        glob.glob(os.path.join(directory, "**", pattern), recursive=True)
+    )
+
+
+def validate_document(path):
+    """Validate a job document without loading it.
+
+    Must be called within the app context.
+
+    Returns
+    -------
+    error : `str` or `None`
+        The validation error, `None` if the document is valid.
+    """
+    try:
+        with open(path, "rb") as f:
+            JobLoader(JobDocument(f)).scan()
+    except ApiError as err:
+        return err.message
+    return None
+
+
+def _load(app, path, batch_size, etl_mode):
+    """Load a job document within the app context.
+
+    Returns
+    -------
+    result : `tuple`
+        The path, the ID of the job created and the error, either the job
+        ID or the error is `None`.
+    """
+    with app.app_context():
+        try:
+            with open(path, "rb") as f:
+                loader = JobLoader(
+                    JobDocument(f), batch_size, etl_mode=etl_mode
+                )
+                return path, loader.run(), None
+        except ApiError as err:
+            return path, None, err.message
+        except OSError as err:
+            return path, None, str(err)
+
+
+def _init_worker(profile):
+    """Create the app of a worker process."""
+    global _app
+    # Import here to avoid a circular import, the app imports the
+    # resources that enqueue the ingest tasks
+    from .app import create_app
+
+    _app = create_app(profile)
+
+
+def _load_in_worker(path, batch_size, etl_mode):
+    return _load(_app, path, batch_size, etl_mode)
+
+
+class BulkLoader:
+    """Load job documents into the database.
+
+    Parameters
+    ----------
+    app : `flask.Flask`
+        The app, used to load the documents in the current process.
+    profile : `str`
+        App configuration profile of the worker processes.
+    workers : `int`
+        Number of worker processes, if 1 the documents are loaded in the
+        current process.
+    batch_size : `int`
+        Maximum number of blobs or measurements inserted per transaction.
+    etl_mode : `bool`
+        Preserve the job dates from the env metadata.
+    """
+
+    def __init__(
+        self, app, profile, workers=1, batch_size=1000, etl_mode=True
+    ):
+        self.app = app
+        self.profile = profile
+        self.workers = workers
+        self.batch_size = batch_size
+        self.etl_mode = etl_mode
+
+    def load(self, paths):
+        """Load job documents.
+
+        Parameters
+        ----------
+        paths : `list` [`str`]
+            Paths of the job documents.
+
+        Yields
+        ------
+        result : `tuple`
+            The path, the ID of the job created or `None` and the error or
+            `None`, for each document in order.
+        """
+        if self.workers == 1:
+            for path in paths:
+                yield _load(self.app, path, self.batch_size, self.etl_mode)
+            return
+
+        with ProcessPoolExecutor(
+            self.workers, initializer=_init_worker, initargs=(self.profile,)
+        ) as executor:
+            yield from executor.map(
+                _load_in_worker,
+                paths,
+                [self.batch_size] * len(paths),
+                [self.etl_mode] * len(paths),
+            )
@@ -0,0 +1,312 @@
+"""Implement a read-through cache for the SQuaSH API responses.
+
+The uwsgi deployment runs several worker processes, so the cache is backed by
+the Redis instance already used by Celery and shared among them. A local
+in-memory backend is available for testing.
+
+Cached entries are grouped in namespaces, e.g. ``jobs`` or ``job:<job_id>``.
+Each namespace has a generation counter that is part of the cache key,
+invalidating a namespace is just a matter of incrementing its generation,
+stale entries are never read again and expire according to their TTL. The
+keys of the entries of an item also include the generation of the resource,
+invalidating a resource invalidates all its items.
+"""
+
+__all__ = ["Cache", "NullBackend", "RedisBackend", "SimpleBackend", "cache"]
+
+import logging
+import time
+from functools import wraps
+
+import redis
+from flask import current_app, g, request
+from werkzeug.wrappers import Response
+
+from .representations import dumps
+
+logger = logging.getLogger("squash")
+
+
+class NullBackend:
+    """Cache backend that does not cache anything."""
+
+    def get(self, key):
+        """Get the value of a key, always a miss."""
+        return None
+
+    def set(self, key, value, timeout=None):
+        """Set the value of a key, does nothing."""
+
+    def incr(self, key, amount=1):
+        """Increment a counter, always return zero."""
+        return 0
+
+
+class SimpleBackend:
+    """In-memory cache backend, local to the process.
+
+    Use for testing only, entries are not shared among the uwsgi workers.
+    """
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        """Get the value of a key or `None` if it does not exist."""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        """Set the value of a key with an optional timeout in seconds."""
+        expires = None
+        if timeout:
+            expires = time.monotonic() + timeout
+        self._data[key] = (expires, value)
+
+    def incr(self, key, amount=1):
+        """Increment a counter and return its new value."""
+        value = int(self.get(key) or 0) + amount
+        self._data[key] = (None, value)
+        return value
+
+
+class RedisBackend:
+    """Cache backend shared among processes through Redis.
+
+    Parameters
+    ----------
+    url : `str`
+        Redis URL, e.g. ``redis://localhost:6379/0``.
+    socket_timeout : `float`
+        Timeout in seconds for Redis operations. A Redis outage must not
+        take the API down, errors are logged and treated as cache misses.
+    """
+
+    def __init__(self, url, socket_timeout=0.5):
+        self._client = redis.Redis.from_url(
+            url,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout,
+        )
+
+    def get(self, key):
+        """Get the value of a key or `None` if it does not exist."""
+        try:
+            return self._client.get(key)
+        except redis.exceptions.RedisError as err:
+            logger.warning(f"Could not read {key} from the cache. {err}")
+            return None
+
+    def set(self, key, value, timeout=None):
+        """Set the value of a key with an optional timeout in seconds."""
+        try:
+            self._client.set(key, value, ex=timeout or None)
+        except redis.exceptions.RedisError as err:
+            logger.warning(f"Could not write {key} to the cache. {err}")
+
+    def incr(self, key, amount=1):
+        """Increment a counter and return its new value."""
+        try:
+            return self._client.incr(key, amount)
+        except redis.exceptions.RedisError as err:
+            logger.warning(f"Could not increment {key} in the cache. {err}")
+            return 0
+
+
+class Cache:
+    """Read-through cache for the API resources.
+
+    Follows the Flask extension pattern, create the `Cache` object once and
+    call `init_app` for each app instance. The backend is selected by the
+    ``SQUASH_CACHE_TYPE`` configuration, one of ``redis``, ``simple`` or
+    ``null``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the cache backend for the app."""
+        app.config.setdefault("SQUASH_CACHE_TYPE", "null")
+        app.config.setdefault("SQUASH_CACHE_REDIS_URL", None)
+        app.config.setdefault("SQUASH_CACHE_KEY_PREFIX", "squash-api")
+        app.config.setdefault("SQUASH_CACHE_DEFAULT_TIMEOUT", 300)
+        app.config.setdefault("SQUASH_CACHE_TIMEOUTS", {})
+        app.config.setdefault("SQUASH_CACHE_MAX_ENTRY_SIZE", 4 * 1024**2)
+
+        cache_type = app.config["SQUASH_CACHE_TYPE"]
+        if cache_type == "redis":
+            backend = RedisBackend(app.config["SQUASH_CACHE_REDIS_URL"])
+        elif cache_type == "simple":
+            backend = SimpleBackend()
+        elif cache_type == "null":
+            backend = NullBackend()
+        else:
+            raise ValueError(f"Invalid cache type `{cache_type}`.")
+
+        app.extensions["squash_cache"] = backend
+
+    @property
+    def backend(self):
+        """Return the cache backend for the current app."""
+        return current_app.extensions["squash_cache"]
+
+    def _key(self, *parts):
+        prefix = current_app.config["SQUASH_CACHE_KEY_PREFIX"]
+        return ":".join([prefix] + [str(part) for part in parts])
+
+    def _namespace(self, resource, item=None):
+        if item is None:
+            return resource
+        return f"{resource}:{item}"
+
+    def _generation(self, namespace):
+        generation = self.backend.get(self._key("gen", namespace))
+        return int(generation or 0)
+
+    def generation(self, resource, item=None):
+        """Return the generation of the cached responses of a resource.
+
+        The generation changes when the resource is invalidated, use it to
+        expire process local caches derived from the resource.
+        """
+        return self._generation(self._namespace(resource, item))
+
+    def _timeout(self, resource):
+        timeouts = current_app.config["SQUASH_CACHE_TIMEOUTS"]
+        default = current_app.config["SQUASH_CACHE_DEFAULT_TIMEOUT"]
+        return timeouts.get(resource, default)
+
+    def invalidate(self, resource, *items):
+        """Invalidate cached responses of a resource.
+
+        Parameters
+        ----------
+        resource : `str`
+            Name of the resource, e.g. ``jobs``.
+        *items
+            If given, invalidate only the cached responses of these items of
+            the resource, e.g. job ids for the ``job`` resource, otherwise
+            invalidate the responses of the resource and of all its items.
+        """
+        namespaces = [self._namespace(resource, item) for item in items]
+        if not items:
+            namespaces = [resource]
+
+        # Responses read from a lagging replica right after the
+        # invalidation are not cached, see `cached`
+        window = current_app.config.get("SQUASH_DB_STICKY_SECONDS")
+        for namespace in namespaces:
+            self.backend.incr(self._key("gen", namespace))
+            if window:
+                self.backend.set(self._key("recent", namespace), 1, window)
+
+    def stats(self):
+        """Return cache hit and miss counts per resource.
+
+        Counters are kept in the cache backend and thus aggregated among
+        all the uwsgi workers.
+
+        Returns
+        -------
+        stats : `dict`
+            Number of hits, misses and the hit ratio for each resource.
+        """
+        stats = {}
+        for resource in current_app.config["SQUASH_CACHE_TIMEOUTS"]:
+            hits = int(self.backend.get(self._key("hits", resource)) or 0)
+            misses = int(self.backend.get(self._key("misses", resource)) or 0)
+            ratio = None
+            if hits + misses:
+                ratio = hits / (hits + misses)
+            stats[resource] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": ratio,
+            }
+        return stats
+
+    @staticmethod
+    def _encode(rv):
+        """Return the response body to cache or `None` if not cacheable."""
+        if isinstance(rv, Response):
+            if rv.status_code == 200 and rv.is_json:
+                return rv.get_data()
+            return None
+
+        if isinstance(rv, tuple):
+            if len(rv) < 2 or rv[1] != 200:
+                return None
+            rv = rv[0]
+
+        if isinstance(rv, dict):
+            return dumps(rv) + b"\n"
+
+        return None
+
+    def cached(self, resource, item=None):
+        """Cache the response of a resource method.
+
+        Only successful responses are cached, the cache key includes the
+        request path and query string. Responses read from a read replica
+        within ``SQUASH_DB_STICKY_SECONDS`` of an invalidation are not
+        cached, the replica may not have the change yet.
+
+        Parameters
+        ----------
+        resource : `str`
+            Name of the resource, used to look up the TTL in the
+            ``SQUASH_CACHE_TIMEOUTS`` configuration and for invalidation.
+        item : `str`, optional
+            Name of the view argument that identifies an item of the
+            resource, e.g. ``job_id``. Responses for an item can then be
+            invalidated individually.
+        """
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                namespace = self._namespace(
+                    resource, kwargs.get(item) if item else None
+                )
+                generation = self._generation(namespace)
+                if namespace != resource:
+                    generation = f"{self._generation(resource)}.{generation}"
+                key = self._key(namespace, generation, request.full_path)
+
+                data = self.backend.get(key)
+                if data is not None:
+                    self.backend.incr(self._key("hits", resource))
+                    return current_app.response_class(
+                        data, mimetype="application/json"
+                    )
+
+                self.backend.incr(self._key("misses", resource))
+                rv = func(*args, **kwargs)
+
+                data = self._encode(rv)
+                if g.get("squash_read_bind") and any(
+                    self.backend.get(self._key("recent", name))
+                    for name in {namespace, resource}
+                ):
+                    data = None
+                max_size = current_app.config["SQUASH_CACHE_MAX_ENTRY_SIZE"]
+                if data is not None and len(data) <= max_size:
+                    self.backend.set(key, data, self._timeout(resource))
+
+                return rv
+
+            return wrapper
+
+        return decorator
+
+
+# Initialize extension
+cache = Cache()
@@ -0,0 +1,546 @@
+"""Implement the squash command line interface.
+
+Maintenance tasks that run against the SQuaSH database outside of the API
+requests, e.g.::
+
+    squash backfill-change-points --metric validate_drp.AM1
+    squash upgrade-db --dry-run
+    squash partition-db --months-ahead 3
+    squash export-matrix --dataset HSC --start 2020-01-01 matrix.parquet
+    squash export --start-id 0 --end-id 100000 dump/
+    squash import dump/
+    squash load --workers 4 jobs/
+    squash purge --policy '{"ci_name": "validate_drp", "keep_runs": 100}'
+
+The app configuration profile is set by the ``SQUASH_API_PROFILE``
+environment variable or the ``--profile`` option.
+"""
+
+__all__ = ["main"]
+
+import json
+import os
+
+import click
+from dateutil.parser import parse
+
+from .app import create_app
+from .bulkload import BulkLoader, find_documents, validate_document
+from .cache import cache
+from .detection import backfill
+from .matrix import FORMATS, MatrixQuery, encode
+from .migrations import upgrade
+from .models import MetricModel
+from .partitioning import partition
+from .retention import RetentionPolicy, plan, purge
+from .tasks.influxdb import job_to_influxdb, jobs_to_influxdb
+from .transfer import FORMATS as DUMP_FORMATS
+from .transfer import export_database, import_database
+
+
+@click.group()
+@click.option(
+    "--profile",
+    envvar="SQUASH_API_PROFILE",
+    default="squash.config.Development",
+    show_default=True,
+    help="App configuration profile.",
+)
+@click.pass_context
+def main(ctx, profile):
+    """Manage the SQuaSH database."""
+    ctx.obj = create_app(profile)
+
+
+@main.command("backfill-change-points")
+@click.option(
+    "--metric", help="Full qualified name of the metric, by default all."
+)
+@click.option(
+    "--batch-size",
+    default=10000,
+    show_default=True,
+    help="Number of measurements fetched at a time.",
+)
+@click.pass_obj
+def backfill_change_points(app, metric, batch_size):
+    """Build the metric time series states from the existing measurements.
+
+    Replaces the series states and the change points, see squash.detection.
+    """
+    with app.app_context():
+        metric_id = None
+        if metric is not None:
+            m = MetricModel.find_by_name(metric)
+            if m is None:
+                raise click.ClickException(f"Metric `{metric}` not found.")
+            metric_id = m.id
+
+        counts = backfill(metric_id, batch_size)
+        cache.invalidate("change_points")
+
+    click.echo(
+        "Read {measurements} measurements, built {series} series and "
+        "flagged {change_points} change points.".format(**counts)
+    )
+
+
+@main.command("upgrade-db")
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only list the columns, indexes and foreign keys to change.",
+)
+@click.pass_obj
+def upgrade_db(app, dry_run):
+    """Upgrade the schema of an existing database.
+
+    Create the missing tables, columns and indexes, fill the new columns
+    and recreate the foreign keys whose ON DELETE action changed. New
+    columns, indexes and foreign keys are applied to the existing rows,
+    which may take a while on large tables.
+    """
+    with app.app_context():
+        names = upgrade(dry_run)
+
+    verb = "Would change" if dry_run else "Changed"
+    click.echo(f"{verb} {len(names)} columns, indexes and foreign keys.")
+    for name in names:
+        click.echo(f"  {name}")
+
+
+@main.command("partition-db")
+@click.option(
+    "--months-ahead",
+    default=3,
+    show_default=True,
+    help="Number of months after the current month to create partitions "
+    "for.",
+)
+@click.option("--dry-run", is_flag=True, help="Only print the statements.")
+@click.pass_obj
+def partition_db(app, months_ahead, dry_run):
+    """Partition the measurement table by month.
+
+    The first run converts the table, which copies every measurement, later
+    runs add the partitions of the coming months. Run it monthly, e.g. from
+    a cron job. MySQL only, run squash upgrade-db first.
+    """
+    with app.app_context():
+        try:
+            statements = partition(months_ahead, dry_run=dry_run)
+        except RuntimeError as err:
+            raise click.ClickException(str(err))
+
+    verb = "Would execute" if dry_run else "Executed"
+    click.echo(f"{verb} {len(statements)} statements.")
+    for statement in statements:
+        click.echo(f"  {statement}")
+
+
+@main.command("export-matrix")
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option("--dataset", help="Name of the dataset, e.g. HSC.")
+@click.option("--ci-name", help="Name of the CI pipeline that ran the jobs.")
+@click.option("--start", help="Include jobs created at this date or later.")
+@click.option("--end", help="Include jobs created before this date.")
+@click.option(
+    "--metric",
+    multiple=True,
+    help="Full qualified name of a metric to include, by default all.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(list(FORMATS)),
+    help="Output format, by default from the OUTPUT file extension.",
+)
+@click.option(
+    "--batch-size",
+    default=10000,
+    show_default=True,
+    help="Number of measurements fetched at a time.",
+)
+@click.pass_obj
+def export_matrix(
+    app,
+    output,
+    dataset,
+    ci_name,
+    start,
+    end,
+    metric,
+    output_format,
+    batch_size,
+):
+    """Export the jobs by metrics matrix of the measurement values to OUTPUT.
+
+    The matrix has one row per job matching the filter, ordered by time, see
+    squash.matrix.
+    """
+    if output_format is None:
+        output_format = os.path.splitext(output)[1].lstrip(".")
+        if output_format not in FORMATS:
+            raise click.BadParameter(
+                "Unknown file extension, use --format.", param_hint="OUTPUT"
+            )
+
+    query = MatrixQuery(
+        dataset=dataset,
+        ci_name=ci_name,
+        start=parse(start) if start else None,
+        end=parse(end) if end else None,
+        metrics=list(metric) or None,
+        batch_size=batch_size,
+    )
+    with app.app_context():
+        matrix = query.matrix()
+    try:
+        data = encode(matrix, output_format)
+    except RuntimeError as err:
+        raise click.ClickException(str(err))
+
+    with open(output, "wb") as f:
+        f.write(data)
+
+    jobs, metrics = matrix["values"].shape
+    click.echo(f"Exported {jobs} jobs by {metrics} metrics to {output}.")
+
+
+def _invalidate_cache(app):
+    """Invalidate the cached responses of all resources."""
+    for resource in app.config["SQUASH_CACHE_TIMEOUTS"]:
+        cache.invalidate(resource)
+
+
+def _echo_counts(verb, counts):
+    skipped = counts.pop("skipped")
+    click.echo(
+        f"{verb} "
+        + ", ".join(f"{count} {table}" for table, count in counts.items())
+        + f" rows, skipped {skipped} chunks."
+    )
+
+
+@main.command("export")
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(list(DUMP_FORMATS)),
+    default="ndjson",
+    show_default=True,
+    help="Format of the files.",
+)
+@click.option(
+    "--start-id", type=int, help="Export the chunks of jobs from this id."
+)
+@click.option(
+    "--end-id", type=int, help="Export the chunks of jobs before this id."
+)
+@click.option(
+    "--chunk-size",
+    default=1000,
+    show_default=True,
+    help="Number of job ids per chunk.",
+)
+@click.option(
+    "--batch-size",
+    default=10000,
+    show_default=True,
+    help="Number of rows fetched at a time.",
+)
+@click.pass_obj
+def export_command(
+    app, directory, output_format, start_id, end_id, chunk_size, batch_size
+):
+    """Export the database to DIRECTORY.
+
+    Jobs are exported with their packages, measurements and blobs in
+    chunks of job ids, with the envs, metrics and specs. Run again to
+    resume an interrupted export, run several exports of disjoint job id
+    ranges to export in parallel, see squash.transfer.
+    """
+    with app.app_context():
+        try:
+            counts = export_database(
+                directory,
+                output_format,
+                start_id=start_id,
+                end_id=end_id,
+                chunk_size=chunk_size,
+                batch_size=batch_size,
+            )
+        except (RuntimeError, ValueError) as err:
+            raise click.ClickException(str(err))
+
+    _echo_counts("Exported", counts)
+
+
+@main.command("import")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--start-id", type=int, help="Import the chunks of jobs from this id."
+)
+@click.option(
+    "--end-id", type=int, help="Import the chunks of jobs before this id."
+)
+@click.option(
+    "--batch-size",
+    default=10000,
+    show_default=True,
+    help="Number of rows inserted at a time.",
+)
+@click.pass_obj
+def import_command(app, directory, start_id, end_id, batch_size):
+    """Import a database exported to DIRECTORY.
+
+    Chunks of jobs already in the database are skipped, run again to resume
+    an interrupted import. Run squash backfill-change-points afterwards to
+    rebuild the change points.
+    """
+    with app.app_context():
+        try:
+            counts = import_database(
+                directory,
+                start_id=start_id,
+                end_id=end_id,
+                batch_size=batch_size,
+            )
+        except RuntimeError as err:
+            raise click.ClickException(str(err))
+        _invalidate_cache(app)
+
+    _echo_counts("Imported", counts)
+
+
+@main.command("load")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--pattern",
+    default="*.json",
+    show_default=True,
+    help="File name pattern of the job documents.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    help="Number of worker processes.",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    help="Maximum number of measurements inserted per transaction, by "
+    "default set by SQUASH_INGEST_BATCH_SIZE.",
+)
+@click.option(
+    "--etl-dates/--no-etl-dates",
+    default=True,
+    show_default=True,
+    help="Preserve the job dates from the env metadata.",
+)
+@click.option(
+    "--export",
+    type=click.Choice(["deferred", "each", "none"]),
+    default="deferred",
+    show_default=True,
+    help="Export the jobs to InfluxDB in a single task once loaded, in a "
+    "task per job, or not at all.",
+)
+@click.option(
+    "--detect",
+    is_flag=True,
+    help="Rebuild the change points once the jobs are loaded.",
+)
+@click.option(
+    "--dry-run", is_flag=True, help="Only validate the job documents."
+)
+@click.pass_context
+def load(
+    ctx,
+    directory,
+    pattern,
+    workers,
+    batch_size,
+    etl_dates,
+    export,
+    detect,
+    dry_run,
+):
+    """Load the lsst.verify job documents of DIRECTORY into the database.
+
+    The documents are loaded in file name order by a pool of worker
+    processes, with the same code as the jobs posted to the API. Documents
+    that fail to load are reported and skipped.
+    """
+    app = ctx.obj
+    paths = find_documents(directory, pattern)
+
+    if dry_run:
+        invalid = 0
+        with app.app_context():
+            for path in paths:
+                error = validate_document(path)
+                if error is not None:
+                    invalid += 1
+                    click.echo(f"{path}: {error}", err=True)
+        click.echo(f"Validated {len(paths)} documents, {invalid} invalid.")
+        return
+
+    if batch_size is None:
+        batch_size = app.config["SQUASH_INGEST_BATCH_SIZE"]
+    loader = BulkLoader(
+        app,
+        ctx.find_root().params["profile"],
+        workers=workers,
+        batch_size=batch_size,
+        etl_mode=etl_dates,
+    )
+
+    job_ids = []
+    with click.progressbar(length=len(paths), label="Loading jobs") as bar:
+        for path, job_id, error in loader.load(paths):
+            if error is not None:
+                click.echo(f"\n{path}: {error}", err=True)
+            else:
+                job_ids.append(job_id)
+            bar.update(1)
+
+    with app.app_context():
+        _invalidate_cache(app)
+        if detect:
+            counts = backfill()
+            cache.invalidate("change_points")
+            click.echo(
+                "Flagged {change_points} change points in {series} "
+                "series.".format(**counts)
+            )
+
+    click.echo(f"Loaded {len(job_ids)} of {len(paths)} documents.")
+
+    if not job_ids or export == "none":
+        return
+    if export == "each":
+        for job_id in job_ids:
+            job_to_influxdb.delay(job_id)
+        click.echo(f"Enqueued {len(job_ids)} InfluxDB export tasks.")
+    else:
+        task = jobs_to_influxdb.delay(job_ids)
+        click.echo(f"Enqueued the InfluxDB export task {task.id}.")
+
+
+def _parse_policy(ctx, param, value):
+    try:
+        return [RetentionPolicy.from_dict(json.loads(v)) for v in value]
+    except ValueError as err:
+        raise click.BadParameter(str(err))
+
+
+@main.command("purge")
+@click.option(
+    "--policy",
+    "policies",
+    multiple=True,
+    callback=_parse_policy,
+    help="Retention policy as a JSON object, e.g. "
+    '\'{"ci_name": "validate_drp", "keep_days": 365}\', by default '
+    "set by SQUASH_RETENTION_POLICIES. Can be repeated.",
+)
+@click.option(
+    "--job-id",
+    "job_ids",
+    type=int,
+    multiple=True,
+    help="Purge this job instead of the jobs selected by the policies. "
+    "Can be repeated.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only report the jobs the policies would purge.",
+)
+@click.option(
+    "--archive",
+    "archive_dir",
+    type=click.Path(file_okay=False),
+    help="Archive the jobs to this directory before deleting them, by "
+    "default set by SQUASH_RETENTION_ARCHIVE_DIR.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(list(DUMP_FORMATS)),
+    default="ndjson",
+    show_default=True,
+    help="Format of the archive files.",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    help="Number of jobs deleted per transaction, by default set by "
+    "SQUASH_RETENTION_BATCH_SIZE.",
+)
+@click.pass_obj
+def purge_command(
+    app, policies, job_ids, dry_run, archive_dir, output_format, batch_size
+):
+    """Archive and delete the jobs selected by retention policies.
+
+    Jobs are deleted in batches, each in its own transaction. The archive
+    can be loaded back with squash import.
+    """
+    with app.app_context():
+        if not policies and not job_ids:
+            try:
+                policies = [
+                    RetentionPolicy.from_dict(policy)
+                    for policy in app.config["SQUASH_RETENTION_POLICIES"]
+                ]
+            except ValueError as err:
+                raise click.ClickException(str(err))
+            if not policies:
+                raise click.UsageError("No retention policy configured.")
+
+        if job_ids:
+            job_ids = sorted(job_ids)
+        else:
+            job_ids, report = plan(policies)
+            for entry in report:
+                click.echo(
+                    "{policy}: {jobs} jobs, {measurements} measurements "
+                    "from {first_date} to {last_date}.".format(
+                        **entry, policy=json.dumps(entry["policy"])
+                    )
+                )
+
+        if dry_run:
+            click.echo(f"Would purge {len(job_ids)} jobs.")
+            return
+
+        if archive_dir is None:
+            archive_dir = app.config["SQUASH_RETENTION_ARCHIVE_DIR"]
+        if batch_size is None:
+            batch_size = app.config["SQUASH_RETENTION_BATCH_SIZE"]
+
+        with click.progressbar(
+            length=len(job_ids), label="Purging jobs"
+        ) as bar:
+
+            def progress(deleted, total):
+                bar.update(deleted - bar.pos)
+
+            try:
+                counts = purge(
+                    job_ids, batch_size, archive_dir, output_format, progress
+                )
+            except RuntimeError as err:
+                raise click.ClickException(str(err))
+        _invalidate_cache(app)
+
+    archived = counts.pop("archived")
+    click.echo(
+        "Deleted "
+        + ", ".join(f"{count} {table}" for table, count in counts.items())
+        + f" rows, archived {archived} jobs."
+    )
@@ -0,0 +1,205 @@
+"""Implement the comparison of the measurements of two jobs.
+
+The measurements of the base and head jobs are aligned by metric name and
+compared in a vectorized pass: absolute and relative deltas of the values,
+and the changes of the specification status, see `squash.evaluation`. The
+packages that changed are computed with `diff_packages`, also used by the
+code changes of the CI jobs.
+"""
+
+__all__ = ["diff_packages", "align_measurements", "compare_specs"]
+
+import numpy as np
+
+from .evaluation import unit_scale
+
+
+def diff_packages(previous, current):
+    """Return the packages in the current job that changed.
+
+    Notes
+    -----
+    The code changes are computed like this:
+
+    - packages present in the current job but not in the previous one
+    - packages present in both but the git commit sha or the git URL has
+      changed
+
+    Parameters
+    ----------
+    previous : iterable of `tuple`
+        Name, git commit sha and git URL of the packages of the previous
+        job.
+    current : iterable of `tuple`
+        Name, git commit sha and git URL of the packages of the current job.
+
+    Returns
+    -------
+    code_changes : `dict`
+        The packages that changed, sorted by name, and the number of
+        packages that changed.
+    """
+    diff_pkgs = sorted(
+        set(current).difference(previous), key=lambda package: package[0]
+    )
+    return {"packages": diff_pkgs, "counts": len(diff_pkgs)}
+
+
+def _take(names, index, keys, column, fill):
+    """Align a column to a sorted array of keys.
+
+    Parameters
+    ----------
+    names : `numpy.ndarray`
+        Sorted unique names of the rows of the column.
+    index : `numpy.ndarray`
+        Index of the row of each name in the column.
+    keys : `numpy.ndarray`
+        Sorted keys to align to.
+    column : `numpy.ndarray`
+        The column.
+    fill
+        Value of the keys not found in names.
+
+    Returns
+    -------
+    values : `numpy.ndarray`
+        The column values aligned to the keys.
+    found : `numpy.ndarray`
+        `True` for the keys found in names.
+    """
+    values = np.full(len(keys), fill, dtype=column.dtype)
+    position = np.searchsorted(names, keys)
+    found = position < len(names)
+    found[found] &= names[position[found]] == keys[found]
+    values[found] = column[index[position[found]]]
+    return values, found
+
+
+def align_measurements(base, head):
+    """Align the measurements of two jobs by metric name.
+
+    Parameters
+    ----------
+    base : `dict` [`str`, `numpy.ndarray`]
+        ``metrics``, ``values`` and ``units`` of the base job measurements,
+        see `squash.evaluation.load_measurements`.
+    head : `dict` [`str`, `numpy.ndarray`]
+        Same for the head job.
+
+    Returns
+    -------
+    columns : `dict` [`str`, `numpy.ndarray`]
+        One row per metric measured by either job, sorted by name:
+        ``metrics``, ``units`` (of the base measurement if any),
+        ``base_values`` and ``head_values`` (NaN if not measured),
+        ``deltas`` (head - base, in the base unit) and ``relative_deltas``
+        (deltas divided by the absolute base value).
+    """
+    # The first measurement of each metric is kept
+    base_metrics, base_index = np.unique(base["metrics"], return_index=True)
+    head_metrics, head_index = np.unique(head["metrics"], return_index=True)
+    metrics = np.union1d(base_metrics, head_metrics)
+
+    def take(job, names, index, column, fill):
+        return _take(names, index, metrics, job[column], fill)
+
+    base_values, in_base = take(
+        base, base_metrics, base_index, "values", np.nan
+    )
+    head_values, _ = take(head, head_metrics, head_index, "values", np.nan)
+    base_units, _ = take(base, base_metrics, base_index, "units", "")
+    head_units, _ = take(head, head_metrics, head_index, "units", "")
+    units = np.where(in_base, base_units, head_units)
+
+    # Convert the head values to the base units
+    pairs, pair_index = np.unique(
+        np.char.add(np.char.add(head_units, "\x1f"), units),
+        return_inverse=True,
+    )
+    scales = np.array(
+        [unit_scale(*pair.split("\x1f")) for pair in pairs], dtype="f8"
+    )
+    deltas = head_values * scales[pair_index] - base_values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative_deltas = np.where(
+            base_values != 0, deltas / np.abs(base_values), np.nan
+        )
+
+    return {
+        "metrics": metrics,
+        "units": units,
+        "base_values": base_values,
+        "head_values": head_values,
+        "deltas": deltas,
+        "relative_deltas": relative_deltas,
+    }
+
+
+def compare_specs(base, head):
+    """Compare the specification status of two jobs.
+
+    Parameters
+    ----------
+    base : `dict` [`str`, `numpy.ndarray`]
+        Evaluation of the base job, see
+        `squash.evaluation.SpecTable.evaluate`.
+    head : `dict` [`str`, `numpy.ndarray`]
+        Evaluation of the head job.
+
+    Returns
+    -------
+    columns : `dict` [`str`, `numpy.ndarray`]
+        One row per specification whose status changed, sorted by name:
+        ``specs``, ``metrics``, ``base_status`` and ``head_status``
+        (``pass``, ``fail``, ``unknown`` or empty if the specification
+        does not apply to the job), ``base_margins`` and ``head_margins``.
+    summary : `dict`
+        Number of specifications that passed in both jobs, that regressed
+        (passed in the base job and failed in the head job) and that were
+        fixed.
+    """
+    base_specs, base_index = np.unique(base["specs"], return_index=True)
+    head_specs, head_index = np.unique(head["specs"], return_index=True)
+    specs = np.union1d(base_specs, head_specs)
+
+    def take(results, names, index):
+        return [
+            _take(names, index, specs, results[column], fill)[0]
+            for column, fill in [
+                ("status", ""),
+                ("margins", np.nan),
+                ("metrics", ""),
+            ]
+        ]
+
+    base_status, base_margins, base_metrics = take(
+        base, base_specs, base_index
+    )
+    head_status, head_margins, head_metrics = take(
+        head, head_specs, head_index
+    )
+    changed = base_status != head_status
+
+    summary = {
+        "passed": int(
+            ((base_status == "pass") & (head_status == "pass")).sum()
+        ),
+        "regressions": int(
+            ((base_status == "pass") & (head_status == "fail")).sum()
+        ),
+        "fixes": int(
+            ((base_status == "fail") & (head_status == "pass")).sum()
+        ),
+    }
+    columns = {
+        "specs": specs[changed],
+        "metrics": np.where(base_status != "", base_metrics, head_metrics)[
+            changed
+        ],
+        "base_status": base_status[changed],
+        "head_status": head_status[changed],
+        "base_margins": base_margins[changed],
+        "head_margins": head_margins[changed],
+    }
+    return columns, summary
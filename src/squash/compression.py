@@ -0,0 +1,234 @@
+"""Implement compressed request and response bodies.
+
+Clients may upload ``gzip`` or ``zstd`` compressed request bodies by setting
+the ``Content-Encoding`` header. Bodies are decompressed while they are read
+by the request parser, up to a configurable decompressed size.
+
+Large ``GET`` responses are compressed according to the ``Accept-Encoding``
+header of the request.
+"""
+
+__all__ = ["Compression", "DecompressionMiddleware", "compression"]
+
+import gzip
+import zlib
+
+from flask import current_app, request
+from werkzeug.exceptions import (
+    BadRequest,
+    RequestEntityTooLarge,
+    UnsupportedMediaType,
+)
+from werkzeug.wsgi import get_input_stream
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+
+class DecompressingReader:
+    """File-like object that decompresses a stream while it is read.
+
+    Parameters
+    ----------
+    reader : file-like
+        A reader that returns the decompressed data.
+    max_size : `int`
+        Maximum size in bytes of the decompressed data.
+    """
+
+    def __init__(self, reader, max_size):
+        self._reader = reader
+        self._max_size = max_size
+        self._size = 0
+
+    def read(self, size=-1):
+        """Read and decompress up to ``size`` bytes."""
+        if size is None or size < 0:
+            # Read one byte past the limit to detect larger bodies
+            size = self._max_size - self._size + 1
+        try:
+            data = self._reader.read(size)
+        except DECOMPRESSION_ERRORS as err:
+            raise BadRequest(f"Could not decompress the request body. {err}")
+
+        self._size += len(data)
+        if self._size > self._max_size:
+            raise RequestEntityTooLarge(
+                "The decompressed request body exceeds "
+                f"{self._max_size} bytes."
+            )
+        return data
+
+    def readline(self, size=-1):
+        """Read a line, required by the WSGI input stream interface."""
+        chunks = []
+        while True:
+            chunk = self.read(1)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk == b"\n" or len(chunks) == size:
+                break
+        return b"".join(chunks)
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+def gzip_reader(stream):
+    """Return a reader that decompresses a gzip stream."""
+    return gzip.GzipFile(fileobj=stream, mode="rb")
+
+
+def zstd_reader(stream):
+    """Return a reader that decompresses a zstd stream."""
+    return zstandard.ZstdDecompressor().stream_reader(stream)
+
+
+def supported_encodings():
+    """Return the supported content encodings and their readers."""
+    encodings = {"gzip": gzip_reader}
+    if zstandard is not None:
+        encodings["zstd"] = zstd_reader
+    return encodings
+
+
+class DecompressionMiddleware:
+    """WSGI middleware that decompresses the request body.
+
+    The request body is replaced by a stream that decompresses it while it
+    is read, so the compressed payload is never held in memory.
+
+    Parameters
+    ----------
+    wsgi_app : `callable`
+        The wrapped WSGI application.
+    max_size : `int`
+        Maximum size in bytes of the decompressed request body.
+    """
+
+    def __init__(self, wsgi_app, max_size):
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        """Replace the input stream if the request body is compressed."""
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+
+        if encoding in ("", "identity"):
+            return self.wsgi_app(environ, start_response)
+
+        encodings = supported_encodings()
+        if encoding not in encodings:
+            error = UnsupportedMediaType(
+                f"Unsupported Content-Encoding `{encoding}`, use one of "
+                f"{', '.join(encodings)}."
+            )
+            return error(environ, start_response)
+
+        stream = get_input_stream(environ)
+        environ["wsgi.input"] = DecompressingReader(
+            encodings[encoding](stream), self.max_size
+        )
+        # The decompressed length is unknown, read the stream until the end
+        environ["wsgi.input_terminated"] = True
+        environ.pop("CONTENT_LENGTH", None)
+        del environ["HTTP_CONTENT_ENCODING"]
+
+        return self.wsgi_app(environ, start_response)
+
+
+class Compression:
+    """Compress request and response bodies.
+
+    Follows the Flask extension pattern, create the `Compression` object
+    once and call `init_app` for each app instance.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure request decompression and response compression."""
+        app.config.setdefault("SQUASH_MAX_DECOMPRESSED_SIZE", 2 * 1024**3)
+        app.config.setdefault("SQUASH_COMPRESS_MIN_SIZE", 4096)
+        app.config.setdefault("SQUASH_COMPRESS_LEVEL", 6)
+
+        app.wsgi_app = DecompressionMiddleware(
+            app.wsgi_app, app.config["SQUASH_MAX_DECOMPRESSED_SIZE"]
+        )
+        app.after_request(self.compress)
+
+    @staticmethod
+    def select_encoding():
+        """Select the response encoding from the Accept-Encoding header.
+
+        Returns
+        -------
+        encoding : `str` or `None`
+            ``zstd``, ``gzip`` or `None` if the client does not accept
+            any of them.
+        """
+        accept = request.accept_encodings
+        if zstandard is not None and accept["zstd"]:
+            return "zstd"
+        if accept["gzip"]:
+            return "gzip"
+        return None
+
+    def compress(self, response):
+        """Compress a response body if the client accepts it.
+
+        Responses smaller than ``SQUASH_COMPRESS_MIN_SIZE`` bytes are not
+        compressed.
+
+        Parameters
+        ----------
+        response : `flask.Response`
+            The response object.
+
+        Returns
+        -------
+        response : `flask.Response`
+            The response object with the body compressed, if applicable.
+        """
+        if (
+            request.method != "GET"
+            or response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        data = response.get_data()
+        if len(data) < current_app.config["SQUASH_COMPRESS_MIN_SIZE"]:
+            return response
+
+        level = current_app.config["SQUASH_COMPRESS_LEVEL"]
+        encoding = self.select_encoding()
+        if encoding == "zstd":
+            data = zstandard.ZstdCompressor(level=min(level, 19)).compress(
+                data
+            )
+        elif encoding == "gzip":
+            data = gzip.compress(data, compresslevel=min(level, 9))
+        else:
+            return response
+
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+# Initialize extension
+compression = Compression()
@@ -5,10 +5,32 @@ See http://flask.pocoo.org/docs/0.12/config/#configuration-best-practices
 
 __all__ = ["Config"]
 
+import json
 import os
+import tempfile
 from datetime import timedelta
 
 
+def _engine_options():
+    """Return the options of the database connection pools.
+
+    Connections are checked before they are used and recycled before the
+    cloudsql-proxy closes idle connections. A request waits up to
+    ``SQUASH_DB_POOL_TIMEOUT`` seconds for a connection once
+    ``SQUASH_DB_POOL_SIZE`` + ``SQUASH_DB_MAX_OVERFLOW`` connections are in
+    use.
+    """
+    return {
+        "pool_size": int(os.environ.get("SQUASH_DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("SQUASH_DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("SQUASH_DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("SQUASH_DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": bool(
+            int(os.environ.get("SQUASH_DB_POOL_PRE_PING", 1))
+        ),
+    }
+
+
 class Config(object):
     """Base class configuration."""
 
@@ -26,6 +48,30 @@ class Config(object):
         ),
     )
 
+    # Connection pool of each uwsgi worker or Celery worker process, and of
+    # each read replica, see _engine_options
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options()
+
+    # Read replicas of the database, comma separated database URIs. The
+    # reads of the GET requests are routed to the binds of
+    # SQUASH_DB_READ_BINDS, see squash.routing. After a write, the reads of
+    # the client are routed to the primary for SQUASH_DB_STICKY_SECONDS. A
+    # failed replica is not used for SQUASH_DB_REPLICA_RETRY seconds.
+    SQUASH_DB_REPLICAS = [
+        uri
+        for uri in os.environ.get("SQUASH_DB_REPLICAS", "").split(",")
+        if uri
+    ]
+    SQLALCHEMY_BINDS = {
+        f"replica{i}": {"url": uri, **_engine_options()}
+        for i, uri in enumerate(SQUASH_DB_REPLICAS)
+    }
+    SQUASH_DB_READ_BINDS = list(SQLALCHEMY_BINDS)
+    SQUASH_DB_STICKY_SECONDS = int(
+        os.environ.get("SQUASH_DB_STICKY_SECONDS", 10)
+    )
+    SQUASH_DB_REPLICA_RETRY = 30
+
     # Default API user credentials
     DEFAULT_USER = os.environ.get("SQUASH_DEFAULT_USER", "mole")
     DEFAULT_PASSWORD = os.environ.get("SQUASH_DEFAULT_PASSWORD", "desert")
@@ -40,9 +86,174 @@ class Config(object):
     INFLUXDB_USERNAME = os.environ.get("INFLUXDB_USERNAME")
     INFLUXDB_PASSWORD = os.environ.get("INFLUXDB_PASSWORD")
 
+    # Maximum number of lines per InfluxDB write request
+    INFLUXDB_BATCH_SIZE = int(os.environ.get("INFLUXDB_BATCH_SIZE", 5000))
+    # Retries of InfluxDB writes that failed with a connection error or a
+    # server error, with exponential backoff starting at 0.5 seconds
+    INFLUXDB_MAX_RETRIES = int(os.environ.get("INFLUXDB_MAX_RETRIES", 3))
+    INFLUXDB_RETRY_BACKOFF = 0.5
+
     # SQuaSH API URL
     SQUASH_API_URL = os.environ.get("SQUASH_API_URL", "http://127.0.0.1:5000")
 
+    # Response cache shared among the uwsgi workers, by default use the
+    # same Redis instance used by Celery
+    SQUASH_CACHE_TYPE = os.environ.get("SQUASH_CACHE_TYPE", "redis")
+    SQUASH_CACHE_REDIS_URL = os.environ.get(
+        "SQUASH_CACHE_REDIS_URL",
+        os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379"),
+    )
+    SQUASH_CACHE_KEY_PREFIX = "squash-api"
+    # Maximum size in bytes of a cached response
+    SQUASH_CACHE_MAX_ENTRY_SIZE = int(
+        os.environ.get("SQUASH_CACHE_MAX_ENTRY_SIZE", 4 * 1024**2)
+    )
+    # Time to live in seconds of the cached responses for each resource,
+    # entries are also invalidated when the resource is modified
+    SQUASH_CACHE_DEFAULT_TIMEOUT = 300
+    SQUASH_CACHE_TIMEOUTS = {
+        "job": 24 * 3600,
+        "jobs": 300,
+        "jenkins": 3600,
+        "measurement": 24 * 3600,
+        "metric": 3600,
+        "metrics": 3600,
+        "spec": 3600,
+        "specs": 3600,
+        "datasets": 300,
+        "packages": 3600,
+        "code_changes": 3600,
+        "series": 300,
+        "evaluation": 3600,
+        "change_points": 300,
+        "compare": 3600,
+        "package_history": 3600,
+    }
+
+    # Maximum size in bytes of a decompressed request body, clients can
+    # upload gzip or zstd compressed bodies using the Content-Encoding header
+    SQUASH_MAX_DECOMPRESSED_SIZE = int(
+        os.environ.get("SQUASH_MAX_DECOMPRESSED_SIZE", 2 * 1024**3)
+    )
+    # GET responses larger than this size in bytes are compressed if the
+    # client accepts it
+    SQUASH_COMPRESS_MIN_SIZE = 4096
+    SQUASH_COMPRESS_LEVEL = 6
+
+    # Directory where uploaded job documents are spooled before they are
+    # loaded, by default the system temporary directory
+    SQUASH_SPOOL_DIR = os.environ.get("SQUASH_SPOOL_DIR")
+    # Maximum number of measurements or blobs inserted per transaction
+    SQUASH_INGEST_BATCH_SIZE = int(
+        os.environ.get("SQUASH_INGEST_BATCH_SIZE", 1000)
+    )
+
+    # Load uploaded jobs in a Celery task instead of during the request,
+    # can be overridden with the `async` query parameter of POST /job
+    SQUASH_INGEST_ASYNC = bool(int(os.environ.get("SQUASH_INGEST_ASYNC", 0)))
+    # Location where job documents are staged before they are ingested by
+    # the Celery workers, a file:// URL of a directory shared with the
+    # workers or a s3:// URL of a bucket and prefix
+    SQUASH_STAGING_URL = os.environ.get(
+        "SQUASH_STAGING_URL",
+        "file://{}".format(
+            os.path.join(tempfile.gettempdir(), "squash-staging")
+        ),
+    )
+
+    # Evaluate the measurements of uploaded jobs against the metric
+    # specifications and report the failures, can be overridden with the
+    # `evaluate` query parameter of POST /job
+    SQUASH_INGEST_EVALUATE = bool(
+        int(os.environ.get("SQUASH_INGEST_EVALUATE", 0))
+    )
+    # The specifications are compiled once per process and reloaded when
+    # they are modified or at the latest after this time in seconds
+    SQUASH_EVALUATION_SPECS_TTL = 300
+    # Maximum number of jobs evaluated per request
+    SQUASH_EVALUATION_MAX_JOBS = 100
+
+    # Flag change points in the metric time series when jobs are ingested,
+    # see squash.detection. A CUSUM statistic of the standardized values
+    # above SQUASH_DETECTION_THRESHOLD flags a change point, values within
+    # SQUASH_DETECTION_DRIFT standard deviations of the mean do not
+    # accumulate. Series need SQUASH_DETECTION_MIN_COUNT values first, at
+    # least 2.
+    SQUASH_DETECTION = bool(int(os.environ.get("SQUASH_DETECTION", 1)))
+    SQUASH_DETECTION_THRESHOLD = float(
+        os.environ.get("SQUASH_DETECTION_THRESHOLD", 5.0)
+    )
+    SQUASH_DETECTION_DRIFT = float(
+        os.environ.get("SQUASH_DETECTION_DRIFT", 0.5)
+    )
+    SQUASH_DETECTION_MIN_COUNT = int(
+        os.environ.get("SQUASH_DETECTION_MIN_COUNT", 10)
+    )
+
+    # Maximum number of runs of a CI pipeline in the range of
+    # GET /code_changes
+    SQUASH_CODE_CHANGES_MAX_RUNS = 1000
+
+    # Number of points of the downsampled metric time series, if not set in
+    # the request
+    SQUASH_SERIES_DEFAULT_POINTS = 1000
+
+    # Maximum number of jobs, i.e. of rows, of the matrix returned by
+    # GET /matrix, larger matrices are exported with the squash CLI
+    SQUASH_MATRIX_MAX_JOBS = int(
+        os.environ.get("SQUASH_MATRIX_MAX_JOBS", 10000)
+    )
+
+    # Retention policies of the jobs, a JSON list of objects with optional
+    # env_name, ci_name and dataset keys and the keep_days or keep_runs
+    # to keep, see squash.retention. Purged jobs are archived to
+    # SQUASH_RETENTION_ARCHIVE_DIR if set, and deleted in batches of
+    # SQUASH_RETENTION_BATCH_SIZE jobs per transaction.
+    SQUASH_RETENTION_POLICIES = json.loads(
+        os.environ.get("SQUASH_RETENTION_POLICIES", "[]")
+    )
+    SQUASH_RETENTION_ARCHIVE_DIR = os.environ.get(
+        "SQUASH_RETENTION_ARCHIVE_DIR"
+    )
+    SQUASH_RETENTION_BATCH_SIZE = int(
+        os.environ.get("SQUASH_RETENTION_BATCH_SIZE", 100)
+    )
+
+    # Log the SQL statements of the requests that execute more statements,
+    # or spend more time in seconds executing them, than these budgets.
+    # Set to 0 to disable
+    SQUASH_SQL_MAX_STATEMENTS = int(
+        os.environ.get("SQUASH_SQL_MAX_STATEMENTS", 50)
+    )
+    SQUASH_SQL_MAX_DURATION = float(
+        os.environ.get("SQUASH_SQL_MAX_DURATION", 1.0)
+    )
+    # Budgets (max statements, max duration) of the requests whose number
+    # of statements grows with the size of the request body
+    SQUASH_SQL_BUDGETS = {
+        "POST job": (0, 60.0),
+        "POST metrics": (0, 10.0),
+        "POST specs": (0, 10.0),
+    }
+    # Number of slowest statements of a request logged when it exceeds its
+    # budget, only these are kept during the request
+    SQUASH_SQL_LOG_SLOWEST = int(os.environ.get("SQUASH_SQL_LOG_SLOWEST", 10))
+
+    # Let the admin user profile requests with the `profile` query parameter
+    # or the X-Squash-Profile header, see squash.profiling
+    SQUASH_PROFILING = bool(int(os.environ.get("SQUASH_PROFILING", 0)))
+    # Directory where profiles are saved, if not set profiles are returned
+    # in place of the response body
+    SQUASH_PROFILE_DIR = os.environ.get("SQUASH_PROFILE_DIR")
+    # Sampling interval in seconds of the `sample` profiler
+    SQUASH_PROFILE_INTERVAL = 0.005
+    # Number of functions listed in `cprofile` profiles returned inline
+    SQUASH_PROFILE_INLINE_LIMIT = 50
+
+    # Exporter of the trace spans, `null` to disable tracing, `console` or
+    # a file:// URL, see squash.tracing
+    SQUASH_TRACING_EXPORTER = os.environ.get("SQUASH_TRACING_EXPORTER", "null")
+
     # Turn off the Flask-SQLAlchemy event system
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
@@ -91,3 +302,6 @@ class Testing(Config):
     TESTING = True
 
     SQLALCHEMY_ECHO = True
+
+    # Use a process local cache for testing
+    SQUASH_CACHE_TYPE = "simple"
@@ -7,19 +7,30 @@ from functools import wraps
 
 from flask import current_app as app
 
+from .instrumentation import STAGE_DURATION
+from .tracing import start_span
+
 
 def time_this(func):
-    """Time function or method execution."""
+    """Time function or method execution.
+
+    The execution time is logged and recorded in the
+    ``squash_stage_duration_seconds`` metric, labeled with the function
+    qualified name. The execution is also traced as a span if tracing is
+    enabled.
+    """
 
     @wraps(func)
-    def wrapper(*args):
-        start = time.time()
-        result = func(*args)
-        end = time.time()
-        app.logger.debug(
-            "Time for {}: {:.4f}s".format(func.__name__, end - start)
-        )
-
-        return result
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with start_span(func.__name__):
+                return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_DURATION.labels(stage=func.__qualname__).observe(elapsed)
+            app.logger.debug(
+                "Time for {}: {:.4f}s".format(func.__name__, elapsed)
+            )
 
     return wrapper
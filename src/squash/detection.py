@@ -0,0 +1,259 @@
+"""Implement the detection of change points in the metric time series.
+
+A series is the measurements of a metric for a dataset and a CI pipeline,
+ordered by job. Each series keeps a compact state in the ``series_state``
+table: the Welford running mean and variance of the values since the last
+change point, and the two-sided CUSUM statistics of the standardized
+values::
+
+    z = (value - mean) / std
+    cusum_pos = max(0, cusum_pos + z - drift)
+    cusum_neg = max(0, cusum_neg - z - drift)
+
+A change point is flagged when a statistic exceeds the threshold, once the
+series has at least ``min_count`` values. The series statistics then restart
+from the flagged value, the new level becomes the reference. Each new
+measurement updates the state in constant time, the history is read only to
+build the initial state with `backfill`.
+"""
+
+__all__ = ["Detector", "detect_job", "backfill"]
+
+import math
+
+from flask import current_app
+
+from .models import (
+    ChangePointModel,
+    JobModel,
+    MeasurementModel,
+    SeriesStateModel,
+    db,
+)
+
+
+class Detector:
+    """Update the series states and flag change points.
+
+    Parameters
+    ----------
+    drift : `float`
+        Allowed drift of the standardized values before they accumulate in
+        the CUSUM statistics, in standard deviations.
+    threshold : `float`
+        A change point is flagged when a CUSUM statistic exceeds this value.
+    min_count : `int`
+        Minimum number of values in the series before change points are
+        flagged, at least 2 to estimate the standard deviation.
+    """
+
+    def __init__(self, drift=0.5, threshold=5.0, min_count=10):
+        if min_count < 2:
+            raise ValueError("min_count must be at least 2.")
+        self.drift = drift
+        self.threshold = threshold
+        self.min_count = min_count
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a detector from the app configuration."""
+        return cls(
+            config["SQUASH_DETECTION_DRIFT"],
+            config["SQUASH_DETECTION_THRESHOLD"],
+            config["SQUASH_DETECTION_MIN_COUNT"],
+        )
+
+    def update(self, state, value):
+        """Update a series state with a new value.
+
+        Parameters
+        ----------
+        state : `squash.models.SeriesStateModel`
+            The series state, updated in place.
+        value : `float`
+            The new value.
+
+        Returns
+        -------
+        change : `dict` or `None`
+            ``direction``, ``statistic``, ``mean`` and ``std`` if the value
+            is a change point, where mean and std are the statistics of the
+            series before the change point, otherwise `None`.
+        """
+        change = None
+        if state.count >= self.min_count:
+            std = math.sqrt(state.m2 / (state.count - 1))
+            # In a constant series any different value is a shift
+            std = max(std, 1e-12 * max(abs(state.mean), 1.0))
+            z = (value - state.mean) / std
+            state.cusum_pos = max(0.0, state.cusum_pos + z - self.drift)
+            state.cusum_neg = max(0.0, state.cusum_neg - z - self.drift)
+            if state.cusum_pos > self.threshold:
+                change = {"direction": "up", "statistic": state.cusum_pos}
+            elif state.cusum_neg > self.threshold:
+                change = {"direction": "down", "statistic": state.cusum_neg}
+
+        if change is not None:
+            change.update(mean=state.mean, std=std)
+            state.count, state.mean, state.m2 = 0, 0.0, 0.0
+            state.cusum_pos, state.cusum_neg = 0.0, 0.0
+
+        state.count += 1
+        delta = value - state.mean
+        state.mean += delta / state.count
+        state.m2 += delta * (value - state.mean)
+        return change
+
+
+def _series_key(ci_dataset, ci_name):
+    """Return the dataset and CI pipeline of a series, empty if unknown."""
+    return ci_dataset or "", ci_name or ""
+
+
+def detect_job(job_id):
+    """Update the states of the series of a job and flag change points.
+
+    Must be called within the app context, after the job measurements are
+    committed.
+
+    Parameters
+    ----------
+    job_id : `int`
+        ID of the job.
+
+    Returns
+    -------
+    change_points : `list` [`squash.models.ChangePointModel`]
+        The change points flagged for the job.
+    """
+    detector = Detector.from_config(current_app.config)
+
+    ci_dataset, env = (
+        db.session.query(JobModel.ci_dataset, JobModel.env)
+        .filter(JobModel.id == job_id)
+        .one()
+    )
+    dataset, ci_name = _series_key(ci_dataset, (env or {}).get("ci_name"))
+
+    values = {
+        metric_id: value
+        for metric_id, value in db.session.query(
+            MeasurementModel.metric_id, MeasurementModel.value
+        ).filter(MeasurementModel.job_id == job_id)
+        if value is not None and math.isfinite(value)
+    }
+    if not values:
+        return []
+
+    # Lock the states, concurrent ingests of the same series are serialized
+    states = {
+        state.metric_id: state
+        for state in SeriesStateModel.query.filter(
+            SeriesStateModel.metric_id.in_(values),
+            SeriesStateModel.dataset == dataset,
+            SeriesStateModel.ci_name == ci_name,
+        ).with_for_update()
+    }
+
+    change_points = []
+    for metric_id, value in values.items():
+        state = states.get(metric_id)
+        if state is None:
+            state = SeriesStateModel(metric_id, dataset, ci_name)
+            db.session.add(state)
+        elif state.last_job_id >= job_id:
+            # The job was already processed, e.g. by a backfill
+            continue
+
+        change = detector.update(state, value)
+        state.last_job_id = job_id
+        if change is not None:
+            change_points.append(
+                ChangePointModel(
+                    job_id, metric_id, dataset, ci_name, value, **change
+                )
+            )
+
+    db.session.add_all(change_points)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return change_points
+
+
+def backfill(metric_id=None, batch_size=10000):
+    """Build the series states from the existing measurements.
+
+    Existing states and change points are replaced. The measurements are
+    read in a single pass ordered by job creation date.
+
+    Parameters
+    ----------
+    metric_id : `int`, optional
+        Build only the series of this metric.
+    batch_size : `int`
+        Number of rows fetched at a time.
+
+    Returns
+    -------
+    counts : `dict`
+        Number of measurements read, series and change points created.
+    """
+    detector = Detector.from_config(current_app.config)
+
+    query = (
+        db.session.query(
+            MeasurementModel.metric_id,
+            JobModel.ci_dataset,
+            JobModel.env["ci_name"].as_string(),
+            MeasurementModel.job_id,
+            MeasurementModel.value,
+        )
+        .join(JobModel, MeasurementModel.job_id == JobModel.id)
+        .filter(MeasurementModel.value.isnot(None))
+        .order_by(JobModel.date_created, JobModel.id)
+    )
+    states = SeriesStateModel.query
+    change_points = ChangePointModel.query
+    if metric_id is not None:
+        query = query.filter(MeasurementModel.metric_id == metric_id)
+        states = states.filter(SeriesStateModel.metric_id == metric_id)
+        change_points = change_points.filter(
+            ChangePointModel.metric_id == metric_id
+        )
+    states.delete(synchronize_session=False)
+    change_points.delete(synchronize_session=False)
+
+    series = {}
+    changes = []
+    count = 0
+    for metric, ci_dataset, ci_name, job_id, value in query.yield_per(
+        batch_size
+    ):
+        if not math.isfinite(value):
+            continue
+        count += 1
+        key = (metric, *_series_key(ci_dataset, ci_name))
+        state = series.get(key)
+        if state is None:
+            state = series[key] = SeriesStateModel(*key)
+        change = detector.update(state, value)
+        state.last_job_id = max(state.last_job_id, job_id)
+        if change is not None:
+            changes.append(ChangePointModel(job_id, *key, value, **change))
+
+    try:
+        db.session.add_all(series.values())
+        db.session.add_all(changes)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        "measurements": count,
+        "series": len(series),
+        "change_points": len(changes),
+    }
@@ -0,0 +1,206 @@
+"""Implement downsampling of metric time series.
+
+Long metric histories are reduced to a bounded number of points before they
+are returned to the client:
+
+``lttb``
+    Largest-Triangle-Three-Buckets, selects the points that best preserve
+    the visual shape of the series.
+``minmax``
+    Selects the minimum and the maximum values in each bucket of points,
+    preserves the extreme values.
+``aggregate``
+    Mean, median, minimum, maximum and count of the values in time buckets
+    of equal duration.
+
+The series columns are those returned by `squash.series.SeriesQuery.columns`,
+missing (NaN) values are ignored.
+"""
+
+__all__ = ["METHODS", "lttb", "minmax", "aggregate", "downsample"]
+
+import numpy as np
+
+METHODS = ("lttb", "minmax", "aggregate")
+
+
+def lttb(x, y, n):
+    """Select points with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are always selected, the other points are
+    divided into ``n - 2`` buckets and from each bucket the point that
+    forms the largest triangle with the previously selected point and the
+    average of the next bucket is selected.
+
+    Parameters
+    ----------
+    x : `numpy.ndarray`
+        Sorted x coordinates, e.g. timestamps.
+    y : `numpy.ndarray`
+        Values.
+    n : `int`
+        Number of points to select.
+
+    Returns
+    -------
+    indices : `numpy.ndarray`
+        Indices of the selected points, sorted.
+    """
+    size = len(x)
+    if n >= size:
+        return np.arange(size)
+    if n < 3:
+        return np.array([0, size - 1][:n], dtype=int)
+
+    x = np.asarray(x, dtype="f8")
+    y = np.asarray(y, dtype="f8")
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    # The next bucket of the last bucket is the last point
+    edges = np.append(edges, size)
+
+    indices = np.empty(n, dtype=int)
+    indices[0], indices[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        start, end, next_end = edges[i], edges[i + 1], edges[i + 2]
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax(x, y, n):
+    """Select the minimum and maximum values in buckets of points.
+
+    Parameters
+    ----------
+    x : `numpy.ndarray`
+        Sorted x coordinates, e.g. timestamps.
+    y : `numpy.ndarray`
+        Values.
+    n : `int`
+        Maximum number of points to select, the points are divided into
+        ``n // 2`` buckets. Below 2 points, the points are selected with
+        `lttb`.
+
+    Returns
+    -------
+    indices : `numpy.ndarray`
+        Indices of the selected points, sorted.
+    """
+    size = len(x)
+    if n >= size:
+        return np.arange(size)
+    if n < 2:
+        # A bucket has a minimum and a maximum
+        return lttb(x, y, n)
+
+    buckets = n // 2
+    bucket = np.arange(size) * buckets // size
+    # Sort by bucket, then by value
+    order = np.lexsort((y, bucket))
+    counts = np.bincount(bucket, minlength=buckets)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    return np.unique(np.concatenate([order[starts], order[ends - 1]]))
+
+
+def aggregate(timestamps, values, n):
+    """Aggregate the values in time buckets of equal duration.
+
+    Parameters
+    ----------
+    timestamps : `numpy.ndarray`
+        Sorted timestamps, datetime64[s].
+    values : `numpy.ndarray`
+        Values, NaN values are ignored.
+    n : `int`
+        Maximum number of buckets.
+
+    Returns
+    -------
+    columns : `dict` [`str`, `numpy.ndarray`]
+        ``timestamps`` (start of the bucket), ``mean``, ``median``,
+        ``min``, ``max`` and ``count`` of the non-empty buckets.
+    """
+    valid = ~np.isnan(values)
+    seconds = timestamps[valid].astype("i8")
+    values = values[valid]
+    if not len(values):
+        empty = np.array([], dtype="f8")
+        return {
+            "timestamps": np.array([], dtype="datetime64[s]"),
+            "mean": empty,
+            "median": empty,
+            "min": empty,
+            "max": empty,
+            "count": np.array([], dtype="i8"),
+        }
+
+    t0 = seconds[0]
+    width = max(-(-(seconds[-1] - t0 + 1) // n), 1)
+    bucket = (seconds - t0) // width
+
+    counts = np.bincount(bucket)
+    sums = np.bincount(bucket, weights=values)
+    nonempty = counts > 0
+    counts, sums = counts[nonempty], sums[nonempty]
+
+    # Values sorted within each bucket
+    order = np.lexsort((values, bucket))
+    sorted_values = values[order]
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    median = (
+        sorted_values[starts + (counts - 1) // 2]
+        + sorted_values[starts + counts // 2]
+    ) / 2
+
+    return {
+        "timestamps": (t0 + np.flatnonzero(nonempty) * width).astype(
+            "datetime64[s]"
+        ),
+        "mean": sums / counts,
+        "median": median,
+        "min": sorted_values[starts],
+        "max": sorted_values[ends - 1],
+        "count": counts,
+    }
+
+
+def downsample(columns, method, points):
+    """Downsample a metric time series.
+
+    Parameters
+    ----------
+    columns : `dict` [`str`, `numpy.ndarray`]
+        Series columns with at least ``timestamps`` and ``values``.
+    method : `str`
+        One of ``lttb``, ``minmax`` or ``aggregate``.
+    points : `int`
+        Maximum number of points returned.
+
+    Returns
+    -------
+    columns : `dict` [`str`, `numpy.ndarray`]
+        For ``lttb`` and ``minmax`` the selected rows of the series, without
+        missing values. For ``aggregate`` the aggregated columns, see
+        `aggregate`.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Method must be one of {', '.join(METHODS)}.")
+
+    timestamps, values = columns["timestamps"], columns["values"]
+    if method == "aggregate":
+        return aggregate(timestamps, values, points)
+
+    valid = np.flatnonzero(~np.isnan(values))
+    x = timestamps[valid].astype("i8")
+    select = lttb if method == "lttb" else minmax
+    rows = valid[select(x, values[valid], points)]
+    return {name: column[rows] for name, column in columns.items()}
@@ -0,0 +1,392 @@
+"""Implement the evaluation of measurements against metric specifications.
+
+A specification applies to the measurements of its metric in the jobs whose
+metadata match its ``metadata_query``: every key of the query must be in the
+job metadata with the same value, the value ``any`` matches any value.
+
+The specifications are compiled once per process into a `SpecTable` of
+parallel arrays sorted by metric. A set of jobs is then evaluated in a
+single vectorized pass: the measurements are paired with the specifications
+of their metric, the pairs that do not apply to the job are dropped, and the
+values are compared to the thresholds per operator. The compiled table is
+reloaded when the specifications are modified, see `get_spec_table`.
+"""
+
+__all__ = [
+    "OPERATORS",
+    "SpecTable",
+    "get_spec_table",
+    "load_measurements",
+    "evaluate_jobs",
+    "summarize",
+    "unit_scale",
+]
+
+import json
+import time
+
+import numpy as np
+from flask import current_app
+
+from .cache import cache
+from .models import (
+    JobModel,
+    MeasurementModel,
+    MetricModel,
+    SpecificationModel,
+    db,
+)
+
+# Threshold operators, in the order of their codes in the SpecTable
+OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+# Scale of the units to a reference unit of their physical type, units of
+# different types or not listed here are not comparable
+UNITS = {
+    "": ("dimensionless", 1.0),
+    "%": ("dimensionless", 0.01),
+    "mag": ("magnitude", 1.0),
+    "mmag": ("magnitude", 1e-3),
+    "deg": ("angle", 3600.0),
+    "arcmin": ("angle", 60.0),
+    "arcsec": ("angle", 1.0),
+    "marcsec": ("angle", 1e-3),
+    "mas": ("angle", 1e-3),
+    "s": ("time", 1.0),
+    "ms": ("time", 1e-3),
+    "min": ("time", 60.0),
+    "pix": ("pixel", 1.0),
+}
+
+
+def unit_scale(unit, to_unit):
+    """Return the factor that converts values from a unit to another.
+
+    Returns
+    -------
+    scale : `float`
+        The conversion factor, NaN if the units are not comparable.
+    """
+    unit, to_unit = unit or "", to_unit or ""
+    if unit == to_unit:
+        return 1.0
+    if unit not in UNITS or to_unit not in UNITS:
+        return np.nan
+    kind, scale = UNITS[unit]
+    to_kind, to_scale = UNITS[to_unit]
+    if kind != to_kind:
+        return np.nan
+    return scale / to_scale
+
+
+def match_query(query, meta):
+    """Return `True` if a metadata query matches the job metadata."""
+    for key, value in query.items():
+        if key not in meta:
+            return False
+        if value != "any" and meta[key] != value:
+            return False
+    return True
+
+
+class SpecTable:
+    """Threshold specifications compiled into parallel arrays.
+
+    Specifications without a valid threshold, e.g. with an unknown operator
+    or a non numeric value, are skipped.
+
+    Parameters
+    ----------
+    specs : iterable of `tuple`
+        ``(name, metric_id, metric_name, threshold, metadata_query)`` of
+        each specification.
+    """
+
+    def __init__(self, specs):
+        operators = list(OPERATORS)
+        # Distinct metadata queries, most specifications share a few
+        queries = {}
+        rows = []
+        for name, metric_id, metric_name, threshold, query in specs:
+            threshold = threshold or {}
+            operator = threshold.get("operator")
+            value = threshold.get("value")
+            if operator not in OPERATORS or not isinstance(
+                value, (int, float)
+            ):
+                continue
+            query = query or {}
+            key = json.dumps(query, sort_keys=True)
+            query_id = queries.setdefault(key, len(queries))
+            rows.append(
+                (
+                    metric_id,
+                    name,
+                    metric_name,
+                    float(value),
+                    threshold.get("unit") or "",
+                    operators.index(operator),
+                    query_id,
+                )
+            )
+        rows.sort(key=lambda row: row[0])
+
+        self.queries = [json.loads(key) for key in queries]
+        columns = list(zip(*rows)) if rows else [[]] * 7
+        self.metric_ids = np.array(columns[0], dtype="i8")
+        self.names = np.array(columns[1], dtype="U")
+        self.metric_names = np.array(columns[2], dtype="U")
+        self.thresholds = np.array(columns[3], dtype="f8")
+        self.units = np.array(columns[4], dtype="U")
+        self.operators = np.array(columns[5], dtype="i1")
+        self.query_ids = np.array(columns[6], dtype="i8")
+
+    def match(self, metas):
+        """Match the metadata queries against the metadata of jobs.
+
+        Parameters
+        ----------
+        metas : `list` [`dict`]
+            Metadata of the jobs.
+
+        Returns
+        -------
+        matches : `numpy.ndarray`
+            Boolean matrix, jobs by queries.
+        """
+        matches = np.zeros((len(metas), len(self.queries)), dtype=bool)
+        for i, meta in enumerate(metas):
+            for j, query in enumerate(self.queries):
+                matches[i, j] = match_query(query, meta or {})
+        return matches
+
+    def evaluate(self, measurements, metas):
+        """Evaluate measurements against the applicable specifications.
+
+        Parameters
+        ----------
+        measurements : `dict` [`str`, `numpy.ndarray`]
+            ``measurement_ids``, ``job_ids``, ``metric_ids``, ``values``
+            (NaN for missing values) and ``units`` of the measurements.
+        metas : `dict` [`int`, `dict`]
+            Metadata of the jobs by job id.
+
+        Returns
+        -------
+        results : `dict` [`str`, `numpy.ndarray`]
+            One row per measurement and applicable specification:
+            ``job_ids``, ``measurement_ids``, ``metrics``, ``specs``,
+            ``values``, ``units``, ``operators``, ``thresholds`` (in the
+            measurement unit), ``status`` (``pass``, ``fail`` or
+            ``unknown`` if the value is missing or the units are not
+            comparable) and ``margins``, the distance of the value to the
+            threshold, positive if the measurement passes.
+        """
+        metric_ids = measurements["metric_ids"]
+        # Pair each measurement with the specifications of its metric
+        start = np.searchsorted(self.metric_ids, metric_ids, side="left")
+        end = np.searchsorted(self.metric_ids, metric_ids, side="right")
+        counts = end - start
+        rows = np.repeat(np.arange(len(metric_ids)), counts)
+        specs = (
+            np.arange(counts.sum())
+            - np.repeat(np.cumsum(counts) - counts, counts)
+            + np.repeat(start, counts)
+        )
+
+        # Drop the specifications whose query does not match the job
+        job_ids, job_index = np.unique(
+            measurements["job_ids"], return_inverse=True
+        )
+        matches = self.match([metas.get(int(i)) for i in job_ids])
+        applies = matches[job_index[rows], self.query_ids[specs]]
+        rows, specs = rows[applies], specs[applies]
+
+        # Convert the thresholds to the measurement units
+        units = measurements["units"][rows]
+        spec_units = self.units[specs]
+        pairs, pair_index = np.unique(
+            np.char.add(np.char.add(units, "\x1f"), spec_units),
+            return_inverse=True,
+        )
+        scales = np.array(
+            [unit_scale(*pair.split("\x1f")) for pair in pairs], dtype="f8"
+        )
+        thresholds = self.thresholds[specs] / scales[pair_index]
+
+        values = measurements["values"][rows]
+        operators = self.operators[specs]
+        passed = np.zeros(len(rows), dtype=bool)
+        for code, op in enumerate(OPERATORS.values()):
+            mask = operators == code
+            passed[mask] = op(values[mask], thresholds[mask])
+
+        diff = values - thresholds
+        margins = np.select(
+            [operators <= 1, operators <= 3, operators == 4],
+            [-diff, diff, -np.abs(diff)],
+            np.abs(diff),
+        )
+        status = np.where(passed, "pass", "fail").astype("U7")
+        status[np.isnan(margins)] = "unknown"
+
+        return {
+            "job_ids": measurements["job_ids"][rows],
+            "measurement_ids": measurements["measurement_ids"][rows],
+            "metrics": self.metric_names[specs],
+            "specs": self.names[specs],
+            "values": values,
+            "units": units,
+            "operators": np.array(list(OPERATORS), dtype="U")[operators],
+            "thresholds": thresholds,
+            "status": status,
+            "margins": margins,
+        }
+
+
+# Specifications compiled by this process
+_compiled = {"table": None, "generation": None, "loaded": 0.0}
+
+
+def get_spec_table():
+    """Return the compiled specifications.
+
+    The specifications are compiled once per process and reloaded when they
+    are modified, i.e. when the ``specs`` cache namespace is invalidated, or
+    at the latest after ``SQUASH_EVALUATION_SPECS_TTL`` seconds. Must be
+    called within the app context.
+    """
+    generation = cache.generation("specs")
+    ttl = current_app.config["SQUASH_EVALUATION_SPECS_TTL"]
+    if (
+        _compiled["table"] is None
+        or _compiled["generation"] != generation
+        or time.monotonic() - _compiled["loaded"] > ttl
+    ):
+        specs = (
+            db.session.query(
+                SpecificationModel.name,
+                SpecificationModel.metric_id,
+                MetricModel.name,
+                SpecificationModel.threshold,
+                SpecificationModel.metadata_query,
+            )
+            .join(MetricModel, SpecificationModel.metric_id == MetricModel.id)
+            .all()
+        )
+        _compiled["table"] = SpecTable(specs)
+        _compiled["generation"] = generation
+        _compiled["loaded"] = time.monotonic()
+    return _compiled["table"]
+
+
+def load_measurements(job_ids):
+    """Read the measurements of jobs in a single query.
+
+    Parameters
+    ----------
+    job_ids : `list` [`int`]
+        IDs of the jobs.
+
+    Returns
+    -------
+    measurements : `dict` [`str`, `numpy.ndarray`]
+        ``measurement_ids``, ``job_ids``, ``metric_ids``, ``metrics``
+        (names), ``values`` (NaN for missing values) and ``units`` of the
+        measurements, ordered by job.
+    """
+    rows = (
+        db.session.query(
+            MeasurementModel.id,
+            MeasurementModel.job_id,
+            MeasurementModel.metric_id,
+            MeasurementModel.metric_name,
+            MeasurementModel.value,
+            MeasurementModel.unit,
+        )
+        .filter(MeasurementModel.job_id.in_(job_ids))
+        .order_by(MeasurementModel.job_id, MeasurementModel.id)
+        .all()
+    )
+    ids, jobs, metric_ids, metrics, values, units = (
+        zip(*rows) if rows else ([], [], [], [], [], [])
+    )
+    return {
+        "measurement_ids": np.array(ids, dtype="i8"),
+        "job_ids": np.array(jobs, dtype="i8"),
+        "metric_ids": np.array(metric_ids, dtype="i8"),
+        "metrics": np.array(metrics, dtype="U"),
+        "values": np.array(
+            [np.nan if v is None else v for v in values], dtype="f8"
+        ),
+        "units": np.array([u or "" for u in units], dtype="U"),
+    }
+
+
+def evaluate_jobs(job_ids, measurements=None, metas=None):
+    """Evaluate the measurements of jobs against the specifications.
+
+    Reads the measurements and the job metadata in two queries, unless they
+    are given.
+
+    Parameters
+    ----------
+    job_ids : `list` [`int`]
+        IDs of the jobs.
+    measurements : `dict` [`str`, `numpy.ndarray`], optional
+        The measurements of the jobs, see `load_measurements`.
+    metas : `dict` [`int`, `dict`], optional
+        The metadata of the jobs by job id.
+
+    Returns
+    -------
+    results : `dict` [`str`, `numpy.ndarray`]
+        See `SpecTable.evaluate`.
+    """
+    table = get_spec_table()
+    if metas is None:
+        metas = dict(
+            db.session.query(JobModel.id, JobModel.meta)
+            .filter(JobModel.id.in_(job_ids))
+            .all()
+        )
+    if measurements is None:
+        measurements = load_measurements(job_ids)
+    return table.evaluate(measurements, metas)
+
+
+def summarize(results):
+    """Summarize the evaluation of a job.
+
+    Returns
+    -------
+    summary : `dict`
+        Number of evaluations that passed, failed or are unknown, and the
+        failed evaluations.
+    """
+    status = results["status"]
+    failed = np.flatnonzero(status == "fail")
+    return {
+        "passed": int((status == "pass").sum()),
+        "failed": len(failed),
+        "unknown": int((status == "unknown").sum()),
+        "failures": [
+            {
+                "metric": str(results["metrics"][i]),
+                "spec": str(results["specs"][i]),
+                "value": float(results["values"][i]),
+                "unit": str(results["units"][i]),
+                "operator": str(results["operators"][i]),
+                "threshold": float(results["thresholds"][i]),
+                "margin": float(results["margins"][i]),
+            }
+            for i in failed
+        ],
+    }
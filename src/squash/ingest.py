@@ -0,0 +1,449 @@
+"""Implement the ingestion of lsst.verify jobs into the SQuaSH database.
+
+The job document is spooled to a file and then read iteratively in a few
+passes: the first pass reads the job metadata and the blob references of
+the measurements, then blobs and measurements are inserted in batches of
+bounded size. Peak memory depends on the batch size rather than on the size
+of the document.
+"""
+
+__all__ = ["JobDocument", "JobLoader", "spool"]
+
+import codecs
+import logging
+import shutil
+import tempfile
+import warnings
+
+from sqlalchemy.exc import IntegrityError
+
+from .decorators import time_this
+from .detection import detect_job
+from .error import ApiError
+from .jsonstream import JSONStreamReader
+from .models import (
+    BlobModel,
+    EnvModel,
+    JobModel,
+    MeasurementModel,
+    MetricModel,
+    PackageModel,
+    db,
+    measurement_blob,
+)
+
+logger = logging.getLogger("squash")
+
+
+def spool(stream, directory=None, chunk_size=1024**2):
+    """Copy a stream to a temporary file.
+
+    Parameters
+    ----------
+    stream : file-like
+        A binary stream, e.g. the request body.
+    directory : `str`, optional
+        Directory for the temporary file, by default the system temporary
+        directory.
+    chunk_size : `int`
+        Number of bytes copied at a time.
+
+    Returns
+    -------
+    f : file-like
+        A temporary file with the content of the stream. The file is removed
+        when it is closed.
+    """
+    f = tempfile.TemporaryFile(dir=directory)
+    shutil.copyfileobj(stream, f, chunk_size)
+    f.seek(0)
+    return f
+
+
+class _TextReader:
+    """Decode a binary file as UTF-8 text, leaving the file open."""
+
+    def __init__(self, f):
+        self._file = f
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def read(self, size):
+        """Read and decode up to ``size`` bytes."""
+        data = self._file.read(size)
+        return self._decoder.decode(data, final=not data)
+
+
+class JobDocument:
+    """Iterative access to a lsst.verify job document.
+
+    Parameters
+    ----------
+    f : file-like
+        A seekable binary file with the job document in JSON.
+    """
+
+    def __init__(self, f):
+        self._file = f
+
+    def _read(self, key):
+        """Iterate over the top level keys and stop at ``key``.
+
+        Returns
+        -------
+        reader : `JSONStreamReader` or `None`
+            A reader positioned at the value of the key or `None` if the key
+            is not in the document.
+        """
+        self._file.seek(0)
+        text = _TextReader(self._file)
+        reader = JSONStreamReader(text)
+        try:
+            for name in reader.iter_object():
+                if name == key:
+                    return reader
+                reader.skip()
+        except ValueError as err:
+            raise ApiError(f"Invalid job document. {err}", 400)
+        return None
+
+    def _iter_array(self, key):
+        reader = self._read(key)
+        if reader is None:
+            return
+        try:
+            yield from reader.iter_array()
+        except ValueError as err:
+            raise ApiError(f"Invalid `{key}` in the job document. {err}", 400)
+
+    def meta(self):
+        """Return the job metadata."""
+        reader = self._read("meta")
+        if reader is None:
+            return {}
+        try:
+            meta = reader.decode()
+        except ValueError as err:
+            raise ApiError(f"Invalid `meta` in the job document. {err}", 400)
+        if not isinstance(meta, dict):
+            raise ApiError("Job metadata must be an object.", 400)
+        return meta
+
+    def measurements(self):
+        """Iterate over the job measurements."""
+        return self._iter_array("measurements")
+
+    def blobs(self):
+        """Iterate over the job data blobs."""
+        return self._iter_array("blobs")
+
+
+class JobLoader:
+    """Insert a lsst.verify job into the database.
+
+    Parameters
+    ----------
+    document : `JobDocument`
+        The job document.
+    batch_size : `int`
+        Maximum number of blobs or measurements inserted per transaction.
+    progress : `callable`, optional
+        Called as ``progress(stage, **counts)`` when a loading stage starts
+        and after each batch is inserted.
+    detect : `bool`
+        Update the metric time series states and flag change points once
+        the measurements are inserted, see `squash.detection`.
+    etl_mode : `bool`, optional
+        Preserve the job date from the env metadata, by default set by the
+        ``SQUASH_ETL_MODE`` environment variable.
+    """
+
+    def __init__(
+        self,
+        document,
+        batch_size=1000,
+        progress=None,
+        detect=False,
+        etl_mode=None,
+    ):
+        self.document = document
+        self.batch_size = batch_size
+        self.progress = progress
+        self.detect = detect
+        self.etl_mode = etl_mode
+        self.meta = {}
+        # Blob identifiers referenced by the measurements
+        self.blob_refs = set()
+        # Map blob identifiers to the ids of the inserted blobs
+        self.blob_ids = {}
+        # Creation date of the job, copied to its measurements
+        self.date_created = None
+
+    def run(self):
+        """Load the job.
+
+        Returns
+        -------
+        job_id : `int`
+            ID of the job created.
+
+        Raises
+        ------
+        ApiError
+            If the job document is invalid or an error occurred inserting
+            the job in the database.
+        """
+        self.report("scan")
+        self.scan()
+        self.report("check_or_create_env")
+        env_id = self.check_or_create_env()
+        self.report("create_job")
+        job_id = self.create_job(env_id)
+        self.report("insert_packages")
+        self.insert_packages(job_id)
+        self.report("insert_blobs")
+        self.insert_blobs()
+        self.report("insert_measurements")
+        self.insert_measurements(job_id)
+        if self.detect:
+            self.report("detect_change_points")
+            self.detect_change_points(job_id)
+        return job_id
+
+    def report(self, stage, **counts):
+        """Report the loading progress."""
+        if self.progress is not None:
+            self.progress(stage, **counts)
+
+    @time_this
+    def scan(self):
+        """Read the job metadata and validate the job document.
+
+        Collect the blob identifiers referenced by the measurements, only
+        these blobs are inserted. Does not write to the database.
+        """
+        self.meta = self.document.meta()
+        if "env_name" not in self.meta.get("env", {"env_name": "unknown"}):
+            raise ApiError("Missing `env_name` in env metadata.", 400)
+        if "packages" not in self.meta:
+            raise ApiError("Missing packages metadata.", 400)
+
+        for measurement in self.document.measurements():
+            if not measurement or "metric" not in measurement:
+                raise ApiError(
+                    "You must provide a list of measurements "
+                    "and the associated metric name.",
+                    400,
+                )
+            self.blob_refs.update(measurement.get("blob_refs") or [])
+
+    @time_this
+    def check_or_create_env(self):
+        """Check if env (e.g. Jenkins) exists in the db, if not create it.
+
+        Returns
+        -------
+        env_id : `int`
+            id of the environment associated with the job.
+        """
+        if "env" in self.meta:
+            env = self.meta["env"]
+            if "env_name" not in env:
+                raise ApiError("Missing `env_name` in env metadata.", 400)
+            env_name = env["env_name"]
+        else:
+            # allows for unknown environment
+            env_name = "unknown"
+
+        e = EnvModel.find_by_name(env_name)
+        if not e:
+            e = EnvModel(env_name)
+            try:
+                e.save_to_db()
+            except IntegrityError:
+                # Created concurrently, e.g. by another bulk load worker
+                db.session.rollback()
+                e = EnvModel.find_by_name(env_name)
+            except Exception:
+                db.session.rollback()
+                raise ApiError(
+                    "An error ocurred creating the env object.", 500
+                )
+
+        return e.id
+
+    @time_this
+    def create_job(self, env_id):
+        """Create the job object.
+
+        Parameters
+        ----------
+        env_id : `int`
+            id of the environment associated with the job.
+
+        Returns
+        -------
+        job_id : `int`
+            id of the job created
+        """
+        # job metadata contains arbitrary metadata plus
+        # env metadata and packages
+        meta = self.meta.copy()
+
+        # we extract the env metadata
+        env = meta.pop("env", {})
+
+        # and remove the packages, they will be inserted later.
+        if "packages" in meta:
+            del meta["packages"]
+        else:
+            raise ApiError("Missing packages metadata.", 400)
+
+        # what remains in meta is the arbitrary metadata we want to save
+        try:
+            j = JobModel(env_id, env, meta, self.etl_mode)
+        except ValueError as err:
+            raise ApiError(f"Invalid `date` in env metadata. {err}", 400)
+
+        try:
+            j.save_to_db()
+        except Exception:
+            db.session.rollback()
+            raise ApiError("An error occurred creating the job object.", 500)
+
+        self.date_created = j.date_created
+        return j.id
+
+    @time_this
+    def insert_packages(self, job_id):
+        """Insert packages associated with the job.
+
+        Parameters
+        ----------
+        job_id : `int`
+            id of the job object previously created.
+        """
+        packages = self.meta["packages"]
+        try:
+            db.session.add_all(
+                PackageModel(job_id, **packages[package])
+                for package in packages
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise ApiError("An error occurred inserting packages", 500)
+
+    def _batches(self, items):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @time_this
+    def insert_blobs(self):
+        """Insert the data blobs referenced by the measurements."""
+        seen = set()
+
+        def referenced(blob):
+            if not blob or "identifier" not in blob or "name" not in blob:
+                return False
+            identifier = blob["identifier"]
+            if identifier not in self.blob_refs or identifier in seen:
+                return False
+            seen.add(identifier)
+            return True
+
+        # Blob data is not stored, keep only the blob identifier and name
+        blobs = (
+            BlobModel(blob["identifier"], blob["name"])
+            for blob in filter(referenced, self.document.blobs())
+        )
+        for objects in self._batches(blobs):
+            try:
+                db.session.add_all(objects)
+                db.session.flush()
+                # Read the ids before the commit expires the objects
+                ids = {b.identifier: b.id for b in objects}
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise ApiError("An error occurred inserting blobs", 500)
+
+            self.blob_ids.update(ids)
+            self.report("insert_blobs", blobs=len(self.blob_ids))
+
+    @time_this
+    def insert_measurements(self, job_id):
+        """Insert measurements associated with the job.
+
+        Parameters
+        ----------
+        job_id : `int`
+            id of the job object previously created.
+        """
+        # Look up metric ids without loading the metric relationships
+        metric_ids = dict(
+            db.session.query(MetricModel.name, MetricModel.id).all()
+        )
+
+        count = 0
+        for batch in self._batches(self.document.measurements()):
+            objects = []
+            for measurement in batch:
+                metric_name = measurement["metric"]
+                if metric_name not in metric_ids:
+                    warnings.warn(
+                        "Metric `{}` not found, it looks like "
+                        "the metrics definition is out of "
+                        "date.".format(metric_name)
+                    )
+                    continue
+                m = MeasurementModel(
+                    job_id, metric_ids[metric_name], **measurement
+                )
+                m.date_created = self.date_created
+                objects.append((m, measurement.get("blob_refs") or []))
+
+            try:
+                db.session.add_all(m for m, _ in objects)
+                db.session.flush()
+                associations = [
+                    {"measurement_id": m.id, "blob_id": self.blob_ids[ref]}
+                    for m, refs in objects
+                    for ref in set(refs)
+                    if ref in self.blob_ids
+                ]
+                if associations:
+                    db.session.execute(measurement_blob.insert(), associations)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise ApiError("An error occurred inserting measurements", 500)
+
+            count += len(objects)
+            self.report("insert_measurements", measurements=count)
+
+    @time_this
+    def detect_change_points(self, job_id):
+        """Flag the change points in the time series of the job metrics.
+
+        The job is already committed, errors are logged and do not fail
+        the ingest.
+
+        Parameters
+        ----------
+        job_id : `int`
+            id of the job object previously created.
+        """
+        try:
+            change_points = detect_job(job_id)
+        except Exception:
+            logger.exception(
+                f"Could not detect change points of job {job_id}."
+            )
+            return
+        self.report("detect_change_points", change_points=len(change_points))
@@ -0,0 +1,456 @@
+"""Implement the performance instrumentation of the SQuaSH API.
+
+Record request latency, response size, number and time of SQL statements
+per endpoint, and the duration of the functions decorated with
+`squash.decorators.time_this`, e.g. the job ingest stages.
+
+SQL statements are also accounted per request, in `flask.g`, which keeps
+only the ``SQUASH_SQL_LOG_SLOWEST`` slowest statements. These are logged for
+the requests that exceed the ``SQUASH_SQL_MAX_STATEMENTS`` or
+``SQUASH_SQL_MAX_DURATION`` budgets. Use `count_statements` to
+count the statements executed by a block of code, e.g. in tests.
+
+Metrics are exposed in the Prometheus format by the ``/monitor`` endpoint.
+The uwsgi deployment runs several worker processes, set the
+``PROMETHEUS_MULTIPROC_DIR`` environment variable to a directory shared by
+the workers to aggregate the metrics of all of them, see
+https://github.com/prometheus/client_python#multiprocess-mode-eg-gunicorn
+"""
+
+__all__ = [
+    "Instrumentation",
+    "instrumentation",
+    "count_statements",
+    "generate_metrics",
+    "start_metrics_server",
+    "STAGE_DURATION",
+    "EXPORT_STAGE_DURATION",
+    "EXPORT_LINES",
+    "EXPORT_BYTES",
+    "EXPORT_RETRIES",
+    "EXPORT_JOBS",
+    "DB_POOL_CONNECTIONS",
+    "DB_POOL_CHECKED_OUT",
+    "DB_POOL_WAIT",
+    "DB_POOL_TIMEOUTS",
+    "DB_REPLICA_READS",
+    "DB_REPLICA_FAILURES",
+]
+
+import heapq
+import os
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .cache import cache
+
+REQUEST_LATENCY = Histogram(
+    "squash_request_duration_seconds",
+    "Request latency in seconds.",
+    ["method", "endpoint", "status"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+RESPONSE_SIZE = Histogram(
+    "squash_response_size_bytes",
+    "Size of the response body in bytes.",
+    ["method", "endpoint"],
+    buckets=tuple(4**n for n in range(2, 15)),
+)
+
+REQUEST_SQL_STATEMENTS = Histogram(
+    "squash_request_sql_statements",
+    "Number of SQL statements executed per request.",
+    ["method", "endpoint"],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 1000, 10000),
+)
+
+SQL_STATEMENTS = Counter(
+    "squash_sql_statements",
+    "Number of SQL statements executed.",
+    ["endpoint"],
+)
+
+REQUEST_SQL_ROWS = Histogram(
+    "squash_request_sql_rows",
+    "Number of rows returned by the SQL statements of a request.",
+    ["method", "endpoint"],
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000, 1000000),
+)
+
+SQL_BUDGET_EXCEEDED = Counter(
+    "squash_sql_budget_exceeded",
+    "Number of requests that exceeded the SQL statements or time budget.",
+    ["endpoint"],
+)
+
+SQL_DURATION = Counter(
+    "squash_sql_duration_seconds",
+    "Time spent executing SQL statements in seconds.",
+    ["endpoint"],
+)
+
+STAGE_DURATION = Histogram(
+    "squash_stage_duration_seconds",
+    "Duration of the instrumented stages, e.g. the job ingest stages.",
+    ["stage"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800),
+)
+
+# Metrics of the job_to_influxdb Celery task, exposed by the workers
+EXPORT_STAGE_DURATION = Histogram(
+    "squash_export_stage_duration_seconds",
+    "Duration of the stages of the job export to InfluxDB.",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+EXPORT_LINES = Counter(
+    "squash_export_lines",
+    "Number of InfluxDB lines written.",
+)
+
+EXPORT_BYTES = Counter(
+    "squash_export_bytes",
+    "Number of bytes written to InfluxDB.",
+)
+
+EXPORT_RETRIES = Counter(
+    "squash_export_retries",
+    "Number of InfluxDB write retries.",
+)
+
+EXPORT_JOBS = Counter(
+    "squash_export_jobs",
+    "Number of jobs exported to InfluxDB.",
+    ["status_code"],
+)
+
+# Metrics of the database connection pools and of the read replicas, see
+# squash.routing
+DB_POOL_CONNECTIONS = Gauge(
+    "squash_db_pool_connections",
+    "Number of open database connections in the pool of each bind.",
+    ["bind"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "squash_db_pool_checked_out",
+    "Number of database connections in use in the pool of each bind.",
+    ["bind"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_WAIT = Histogram(
+    "squash_db_pool_wait_seconds",
+    "Time in seconds to check out a database connection from the pool of "
+    "each bind, including the time to open a new connection.",
+    ["bind"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+DB_POOL_TIMEOUTS = Counter(
+    "squash_db_pool_timeouts",
+    "Number of times no database connection was available in the pool of "
+    "each bind within the pool timeout.",
+    ["bind"],
+)
+
+DB_REPLICA_READS = Counter(
+    "squash_db_replica_reads",
+    "Number of SQL statements routed to each read replica.",
+    ["bind"],
+)
+
+DB_REPLICA_FAILURES = Counter(
+    "squash_db_replica_failures",
+    "Number of times a read replica failed and reads fell back to the "
+    "primary.",
+    ["bind"],
+)
+
+
+def _endpoint():
+    """Return the endpoint of the current request, if any."""
+    if has_request_context():
+        return request.endpoint or "unknown"
+    return "none"
+
+
+# Statement recorders of the active count_statements() blocks
+_recorders = []
+
+
+def before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    """Record the start time of a SQL statement."""
+    conn.info.setdefault("squash_query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    """Record the number and time of SQL statements."""
+    elapsed = time.perf_counter() - conn.info["squash_query_start"].pop()
+    # Rows of the result set as reported by the DBAPI, buffered cursors
+    # like the pymysql default cursor report the number of rows fetched
+    rows = 0
+    if cursor.description is not None and cursor.rowcount > 0:
+        rows = cursor.rowcount
+
+    endpoint = _endpoint()
+    SQL_STATEMENTS.labels(endpoint=endpoint).inc()
+    SQL_DURATION.labels(endpoint=endpoint).inc(elapsed)
+
+    for recorder in _recorders:
+        recorder.append(statement)
+
+    if has_request_context():
+        g.squash_sql_statements = g.get("squash_sql_statements", 0) + 1
+        g.squash_sql_duration = g.get("squash_sql_duration", 0) + elapsed
+        g.squash_sql_rows = g.get("squash_sql_rows", 0) + rows
+        _keep_slowest(
+            g.setdefault("squash_sql_slowest", []),
+            (elapsed, g.squash_sql_statements, statement, rows),
+            current_app.config.get("SQUASH_SQL_LOG_SLOWEST", 10),
+        )
+
+
+def _keep_slowest(slowest, record, size):
+    """Add a statement to the heap of the slowest statements of a request.
+
+    The heap is bounded, the fastest statement is dropped when it is full.
+    """
+    if len(slowest) < size:
+        heapq.heappush(slowest, record)
+    elif size:
+        heapq.heappushpop(slowest, record)
+
+
+@contextmanager
+def count_statements():
+    """Record the SQL statements executed within a block.
+
+    Yields
+    ------
+    statements : `list` [`str`]
+        The SQL statements executed so far.
+
+    Examples
+    --------
+    >>> with count_statements() as statements:
+    ...     client.get("/jobs")
+    >>> assert len(statements) <= 2
+    """
+    statements = []
+    _recorders.append(statements)
+    try:
+        yield statements
+    finally:
+        _recorders.remove(statements)
+
+
+def check_sql_budget(endpoint):
+    """Log the slowest SQL statements of the request over the budget.
+
+    The budget of a given method and endpoint, e.g. ``POST job``, can be
+    overridden with ``SQUASH_SQL_BUDGETS``.
+
+    Returns
+    -------
+    exceeded : `bool`
+        `True` if the request exceeded the SQL statements or time budget.
+    """
+    config = current_app.config
+    max_statements, max_duration = config.get("SQUASH_SQL_BUDGETS", {}).get(
+        f"{request.method} {endpoint}",
+        (
+            config.get("SQUASH_SQL_MAX_STATEMENTS"),
+            config.get("SQUASH_SQL_MAX_DURATION"),
+        ),
+    )
+    count = g.get("squash_sql_statements", 0)
+    duration = g.get("squash_sql_duration", 0)
+
+    if not (max_statements and count > max_statements) and not (
+        max_duration and duration > max_duration
+    ):
+        return False
+
+    SQL_BUDGET_EXCEEDED.labels(endpoint=endpoint).inc()
+    lines = [
+        f"{request.method} {request.full_path} exceeded the SQL budget: "
+        f"{count} statements, {duration:.3f}s, "
+        f"{g.get('squash_sql_rows', 0)} rows."
+    ]
+    slowest = sorted(g.get("squash_sql_slowest", []), reverse=True)
+    if slowest:
+        lines[0] += f" The {len(slowest)} slowest statements:"
+    for elapsed, i, statement, rows in slowest:
+        lines.append(
+            f"  {i:4d} {elapsed * 1000:9.2f}ms {rows:8d} rows  "
+            + " ".join(statement.split())
+        )
+    current_app.logger.warning("\n".join(lines))
+    return True
+
+
+class CacheCollector:
+    """Collect the response cache hits and misses.
+
+    The counters are kept in the cache backend and are already aggregated
+    among the uwsgi workers.
+    """
+
+    def collect(self):
+        """Yield the cache metrics."""
+        hits = CounterMetricFamily(
+            "squash_cache_hits",
+            "Number of responses read from the cache.",
+            labels=["resource"],
+        )
+        misses = CounterMetricFamily(
+            "squash_cache_misses",
+            "Number of responses not found in the cache.",
+            labels=["resource"],
+        )
+        for resource, counts in cache.stats().items():
+            hits.add_metric([resource], counts["hits"])
+            misses.add_metric([resource], counts["misses"])
+        yield hits
+        yield misses
+
+
+def _registry():
+    """Return the registry of the metrics of this process.
+
+    In multiprocess mode, the registry aggregates the metrics of all the
+    processes.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def start_metrics_server(port):
+    """Serve the metrics in the Prometheus format over HTTP.
+
+    Used by the Celery workers, which do not serve the API.
+
+    Parameters
+    ----------
+    port : `int`
+        The port to listen to.
+    """
+    start_http_server(port, registry=_registry())
+
+
+def generate_metrics():
+    """Return the metrics in the Prometheus text format.
+
+    Must be called within the app context.
+
+    Returns
+    -------
+    data : `bytes`
+        The metrics.
+    content_type : `str`
+        The content type of the Prometheus text format.
+    """
+    registry = _registry()
+    cache_registry = CollectorRegistry()
+    cache_registry.register(CacheCollector())
+
+    data = generate_latest(registry) + generate_latest(cache_registry)
+    return data, CONTENT_TYPE_LATEST
+
+
+class Instrumentation:
+    """Instrument requests and SQL statements.
+
+    Follows the Flask extension pattern, create the `Instrumentation` object
+    once and call `init_app` for each app instance.
+    """
+
+    _sql_listeners = False
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the request hooks and the SQL event listeners."""
+        if not Instrumentation._sql_listeners:
+            event.listen(
+                Engine, "before_cursor_execute", before_cursor_execute
+            )
+            event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+            Instrumentation._sql_listeners = True
+
+        app.before_request(self.start_timer)
+        app.after_request(self.record_request)
+
+    @staticmethod
+    def start_timer():
+        """Record the start time of the request, reset the SQL accounting.
+
+        `flask.g` may outlive the request, e.g. if the app context is
+        pushed by the test client fixture.
+        """
+        g.squash_request_start = time.perf_counter()
+        g.squash_sql_statements = 0
+        g.squash_sql_duration = 0
+        g.squash_sql_rows = 0
+        g.squash_sql_slowest = []
+
+    @staticmethod
+    def record_request(response):
+        """Record latency, response size and SQL statements of a request.
+
+        Log the SQL statements if the request exceeded the SQL budget.
+        """
+        start = g.get("squash_request_start")
+        if start is None:
+            return response
+
+        method = request.method
+        endpoint = _endpoint()
+        REQUEST_LATENCY.labels(
+            method=method, endpoint=endpoint, status=response.status_code
+        ).observe(time.perf_counter() - start)
+        REQUEST_SQL_STATEMENTS.labels(
+            method=method, endpoint=endpoint
+        ).observe(g.get("squash_sql_statements", 0))
+        REQUEST_SQL_ROWS.labels(method=method, endpoint=endpoint).observe(
+            g.get("squash_sql_rows", 0)
+        )
+        if response.content_length is not None:
+            RESPONSE_SIZE.labels(method=method, endpoint=endpoint).observe(
+                response.content_length
+            )
+        check_sql_budget(endpoint)
+        return response
+
+
+# Initialize extension
+instrumentation = Instrumentation()
@@ -0,0 +1,196 @@
+"""Implement an iterative reader for large JSON documents.
+
+Large lsst.verify jobs are mostly made of the ``measurements`` and ``blobs``
+arrays. The reader walks the top level object of the document and decodes
+the items of these arrays one at a time, so memory usage is proportional to
+the size of the largest item rather than to the size of the document.
+
+Items are decoded with the standard library decoder, so values like ``NaN``
+and ``Infinity`` are handled exactly as in ``json.loads``.
+"""
+
+__all__ = ["JSONStreamReader"]
+
+import json
+import re
+from json.decoder import scanstring
+
+WHITESPACE = " \t\n\r"
+# Characters that change the nesting level when skipping a value
+STRUCTURE = re.compile(r'["\[\]{}]')
+# Characters that may continue a number, e.g. ``1.`` before ``1.5``
+NUMBER = "0123456789.eE+-"
+
+
+class JSONStreamReader:
+    """Iterative reader for a JSON document.
+
+    Parameters
+    ----------
+    f : file-like
+        A text stream opened for reading.
+    chunk_size : `int`
+        Number of characters read from the stream at a time.
+    """
+
+    def __init__(self, f, chunk_size=1024**2):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        """Read more data into the buffer, return `False` at EOF."""
+        if self._eof:
+            return False
+        # Discard the consumed part of the buffer
+        self._buf = self._buf[self._pos :]
+        self._pos = 0
+        chunk = self._file.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf += chunk
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character."""
+        while True:
+            while self._pos < len(self._buf):
+                char = self._buf[self._pos]
+                if char not in WHITESPACE:
+                    return char
+                self._pos += 1
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        """Consume the next character that must be one of ``chars``."""
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(
+                f"Expecting one of `{chars}`, found `{char}` in the document."
+            )
+        self._pos += 1
+        return char
+
+    def decode(self):
+        """Decode the next value in the document.
+
+        Returns
+        -------
+        value : `object`
+            The decoded value.
+        """
+        self._peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number that ends with the buffer, or before a character
+                # that is not valid after it, e.g. ``1.`` is decoded as 1,
+                # may be truncated, make sure it is complete
+                if self._eof or not self._truncated(value, end):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Double the read size to keep decoding of large values linear
+            self._fill(size)
+            size *= 2
+
+    def _truncated(self, value, end):
+        """Return `True` if a decoded value may continue in the stream."""
+        if end == len(self._buf):
+            return True
+        return (
+            isinstance(value, (int, float))
+            and not isinstance(value, bool)
+            and self._buf[end] in NUMBER
+        )
+
+    def skip(self):
+        """Skip the next value in the document without decoding it."""
+        if self._peek() not in "[{":
+            self.decode()
+            return
+
+        depth = 0
+        while True:
+            match = STRUCTURE.search(self._buf, self._pos)
+            if match is None:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    raise ValueError("Unexpected end of the document.")
+                continue
+
+            char = match.group()
+            if char == '"':
+                try:
+                    _, self._pos = scanstring(self._buf, match.end())
+                except json.JSONDecodeError:
+                    # The string continues in the next chunk
+                    self._pos = match.start()
+                    if not self._fill():
+                        raise
+                continue
+
+            self._pos = match.end()
+            if char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def iter_object(self):
+        """Iterate over the keys of the next object in the document.
+
+        The caller must consume the value of each key with `decode`, `skip`
+        or `iter_array` before requesting the next key.
+
+        Yields
+        ------
+        key : `str`
+            A key of the object.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+
+        while True:
+            key = self.decode()
+            self._expect(":")
+            yield key
+            if self._expect(",}") == "}":
+                return
+
+    def iter_array(self):
+        """Iterate over the items of the next array in the document.
+
+        A ``null`` value is handled as an empty array.
+
+        Yields
+        ------
+        item : `object`
+            The decoded items of the array.
+        """
+        if self._peek() != "[":
+            value = self.decode()
+            if value is not None:
+                raise ValueError("Expecting an array in the document.")
+            return
+
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+
+        while True:
+            yield self.decode()
+            if self._expect(",]") == "]":
+                return
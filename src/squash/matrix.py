@@ -0,0 +1,234 @@
+"""Implement the dense jobs by metrics matrix of the measurement values.
+
+The jobs matching a filter on dataset, CI pipeline and creation date are
+read first, they are the rows of the matrix with their metadata columns. The
+measurements of these jobs are then read with a single streaming query and
+accumulated into compact arrays of row indices, metric codes and values,
+without building ORM objects. The arrays are pivoted with NumPy into the
+matrix, the memory used is proportional to the number of measurements.
+
+The matrix can be encoded as a compressed NumPy ``.npz`` archive, an Arrow
+IPC stream or a Parquet file, with one column per metric.
+"""
+
+__all__ = [
+    "FORMATS",
+    "MatrixQuery",
+    "to_columns",
+    "to_npz",
+    "encode",
+]
+
+import io
+from array import array
+
+import numpy as np
+
+from .models import JobModel, MeasurementModel, db
+from .series import to_arrow, to_parquet
+
+# Supported output formats and their content type
+FORMATS = {
+    "npz": "application/octet-stream",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Metadata columns of the jobs, in the order of the matrix rows
+JOB_COLUMNS = [
+    "job_ids",
+    "timestamps",
+    "datasets",
+    "ci_names",
+    "ci_ids",
+    "filter_names",
+]
+
+
+class MatrixQuery:
+    """Query the matrix of the measurement values of jobs.
+
+    Parameters
+    ----------
+    dataset : `str`, optional
+        Name of the dataset, e.g. ``HSC``.
+    ci_name : `str`, optional
+        Name of the CI pipeline that ran the jobs.
+    start : `datetime.datetime`, optional
+        Include jobs created at this time or later.
+    end : `datetime.datetime`, optional
+        Include jobs created before this time.
+    metrics : `list` [`str`], optional
+        Include only these metrics, by default all the metrics measured.
+    batch_size : `int`
+        Number of measurements fetched at a time.
+    """
+
+    def __init__(
+        self,
+        dataset=None,
+        ci_name=None,
+        start=None,
+        end=None,
+        metrics=None,
+        batch_size=10000,
+    ):
+        self.dataset = dataset
+        self.ci_name = ci_name
+        self.start = start
+        self.end = end
+        self.metrics = metrics
+        self.batch_size = batch_size
+
+    def _filter(self, query):
+        """Filter a query joined with job."""
+        if self.dataset is not None:
+            query = query.filter(JobModel.ci_dataset == self.dataset)
+        if self.ci_name is not None:
+            query = query.filter(
+                JobModel.env["ci_name"].as_string() == self.ci_name
+            )
+        if self.start is not None:
+            query = query.filter(JobModel.date_created >= self.start)
+        if self.end is not None:
+            query = query.filter(JobModel.date_created < self.end)
+        return query
+
+    def jobs(self):
+        """Return the query for the jobs ordered by time."""
+        query = db.session.query(
+            JobModel.id,
+            JobModel.date_created,
+            JobModel.ci_dataset,
+            JobModel.env["ci_name"].as_string(),
+            JobModel.env["ci_id"].as_string(),
+            JobModel.meta["filter_name"].as_string(),
+        )
+        return self._filter(query).order_by(JobModel.date_created, JobModel.id)
+
+    def measurements(self):
+        """Return the query for the measurements of the jobs.
+
+        The time window is also selected on the job date copied to the
+        measurements, which prunes the partitions of the measurement table.
+        """
+        query = (
+            db.session.query(
+                MeasurementModel.job_id,
+                MeasurementModel.metric_name,
+                MeasurementModel.value,
+                MeasurementModel.unit,
+            )
+            .join(JobModel, MeasurementModel.job_id == JobModel.id)
+            .filter(MeasurementModel.value.isnot(None))
+        )
+        if self.metrics is not None:
+            query = query.filter(
+                MeasurementModel.metric_name.in_(self.metrics)
+            )
+        if self.start is not None:
+            query = query.filter(MeasurementModel.date_created >= self.start)
+        if self.end is not None:
+            query = query.filter(MeasurementModel.date_created < self.end)
+        return self._filter(query).order_by(MeasurementModel.id)
+
+    def count(self):
+        """Return the number of jobs, i.e. of rows of the matrix."""
+        return self._filter(db.session.query(JobModel.id)).count()
+
+    def matrix(self):
+        """Run the queries and return the matrix.
+
+        If a job has several measurements of a metric, the last one is kept.
+
+        Returns
+        -------
+        matrix : `dict` [`str`, `numpy.ndarray`]
+            Metadata of the jobs, one element per row: ``job_ids``,
+            ``timestamps`` (datetime64[s]), ``datasets``, ``ci_names``,
+            ``ci_ids`` and ``filter_names`` (empty if unknown). ``metrics``
+            and ``units`` of the columns, sorted by metric name, and the
+            ``values`` matrix, jobs by metrics (NaN for missing values).
+        """
+        jobs = self.jobs().all()
+        job_ids, timestamps, *metadata = (
+            zip(*jobs) if jobs else ([], [], [], [], [], [])
+        )
+        matrix = {
+            "job_ids": np.array(job_ids, dtype="i8"),
+            "timestamps": np.array(timestamps, dtype="datetime64[s]"),
+        }
+        for name, column in zip(JOB_COLUMNS[2:], metadata):
+            matrix[name] = np.array([v or "" for v in column], dtype="U")
+
+        index = {job_id: row for row, job_id in enumerate(job_ids)}
+        codes = {}
+        units = []
+        rows, cols, values = array("q"), array("q"), array("d")
+        for job_id, metric, value, unit in self.measurements().yield_per(
+            self.batch_size
+        ):
+            row = index.get(job_id)
+            if row is None:
+                # Job created after the jobs were read
+                continue
+            code = codes.get(metric)
+            if code is None:
+                code = codes[metric] = len(codes)
+                units.append(unit or "")
+            rows.append(row)
+            cols.append(code)
+            values.append(value)
+
+        # Sort the columns by metric name
+        names = np.array(list(codes), dtype="U")
+        order = np.argsort(names, kind="stable")
+        position = np.empty(len(order), dtype="i8")
+        position[order] = np.arange(len(order))
+
+        matrix["metrics"] = names[order]
+        matrix["units"] = np.array(units, dtype="U")[order]
+        matrix["values"] = np.full((len(job_ids), len(codes)), np.nan)
+        matrix["values"][
+            np.frombuffer(rows, dtype="i8"),
+            position[np.frombuffer(cols, dtype="i8")],
+        ] = np.frombuffer(values, dtype="f8")
+        return matrix
+
+
+def to_columns(matrix):
+    """Return the matrix as columns, one per job metadata and per metric.
+
+    Metric names contain a dot and thus do not collide with the metadata
+    column names.
+    """
+    columns = {name: matrix[name] for name in JOB_COLUMNS}
+    for j, metric in enumerate(matrix["metrics"]):
+        columns[str(metric)] = matrix["values"][:, j]
+    return columns
+
+
+def to_npz(matrix):
+    """Return the matrix as a compressed NumPy ``.npz`` archive.
+
+    Read it with ``numpy.load(io.BytesIO(data))``, the arrays are named
+    after the keys of the matrix.
+    """
+    f = io.BytesIO()
+    np.savez_compressed(f, **matrix)
+    return f.getvalue()
+
+
+def encode(matrix, output):
+    """Encode the matrix in an output format, see `FORMATS`.
+
+    Raises
+    ------
+    RuntimeError
+        If the format requires pyarrow and it is not installed.
+    """
+    if output == "npz":
+        return to_npz(matrix)
+    if output == "arrow":
+        return to_arrow(to_columns(matrix))
+    return to_parquet(to_columns(matrix))
@@ -0,0 +1,265 @@
+"""Upgrade the schema of an existing SQuaSH database.
+
+The tables are created by ``db.create_all()`` when the app starts, which
+does not modify the tables that already exist. `upgrade` adds the indexes
+and columns declared in the models that are missing in the existing
+tables, fills the new columns and recreates the foreign keys whose
+``ON DELETE`` action differs from the models, e.g. the foreign keys created
+before the ``ON DELETE CASCADE`` actions were declared.
+"""
+
+__all__ = [
+    "missing_columns",
+    "missing_indexes",
+    "outdated_foreign_keys",
+    "set_measurement_dates",
+    "backfill_measurement_dates",
+    "merge_duplicate_envs",
+    "upgrade",
+]
+
+from sqlalchemy import (
+    MetaData,
+    Table,
+    delete,
+    func,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.schema import AddConstraint, CreateColumn, DropConstraint
+
+from .models import EnvModel, JobModel, MeasurementModel, db
+
+
+def missing_columns():
+    """Return the columns declared in the models missing in the database.
+
+    Must be called within the app context.
+
+    Returns
+    -------
+    columns : `list` [`sqlalchemy.schema.Column`]
+        The missing columns, of the tables that exist in the database.
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    columns = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {
+            column["name"] for column in inspector.get_columns(table.name)
+        }
+        columns.extend(
+            column for column in table.columns if column.name not in existing
+        )
+    return columns
+
+
+def _add_column(connection, column):
+    """Add a column to an existing table, the column must be nullable."""
+    preparer = connection.dialect.identifier_preparer
+    ddl = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.execute(
+        text(f"ALTER TABLE {preparer.format_table(column.table)} ADD {ddl}")
+    )
+
+
+def missing_indexes():
+    """Return the indexes declared in the models missing in the database.
+
+    Must be called within the app context.
+
+    Returns
+    -------
+    indexes : `list` [`sqlalchemy.schema.Index`]
+        The missing indexes, of the tables that exist in the database.
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    indexes = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {
+            index["name"] for index in inspector.get_indexes(table.name)
+        }
+        indexes.extend(
+            index for index in table.indexes if index.name not in existing
+        )
+    return indexes
+
+
+def _ondelete(action):
+    return (action or "NO ACTION").upper()
+
+
+def outdated_foreign_keys():
+    """Return the foreign keys whose ``ON DELETE`` action is outdated.
+
+    Must be called within the app context.
+
+    Returns
+    -------
+    foreign_keys : `list` [`tuple`]
+        The foreign keys of the existing tables reflected from the database
+        and declared in the models, as pairs of
+        `sqlalchemy.schema.ForeignKeyConstraint`.
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    reflected = MetaData()
+    foreign_keys = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {
+            tuple(fk.column_keys): fk
+            for fk in Table(
+                table.name, reflected, autoload_with=db.engine
+            ).foreign_key_constraints
+        }
+        for fk in table.foreign_key_constraints:
+            old = existing.get(tuple(fk.column_keys))
+            if old is not None and _ondelete(old.ondelete) != _ondelete(
+                fk.ondelete
+            ):
+                foreign_keys.append((old, fk))
+    return foreign_keys
+
+
+def _describe(fk):
+    return "{}.{} ON DELETE {}".format(
+        fk.table.name, ", ".join(fk.column_keys), _ondelete(fk.ondelete)
+    )
+
+
+def set_measurement_dates(*criteria):
+    """Copy the job date to the measurements matching criteria without one.
+
+    The changes are not committed.
+
+    Returns
+    -------
+    count : `int`
+        Number of measurements updated.
+    """
+    job_date = (
+        select(JobModel.date_created)
+        .where(JobModel.id == MeasurementModel.job_id)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        update(MeasurementModel)
+        .where(MeasurementModel.date_created.is_(None), *criteria)
+        .values(date_created=job_date),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount
+
+
+def backfill_measurement_dates(batch_size=10000):
+    """Copy the job date to the measurements without one.
+
+    Must be called within the app context. The measurements are updated in
+    batches of ids, each batch is committed.
+
+    Returns
+    -------
+    count : `int`
+        Number of measurements updated.
+    """
+    last = db.session.query(func.max(MeasurementModel.id)).scalar() or 0
+    count = 0
+    for start in range(0, last + 1, batch_size):
+        count += set_measurement_dates(
+            MeasurementModel.id >= start,
+            MeasurementModel.id < start + batch_size,
+        )
+        db.session.commit()
+    return count
+
+
+def merge_duplicate_envs():
+    """Merge the envs with the same name into the first one.
+
+    The unique index of the env names cannot be created while duplicates
+    exist. The jobs of the duplicates are moved to the env with the
+    smallest id and the duplicates are deleted. Must be called within the
+    app context, the changes are committed.
+
+    Returns
+    -------
+    count : `int`
+        Number of envs deleted.
+    """
+    duplicates = db.session.execute(
+        select(EnvModel.name, func.min(EnvModel.id))
+        .group_by(EnvModel.name)
+        .having(func.count() > 1)
+    ).all()
+    count = 0
+    for name, env_id in duplicates:
+        others = select(EnvModel.id).where(
+            EnvModel.name == name, EnvModel.id != env_id
+        )
+        db.session.execute(
+            update(JobModel)
+            .where(JobModel.env_id.in_(others))
+            .values(env_id=env_id),
+            execution_options={"synchronize_session": False},
+        )
+        count += db.session.execute(
+            delete(EnvModel).where(
+                EnvModel.name == name, EnvModel.id != env_id
+            ),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+    db.session.commit()
+    return count
+
+
+def upgrade(dry_run=False):
+    """Upgrade the schema of an existing database.
+
+    Create the missing tables, columns and indexes, fill the new columns,
+    merge the duplicate envs and recreate the outdated foreign keys. Must be
+    called within the app context. Adding a column or recreating a foreign
+    key locks its table while the existing rows are updated or checked.
+
+    Parameters
+    ----------
+    dry_run : `bool`
+        If `True`, only return the changes that would be made.
+
+    Returns
+    -------
+    changes : `list` [`str`]
+        Names of the columns and indexes created and descriptions of the
+        foreign keys recreated.
+    """
+    columns = missing_columns()
+    indexes = missing_indexes()
+    foreign_keys = outdated_foreign_keys()
+    if not dry_run:
+        db.create_all()
+        with db.engine.begin() as connection:
+            for column in columns:
+                _add_column(connection, column)
+        # Fill the new columns and merge the duplicate envs before the
+        # indexes are built
+        backfill_measurement_dates()
+        merge_duplicate_envs()
+        for index in indexes:
+            index.create(db.engine)
+        with db.engine.begin() as connection:
+            for old, new in foreign_keys:
+                connection.execute(DropConstraint(old))
+                connection.execute(AddConstraint(new))
+    return (
+        [f"{column.table.name}.{column.name}" for column in columns]
+        + [index.name for index in indexes]
+        + [_describe(new) for _, new in foreign_keys]
+    )
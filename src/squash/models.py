@@ -4,15 +4,24 @@ import os
 from datetime import datetime
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import delete, select
 from sqlalchemy.dialects.mysql import JSON, TIMESTAMP
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql import expression, null
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from .pool import InstrumentedQueuePool
+from .routing import RoutingSession
+
 SQUASH_ETL_MODE = os.environ.get("SQUASH_ETL_MODE", False)
 
-# Initialize extension
-db = SQLAlchemy()
+# Initialize extension, the reads of the read-only requests are routed to
+# the read replicas, see squash.routing, and the connection pools are
+# instrumented, see squash.pool
+db = SQLAlchemy(
+    session_options={"class_": RoutingSession},
+    engine_options={"poolclass": InstrumentedQueuePool},
+)
 
 
 # https://jira.lsstcorp.org/browse/DM-12193
@@ -32,6 +41,12 @@ def mysql_now(element, compiler, **kw):
     return "CURRENT_TIMESTAMP()"
 
 
+@compiles(now)
+def default_now(element, compiler, **kw):
+    """Implement now() for the other databases, e.g. SQLite in tests."""
+    return "CURRENT_TIMESTAMP"
+
+
 class UserModel(db.Model):
     """Database model for authenticated API users."""
 
@@ -106,8 +121,22 @@ class MetricModel(db.Model):
     # usually with a handle to the document, a url and a page number.
     reference = db.Column(JSON())
 
-    specification = db.relationship("SpecificationModel", lazy="joined")
-    measurement = db.relationship("MeasurementModel", lazy="joined")
+    # Specifications and measurements are deleted by the database upon
+    # metric deletion, see delete_from_db
+    specification = db.relationship(
+        "SpecificationModel",
+        lazy="joined",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    # Measurements are loaded on access only, a metric can have
+    # measurements from every job
+    measurement = db.relationship(
+        "MeasurementModel",
+        lazy="select",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
     def __init__(
         self,
@@ -150,8 +179,17 @@ class MetricModel(db.Model):
         db.session.commit()
 
     def delete_from_db(self):
-        """Delete metric from the databse."""
-        db.session.delete(self)
+        """Delete metric from the databse.
+
+        The specifications, series states and change points of the metric
+        are deleted by the ``ON DELETE CASCADE`` foreign keys. The
+        measurements are deleted explicitly, a partitioned measurement
+        table has no foreign keys. The number of statements is constant.
+        """
+        delete_measurements(MeasurementModel.metric_id == self.id)
+        db.session.execute(
+            delete(MetricModel).where(MetricModel.id == self.id)
+        )
         db.session.commit()
 
 
@@ -179,7 +217,9 @@ class SpecificationModel(db.Model):
     type = db.Column(db.String(64))
 
     # Id of the metric this specification applies to
-    metric_id = db.Column(db.Integer, db.ForeignKey("metric.id"))
+    metric_id = db.Column(
+        db.Integer, db.ForeignKey("metric.id", ondelete="CASCADE")
+    )
 
     def __init__(
         self,
@@ -231,8 +271,9 @@ class EnvModel(db.Model):
     __tablename__ = "env"
 
     id = db.Column(db.Integer, primary_key=True)
-    # Name of the environment
-    name = db.Column(db.String(64), nullable=False)
+    # Name of the environment, unique so that concurrent ingests of the
+    # first job of an environment do not create it twice
+    name = db.Column(db.String(64), nullable=False, unique=True, index=True)
     # Environment display name
     display_name = db.Column(db.String(64), nullable=False)
 
@@ -280,7 +321,7 @@ class JobModel(db.Model):
     ci_dataset = db.Column(db.String(32), default=None)
     # Timestamp when the actual job object was created
     date_created = db.Column(
-        db.TIMESTAMP, nullable=False, server_default=now()
+        db.TIMESTAMP, nullable=False, server_default=now(), index=True
     )
     env = db.Column(JSON())
     meta = db.Column(JSON())
@@ -288,17 +329,32 @@ class JobModel(db.Model):
     # field is updated only after the job object is created
     s3_uri = db.Column(db.Unicode(255), default=None)
 
-    # Measurements are deleted upon job deletion
+    # Measurements are deleted upon job deletion, by the database
     measurements = db.relationship(
-        "MeasurementModel", lazy="joined", cascade="all, delete-orphan"
+        "MeasurementModel",
+        lazy="joined",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
-    # Packages are deleted upon job deletion
+    # Packages are deleted upon job deletion, by the database
     packages = db.relationship(
-        "PackageModel", lazy="joined", cascade="all, delete-orphan"
+        "PackageModel",
+        lazy="joined",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    # Change points are deleted upon job deletion, by the database, loaded
+    # on access only
+    change_points = db.relationship(
+        "ChangePointModel",
+        lazy="select",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
-    def __init__(self, env_id, env, meta):
+    def __init__(self, env_id, env, meta, etl_mode=None):
         self.env_id = env_id
         # FIXME: DM-14538 Remove ci_dataset from job model
         if "ci_dataset" in env:
@@ -307,7 +363,9 @@ class JobModel(db.Model):
             self.ci_dataset = env["dataset"]
         # Preserve date from the env metadata if SQUASH is running
         # in ETL mode
-        if SQUASH_ETL_MODE and "date" in env:
+        if etl_mode is None:
+            etl_mode = SQUASH_ETL_MODE
+        if etl_mode and "date" in env:
             self.date_created = datetime.strptime(
                 env["date"], "%Y-%m-%dT%H:%M:%SZ"
             )
@@ -352,11 +410,6 @@ class JobModel(db.Model):
         db.session.add(self)
         db.session.commit()
 
-    def delete_from_db(self):
-        """Delete job from database."""
-        db.session.delete(self)
-        db.session.commit()
-
 
 class PackageModel(db.Model):
     """A specific version of an eups package.
@@ -366,6 +419,15 @@ class PackageModel(db.Model):
 
     __tablename__ = "package"
 
+    # Packages of a job and history of the versions of a package, the
+    # job_id in the second index answers the history from the index alone
+    __table_args__ = (
+        db.Index("ix_package_name_job_id", "name", "job_id"),
+        db.Index(
+            "ix_package_name_git_sha_job_id", "name", "git_sha", "job_id"
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     # EUPS package name
     name = db.Column(db.String(64), nullable=False)
@@ -378,7 +440,7 @@ class PackageModel(db.Model):
     # EUPS build version
     eups_version = db.Column(db.String(64))
 
-    job_id = db.Column(db.Integer, db.ForeignKey("job.id"))
+    job_id = db.Column(db.Integer, db.ForeignKey("job.id", ondelete="CASCADE"))
 
     def __init__(
         self,
@@ -409,7 +471,7 @@ class PackageModel(db.Model):
     @classmethod
     def find_by_job_id(cls, job_id):
         """Find packages by job ID."""
-        return cls.query.filter_by(job_id=job_id).first()
+        return cls.query.filter_by(job_id=job_id).all()
 
     def save_to_db(self):
         """Save package to database."""
@@ -428,15 +490,45 @@ measurement_blob = db.Table(
     db.Column(
         "measurement_id",
         db.Integer,
-        db.ForeignKey("measurement.id"),
+        db.ForeignKey("measurement.id", ondelete="CASCADE"),
         primary_key=True,
     ),
     db.Column(
-        "blob_id", db.Integer, db.ForeignKey("blob.id"), primary_key=True
+        "blob_id",
+        db.Integer,
+        db.ForeignKey("blob.id", ondelete="CASCADE"),
+        primary_key=True,
     ),
 )
 
 
+def delete_measurements(*criteria):
+    """Delete the measurements matching criteria and their blob associations.
+
+    The changes are not committed.
+
+    Returns
+    -------
+    counts : `dict`
+        Number of rows deleted from the ``measurement_blob`` and
+        ``measurement`` tables.
+    """
+    measurement_ids = select(MeasurementModel.id).where(*criteria)
+    associations = db.session.execute(
+        delete(measurement_blob).where(
+            measurement_blob.c.measurement_id.in_(measurement_ids)
+        )
+    )
+    measurements = db.session.execute(
+        delete(MeasurementModel).where(*criteria),
+        execution_options={"synchronize_session": False},
+    )
+    return {
+        "measurement_blob": associations.rowcount,
+        "measurement": measurements.rowcount,
+    }
+
+
 class MeasurementModel(db.Model):
     """Database model for measurements.
 
@@ -445,6 +537,17 @@ class MeasurementModel(db.Model):
 
     __tablename__ = "measurement"
 
+    # Time series of a metric, see squash.series, and time windows of the
+    # measurements of a metric
+    __table_args__ = (
+        db.Index("ix_measurement_metric_id_job_id", "metric_id", "job_id"),
+        db.Index(
+            "ix_measurement_metric_id_date_created",
+            "metric_id",
+            "date_created",
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     # Measurement value
     value = db.Column(db.Float)
@@ -455,12 +558,26 @@ class MeasurementModel(db.Model):
     # An empty string means an unitless quantity.
     unit = db.Column(db.String(16), nullable=False)
 
-    metric_id = db.Column(db.Integer, db.ForeignKey("metric.id"))
+    metric_id = db.Column(
+        db.Integer, db.ForeignKey("metric.id", ondelete="CASCADE")
+    )
 
-    job_id = db.Column(db.Integer, db.ForeignKey("job.id"))
+    job_id = db.Column(
+        db.Integer, db.ForeignKey("job.id", ondelete="CASCADE"), index=True
+    )
 
+    # Creation date of the job, denormalized so that time windows are
+    # selected without joining the jobs. The table may be partitioned by
+    # this date, see squash.partitioning.
+    date_created = db.Column(db.TIMESTAMP)
+
+    # Blobs are loaded for all the measurements in a single query, the
+    # associations are deleted by the database
     blobs = db.relationship(
-        "BlobModel", secondary=measurement_blob, lazy="dynamic"
+        "BlobModel",
+        secondary=measurement_blob,
+        lazy="selectin",
+        passive_deletes=True,
     )
 
     def __init__(
@@ -556,3 +673,136 @@ class BlobModel(db.Model):
         """Delete blob from the database."""
         db.session.delete(self)
         db.session.commit()
+
+
+class SeriesStateModel(db.Model):
+    """Rolling statistics of a metric time series.
+
+    A series is the measurements of a metric for a dataset and a CI
+    pipeline. The state is updated by each new measurement, see
+    squash.detection.
+    """
+
+    __tablename__ = "series_state"
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "metric_id",
+            "dataset",
+            "ci_name",
+            name="uq_series_state_metric_id_dataset_ci_name",
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    metric_id = db.Column(
+        db.Integer,
+        db.ForeignKey("metric.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # Name of the dataset, empty if unknown
+    dataset = db.Column(db.String(32), nullable=False, default="")
+    # Name of the CI pipeline, empty if unknown
+    ci_name = db.Column(db.String(64), nullable=False, default="")
+    # Welford running mean and sum of squared deviations of the values
+    # since the last change point
+    count = db.Column(db.Integer, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=False, default=0.0)
+    m2 = db.Column(db.Float, nullable=False, default=0.0)
+    # Upper and lower CUSUM statistics
+    cusum_pos = db.Column(db.Float, nullable=False, default=0.0)
+    cusum_neg = db.Column(db.Float, nullable=False, default=0.0)
+    # Id of the last job that updated the state
+    last_job_id = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, metric_id, dataset="", ci_name=""):
+        self.metric_id = metric_id
+        self.dataset = dataset
+        self.ci_name = ci_name
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.cusum_pos = 0.0
+        self.cusum_neg = 0.0
+        self.last_job_id = 0
+
+
+class ChangePointModel(db.Model):
+    """Database model for the change points of the metric time series.
+
+    A change point flags the job whose measurement shifted the series mean,
+    see squash.detection.
+    """
+
+    __tablename__ = "change_point"
+
+    __table_args__ = (
+        db.Index(
+            "ix_change_point_metric_id_dataset_ci_name",
+            "metric_id",
+            "dataset",
+            "ci_name",
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(
+        db.Integer,
+        db.ForeignKey("job.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    metric_id = db.Column(
+        db.Integer,
+        db.ForeignKey("metric.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    dataset = db.Column(db.String(32), nullable=False, default="")
+    ci_name = db.Column(db.String(64), nullable=False, default="")
+    # Measurement value and the series mean and standard deviation
+    # before the change point
+    value = db.Column(db.Float, nullable=False)
+    mean = db.Column(db.Float, nullable=False)
+    std = db.Column(db.Float, nullable=False)
+    # Direction of the shift, up or down
+    direction = db.Column(db.String(8), nullable=False)
+    # CUSUM statistic that crossed the threshold
+    statistic = db.Column(db.Float, nullable=False)
+
+    metric = db.relationship("MetricModel", lazy="joined")
+
+    def __init__(
+        self,
+        job_id,
+        metric_id,
+        dataset,
+        ci_name,
+        value,
+        mean,
+        std,
+        direction,
+        statistic,
+    ):
+        self.job_id = job_id
+        self.metric_id = metric_id
+        self.dataset = dataset
+        self.ci_name = ci_name
+        self.value = value
+        self.mean = mean
+        self.std = std
+        self.direction = direction
+        self.statistic = statistic
+
+    def json(self):
+        """Return JSON serialized change point."""
+        return {
+            "job_id": self.job_id,
+            "metric": self.metric.name,
+            "dataset": self.dataset,
+            "ci_name": self.ci_name,
+            "value": self.value,
+            "mean": self.mean,
+            "std": self.std,
+            "direction": self.direction,
+            "statistic": self.statistic,
+        }
@@ -0,0 +1,221 @@
+"""Implement the monthly partitioning of the measurement table.
+
+The measurement table can be partitioned by range of the job date copied to
+the measurements, one partition per month, so that the queries on a time
+window read only the partitions of the window. Partitioning is optional,
+the models and the queries work on a partitioned or a regular table.
+
+MySQL partitioned tables have no foreign keys and the partitioning column
+must be part of the primary key. Partitioning an existing table drops the
+foreign keys of the measurements and of their blob associations, the
+measurements are then deleted explicitly with their jobs and metrics, see
+`squash.models.delete_measurements`. The primary key becomes
+``(id, date_created)``.
+
+`partition` converts the table the first time it runs, then adds the
+partitions of the coming months. The last partition, ``pmax``, holds the
+measurements after the last month and is split as new months are added.
+"""
+
+__all__ = ["partitions", "partition_statements", "partition"]
+
+import calendar
+from datetime import datetime
+
+from sqlalchemy import MetaData, Table, func, text
+from sqlalchemy.schema import DropConstraint
+
+from .models import MeasurementModel, db
+
+# Name of the partition of the measurements after the last month
+LAST_PARTITION = "pmax"
+
+
+def _check_dialect():
+    if db.engine.dialect.name != "mysql":
+        raise RuntimeError("Partitioning requires a MySQL database.")
+
+
+def partitions(table="measurement"):
+    """Return the partitions of a table.
+
+    Must be called within the app context.
+
+    Returns
+    -------
+    partitions : `list` [`str`]
+        Names of the partitions in order, empty if the table is not
+        partitioned.
+    """
+    _check_dialect()
+    rows = db.session.execute(
+        text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table "
+            "AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        ),
+        {"table": table},
+    )
+    return [name for name, in rows]
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _months(first, last):
+    """Return the (year, month) from the month of first to last."""
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = _next_month(year, month)
+    return months
+
+
+def _partition(year, month):
+    """Return the definition of the partition of a month."""
+    end = calendar.timegm(datetime(*_next_month(year, month), 1).timetuple())
+    return f"PARTITION p{year:04d}{month:02d} VALUES LESS THAN ({end})"
+
+
+def _last_month(names):
+    """Return the (year, month) of the last monthly partition."""
+    months = [
+        (int(name[1:5]), int(name[5:7]))
+        for name in names
+        if name != LAST_PARTITION
+    ]
+    return max(months, default=None)
+
+
+def partition_statements(months_ahead=3, now=None):
+    """Return the statements that partition the measurement table.
+
+    Must be called within the app context.
+
+    Parameters
+    ----------
+    months_ahead : `int`
+        Number of months after the current month to create partitions for.
+    now : `datetime.datetime`, optional
+        The current UTC time, by default the current time.
+
+    Returns
+    -------
+    statements : `list`
+        DDL statements, the table is converted if it is not partitioned.
+
+    Raises
+    ------
+    RuntimeError
+        If the database is not MySQL or some measurements have no date, run
+        ``squash upgrade-db`` first.
+    """
+    now = now or datetime.utcnow()
+    year, month = now.year, now.month
+    for _ in range(months_ahead):
+        year, month = _next_month(year, month)
+    until = datetime(year, month, 1)
+
+    names = partitions()
+    table = MeasurementModel.__table__
+    if names:
+        last = _last_month(names)
+        if last is None:
+            months = _months(now, until)
+        else:
+            months = _months(datetime(*_next_month(*last), 1), until)
+        if not months:
+            return []
+        definitions = [_partition(*m) for m in months] + [
+            f"PARTITION {LAST_PARTITION} VALUES LESS THAN MAXVALUE"
+        ]
+        return [
+            text(
+                f"ALTER TABLE {table.name} REORGANIZE PARTITION "
+                f"{LAST_PARTITION} INTO ({', '.join(definitions)})"
+            )
+        ]
+
+    missing = (
+        db.session.query(MeasurementModel.id)
+        .filter(MeasurementModel.date_created.is_(None))
+        .first()
+    )
+    if missing is not None:
+        raise RuntimeError(
+            "Some measurements have no date, run squash upgrade-db first."
+        )
+    first = (
+        db.session.query(func.min(MeasurementModel.date_created)).scalar()
+        or now
+    )
+
+    # Foreign keys to the measurements and of the measurements
+    reflected = MetaData()
+    associations = Table(
+        "measurement_blob", reflected, autoload_with=db.engine
+    )
+    measurements = Table(table.name, reflected, autoload_with=db.engine)
+    statements = [
+        DropConstraint(fk)
+        for fk in associations.foreign_key_constraints
+        if fk.referred_table is measurements
+    ]
+    statements.extend(
+        DropConstraint(fk) for fk in measurements.foreign_key_constraints
+    )
+
+    definitions = [_partition(*m) for m in _months(first, until)] + [
+        f"PARTITION {LAST_PARTITION} VALUES LESS THAN MAXVALUE"
+    ]
+    statements.append(
+        text(
+            f"ALTER TABLE {table.name} MODIFY date_created TIMESTAMP "
+            "NOT NULL DEFAULT CURRENT_TIMESTAMP"
+        )
+    )
+    statements.append(
+        text(
+            f"ALTER TABLE {table.name} DROP PRIMARY KEY, "
+            "ADD PRIMARY KEY (id, date_created) "
+            "PARTITION BY RANGE (UNIX_TIMESTAMP(date_created)) "
+            f"({', '.join(definitions)})"
+        )
+    )
+    return statements
+
+
+def partition(months_ahead=3, now=None, dry_run=False):
+    """Partition the measurement table or add the partitions of new months.
+
+    Must be called within the app context. Converting the table copies
+    every measurement and locks the table, adding months only splits the
+    last partition, which is empty unless measurements are dated in the
+    future.
+
+    Parameters
+    ----------
+    months_ahead : `int`
+        Number of months after the current month to create partitions for.
+    now : `datetime.datetime`, optional
+        The current UTC time, by default the current time.
+    dry_run : `bool`
+        If `True`, only return the statements.
+
+    Returns
+    -------
+    statements : `list` [`str`]
+        The SQL statements executed.
+    """
+    statements = partition_statements(months_ahead, now)
+    sql = [str(s.compile(dialect=db.engine.dialect)) for s in statements]
+    if not dry_run:
+        # DDL statements are committed implicitly by MySQL
+        db.session.commit()
+        with db.engine.begin() as connection:
+            for statement in statements:
+                connection.execute(statement)
+    return sql
@@ -0,0 +1,128 @@
+"""Implement the connection pools of the database engines.
+
+The pools are configured with ``SQLALCHEMY_ENGINE_OPTIONS``, see
+``squash.config``: size, overflow, timeout, recycle and pre-ping. Pre-ping
+and a recycle time shorter than the idle timeout of the cloudsql-proxy
+replace the connections closed by a proxy restart before they are used.
+
+The uwsgi master process creates the app, and thus the engines, before it
+forks the workers. The connections opened by the master must not be shared
+by the workers, each worker discards the pools inherited from the master
+after the fork and opens its own connections.
+
+The open and checked out connections, the time to check out a connection
+and the checkout timeouts of each pool are exposed by the ``/monitor``
+endpoint.
+"""
+
+__all__ = ["InstrumentedQueuePool", "Pool", "pool", "PRIMARY"]
+
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+from .instrumentation import (
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_CONNECTIONS,
+    DB_POOL_TIMEOUTS,
+    DB_POOL_WAIT,
+)
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:  # pragma: no cover
+    postfork = None
+
+# Name of the primary bind in the metrics
+PRIMARY = "primary"
+
+
+class InstrumentedQueuePool(QueuePool):
+    """Queue pool that records the time to check out a connection.
+
+    The ``bind`` attribute, the name of the bind in the metrics, is set by
+    `Pool.init_app`.
+    """
+
+    bind = PRIMARY
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.labels(bind=self.bind).inc()
+            raise
+        DB_POOL_WAIT.labels(bind=self.bind).observe(
+            time.perf_counter() - start
+        )
+        return record
+
+    def recreate(self):
+        """Return a new pool with the same configuration and bind name."""
+        pool = super().recreate()
+        pool.bind = self.bind
+        return pool
+
+
+class Pool:
+    """Instrument the connection pools and recreate them after a fork.
+
+    Follows the Flask extension pattern, create the `Pool` object once and
+    call `init_app` for each app instance, after the database is
+    initialized.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Instrument the pools of the engines of the app."""
+        with app.app_context():
+            engines = app.extensions["sqlalchemy"].engines
+            for key, engine in engines.items():
+                self._instrument(engine, key or PRIMARY)
+
+        if postfork is not None:
+            postfork(lambda: self.dispose(app))
+
+    @staticmethod
+    def _instrument(engine, name):
+        """Record the connections of the pool of an engine."""
+        if isinstance(engine.pool, InstrumentedQueuePool):
+            engine.pool.bind = name
+
+        def connect(dbapi_connection, connection_record):
+            DB_POOL_CONNECTIONS.labels(bind=name).inc()
+
+        def close(dbapi_connection, connection_record):
+            DB_POOL_CONNECTIONS.labels(bind=name).dec()
+
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            DB_POOL_CHECKED_OUT.labels(bind=name).inc()
+
+        def checkin(dbapi_connection, connection_record):
+            DB_POOL_CHECKED_OUT.labels(bind=name).dec()
+
+        event.listen(engine, "connect", connect)
+        event.listen(engine, "close", close)
+        event.listen(engine, "checkout", checkout)
+        event.listen(engine, "checkin", checkin)
+
+    @staticmethod
+    def dispose(app):
+        """Discard the pools inherited from the parent process.
+
+        Call in the child process after a fork. The connections of the
+        parent are left open for the parent, new connections are opened by
+        the child on demand.
+        """
+        with app.app_context():
+            for engine in app.extensions["sqlalchemy"].engines.values():
+                engine.dispose(close=False)
+
+
+# Initialize extension
+pool = Pool()
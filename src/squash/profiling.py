@@ -0,0 +1,183 @@
+"""Implement on-demand profiling of API requests.
+
+Admins can profile a single request by adding the ``profile`` query
+parameter, or the ``X-Squash-Profile`` header, set to one of:
+
+``cprofile``
+    Deterministic profile of the request with `cProfile`, in the `pstats`
+    format.
+``sample``
+    Sample the stack of the request thread every ``SQUASH_PROFILE_INTERVAL``
+    seconds, in the collapsed stack format read by ``flamegraph.pl`` and
+    speedscope. Lower overhead than ``cprofile``.
+
+If ``SQUASH_PROFILE_DIR`` is set the profile is saved to that directory and
+the file name is returned in the ``X-Squash-Profile-File`` response header,
+otherwise the profile is returned in place of the response body.
+
+The request hooks are registered only if ``SQUASH_PROFILING`` is set, normal
+requests pay no overhead when profiling is disabled.
+"""
+
+__all__ = ["Profiler", "profiler", "StackSampler"]
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+
+from flask import abort, current_app, g, request
+from flask_jwt import _jwt_required, current_identity
+
+PROFILERS = ("cprofile", "sample")
+
+
+class StackSampler:
+    """Sample the stack of a thread at regular intervals.
+
+    Parameters
+    ----------
+    thread_id : `int`
+        Identifier of the thread to sample.
+    interval : `float`
+        Sampling interval in seconds.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        """Start sampling."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def collapsed(self):
+        """Return the samples in the collapsed stack format."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.items()
+        )
+
+
+def require_admin():
+    """Abort the request unless it is authenticated as the admin user."""
+    _jwt_required(current_app.config["JWT_DEFAULT_REALM"])
+    if current_identity.username != current_app.config["DEFAULT_USER"]:
+        abort(403, "Profiling is restricted to the admin user.")
+
+
+class Profiler:
+    """Profile requests on demand.
+
+    Follows the Flask extension pattern, create the `Profiler` object once
+    and call `init_app` for each app instance.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the request hooks if profiling is enabled."""
+        if not app.config.get("SQUASH_PROFILING"):
+            return
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.stop)
+
+    @staticmethod
+    def start():
+        """Start profiling the request if requested."""
+        mode = request.args.get("profile") or request.headers.get(
+            "X-Squash-Profile"
+        )
+        if not mode:
+            return
+        if mode not in PROFILERS:
+            abort(400, f"Profiler must be one of {', '.join(PROFILERS)}.")
+
+        require_admin()
+
+        if mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+        else:
+            profile = StackSampler(
+                threading.get_ident(),
+                current_app.config["SQUASH_PROFILE_INTERVAL"],
+            )
+            profile.start()
+        g.squash_profile = (mode, profile)
+
+    @staticmethod
+    def stop(exc=None):
+        """Stop profiling the request."""
+        mode, profile = g.pop("squash_profile", (None, None))
+        if mode == "cprofile":
+            profile.disable()
+        elif mode == "sample":
+            profile.stop()
+        return mode, profile
+
+    def finish(self, response):
+        """Save the profile or return it in place of the response."""
+        mode, profile = self.stop()
+        if mode is None:
+            return response
+
+        directory = current_app.config.get("SQUASH_PROFILE_DIR")
+        if directory:
+            timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+            extension = "prof" if mode == "cprofile" else "txt"
+            filename = f"{timestamp}-{request.endpoint}-{mode}.{extension}"
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, filename)
+            if mode == "cprofile":
+                profile.dump_stats(path)
+            else:
+                with open(path, "w") as f:
+                    f.write(profile.collapsed())
+            response.headers["X-Squash-Profile-File"] = filename
+            return response
+
+        if mode == "cprofile":
+            stream = io.StringIO()
+            stats = pstats.Stats(profile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(
+                current_app.config["SQUASH_PROFILE_INLINE_LIMIT"]
+            )
+            data = stream.getvalue()
+        else:
+            data = profile.collapsed()
+
+        return current_app.response_class(data, mimetype="text/plain")
+
+
+# Initialize extension
+profiler = Profiler()
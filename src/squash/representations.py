@@ -0,0 +1,83 @@
+"""Implement the JSON representation of the API responses.
+
+Job documents and the measurement lists can be several megabytes, encode them
+with orjson when available, falling back to the standard library json module
+otherwise.
+
+The standard library encodes non-finite floats as ``NaN``, ``Infinity`` and
+``-Infinity`` while orjson encodes them as ``null``. To preserve the API
+output, documents with non-finite values are always encoded with the standard
+library.
+"""
+
+__all__ = ["dumps", "has_non_finite", "output_json"]
+
+import json
+import math
+
+from flask import make_response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def has_non_finite(obj):
+    """Check if a document has non-finite float values.
+
+    Parameters
+    ----------
+    obj : `object`
+        A JSON serializable object.
+
+    Returns
+    -------
+    result : `bool`
+        `True` if the document contains NaN or infinite values.
+    """
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, float):
+            if not math.isfinite(item):
+                return True
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return False
+
+
+def dumps(obj):
+    """Serialize an object to JSON.
+
+    Parameters
+    ----------
+    obj : `object`
+        A JSON serializable object.
+
+    Returns
+    -------
+    data : `bytes`
+        The UTF-8 encoded JSON document.
+    """
+    if orjson is not None and not has_non_finite(obj):
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # e.g. integers larger than 64 bits or non-str keys,
+            # let the standard library handle them
+            pass
+    return json.dumps(obj).encode()
+
+
+def output_json(data, code, headers=None):
+    """Make a Flask response with a JSON encoded body.
+
+    Replace the default flask-restful JSON representation.
+    """
+    resp = make_response(dumps(data) + b"\n", code)
+    resp.headers.extend(headers or {})
+    resp.mimetype = "application/json"
+    return resp
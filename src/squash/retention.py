@@ -0,0 +1,332 @@
+"""Implement the retention of the jobs.
+
+A retention policy selects the jobs of an env, a CI pipeline and a dataset
+and keeps the jobs created in the last ``keep_days`` days or the last
+``keep_runs`` jobs, whichever keeps more. The other jobs are purged: they are
+optionally archived with `squash.transfer.archive_jobs`, then deleted with
+set-based DELETE statements and the ``ON DELETE CASCADE`` foreign keys, in
+batches of jobs committed separately so that locks are held briefly. The ORM
+cascades are not used, they would load every measurement and package of the
+jobs into the session.
+"""
+
+__all__ = ["RetentionPolicy", "plan", "delete_jobs", "purge"]
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, func, or_, select
+
+from .models import (
+    BlobModel,
+    EnvModel,
+    JobModel,
+    MeasurementModel,
+    db,
+    delete_measurements,
+    measurement_blob,
+)
+from .transfer import archive_jobs
+
+
+def _check_count(name, value, minimum):
+    """Raise `ValueError` if a setting is not an integer >= ``minimum``."""
+    if value is None:
+        return
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{name} must be an integer.")
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}.")
+
+
+class RetentionPolicy:
+    """Select the jobs to purge.
+
+    Parameters
+    ----------
+    env_name : `str`, optional
+        Apply to the jobs of this env, e.g. ``jenkins``.
+    ci_name : `str`, optional
+        Apply to the jobs of this CI pipeline.
+    dataset : `str`, optional
+        Apply to the jobs of this dataset.
+    keep_days : `int`, optional
+        Keep the jobs created in the last days, 0 to keep none.
+    keep_runs : `int`, optional
+        Keep this number of most recent jobs, at least 1.
+
+    Raises
+    ------
+    ValueError
+        If neither ``keep_days`` nor ``keep_runs`` is set, or if they are
+        not integers in range.
+    """
+
+    def __init__(
+        self,
+        env_name=None,
+        ci_name=None,
+        dataset=None,
+        keep_days=None,
+        keep_runs=None,
+    ):
+        if keep_days is None and keep_runs is None:
+            raise ValueError("A policy must set keep_days or keep_runs.")
+        _check_count("keep_days", keep_days, 0)
+        _check_count("keep_runs", keep_runs, 1)
+        self.env_name = env_name
+        self.ci_name = ci_name
+        self.dataset = dataset
+        self.keep_days = keep_days
+        self.keep_runs = keep_runs
+
+    @classmethod
+    def from_dict(cls, policy):
+        """Create a policy from its JSON representation.
+
+        Raises
+        ------
+        ValueError
+            If the policy is invalid.
+        """
+        if not isinstance(policy, dict):
+            raise ValueError("A policy must be an object.")
+        try:
+            return cls(**policy)
+        except TypeError as err:
+            raise ValueError(f"Invalid policy. {err}")
+
+    def json(self):
+        """Return JSON serialized policy."""
+        return {
+            "env_name": self.env_name,
+            "ci_name": self.ci_name,
+            "dataset": self.dataset,
+            "keep_days": self.keep_days,
+            "keep_runs": self.keep_runs,
+        }
+
+    def _jobs(self, *columns):
+        """Return the query for the jobs the policy applies to."""
+        query = db.session.query(*columns)
+        if self.env_name is not None:
+            query = query.join(EnvModel, JobModel.env_id == EnvModel.id)
+            query = query.filter(EnvModel.name == self.env_name)
+        if self.ci_name is not None:
+            query = query.filter(
+                JobModel.env["ci_name"].as_string() == self.ci_name
+            )
+        if self.dataset is not None:
+            query = query.filter(JobModel.ci_dataset == self.dataset)
+        return query
+
+    def select(self, now=None):
+        """Return the IDs of the jobs to purge.
+
+        Parameters
+        ----------
+        now : `datetime.datetime`, optional
+            Reference time of ``keep_days``, by default the current UTC
+            time.
+
+        Returns
+        -------
+        job_ids : `list` [`int`]
+            IDs of the jobs to purge, sorted.
+        """
+        query = self._jobs(JobModel.id)
+
+        if self.keep_days is not None:
+            now = now or datetime.utcnow()
+            cutoff = now - timedelta(days=self.keep_days)
+            query = query.filter(JobModel.date_created < cutoff)
+
+        if self.keep_runs is not None:
+            # The oldest job kept, jobs are ordered by date then id
+            last = (
+                self._jobs(JobModel.date_created, JobModel.id)
+                .order_by(JobModel.date_created.desc(), JobModel.id.desc())
+                .offset(self.keep_runs - 1)
+                .first()
+            )
+            if last is None:
+                return []
+            date_created, job_id = last
+            query = query.filter(
+                or_(
+                    JobModel.date_created < date_created,
+                    and_(
+                        JobModel.date_created == date_created,
+                        JobModel.id < job_id,
+                    ),
+                )
+            )
+
+        return [job_id for job_id, in query.order_by(JobModel.id)]
+
+
+def _batches(job_ids, batch_size):
+    for i in range(0, len(job_ids), batch_size):
+        yield job_ids[i : i + batch_size]
+
+
+def _format_date(date):
+    if date is None:
+        return None
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def plan(policies, now=None, batch_size=1000):
+    """Report the jobs that the policies would purge.
+
+    Parameters
+    ----------
+    policies : `list` [`RetentionPolicy`]
+        The retention policies.
+    now : `datetime.datetime`, optional
+        Reference time of the policies, by default the current UTC time.
+    batch_size : `int`
+        Number of jobs per counting query.
+
+    Returns
+    -------
+    job_ids : `list` [`int`]
+        IDs of the jobs to purge, selected by any policy, sorted.
+    report : `list` [`dict`]
+        For each policy, the number of jobs and measurements to purge and
+        the creation dates of the oldest and newest of these jobs.
+    """
+    now = now or datetime.utcnow()
+    selected = set()
+    report = []
+    for policy in policies:
+        job_ids = policy.select(now)
+        selected.update(job_ids)
+
+        measurements = 0
+        first, last = None, None
+        for batch in _batches(job_ids, batch_size):
+            measurements += (
+                db.session.query(func.count(MeasurementModel.id))
+                .filter(MeasurementModel.job_id.in_(batch))
+                .scalar()
+            )
+            batch_first, batch_last = (
+                db.session.query(
+                    func.min(JobModel.date_created),
+                    func.max(JobModel.date_created),
+                )
+                .filter(JobModel.id.in_(batch))
+                .one()
+            )
+            first = min(filter(None, [first, batch_first]), default=None)
+            last = max(filter(None, [last, batch_last]), default=None)
+
+        report.append(
+            {
+                "policy": policy.json(),
+                "jobs": len(job_ids),
+                "measurements": measurements,
+                "first_date": _format_date(first),
+                "last_date": _format_date(last),
+            }
+        )
+    return sorted(selected), report
+
+
+def delete_jobs(job_ids):
+    """Delete jobs and their rows with set-based DELETE statements.
+
+    The measurements are deleted with `squash.models.delete_measurements`,
+    the packages and change points of the jobs by the ``ON DELETE CASCADE``
+    foreign keys. The blobs of the jobs not referenced by the measurements
+    of other jobs are deleted. The changes are committed.
+
+    Parameters
+    ----------
+    job_ids : `list` [`int`]
+        IDs of the jobs.
+
+    Returns
+    -------
+    counts : `dict`
+        Number of rows deleted per table, except the rows deleted by the
+        cascades.
+    """
+    measurement_ids = select(MeasurementModel.id).where(
+        MeasurementModel.job_id.in_(job_ids)
+    )
+    try:
+        blob_ids = (
+            db.session.execute(
+                select(measurement_blob.c.blob_id)
+                .where(measurement_blob.c.measurement_id.in_(measurement_ids))
+                .distinct()
+            )
+            .scalars()
+            .all()
+        )
+        counts = delete_measurements(MeasurementModel.job_id.in_(job_ids))
+        statements = [
+            (
+                "blob",
+                delete(BlobModel).where(
+                    BlobModel.id.in_(blob_ids),
+                    ~exists().where(
+                        measurement_blob.c.blob_id == BlobModel.id
+                    ),
+                ),
+            ),
+            ("job", delete(JobModel).where(JobModel.id.in_(job_ids))),
+        ]
+        for name, statement in statements:
+            result = db.session.execute(
+                statement, execution_options={"synchronize_session": False}
+            )
+            counts[name] = result.rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return counts
+
+
+def purge(
+    job_ids, batch_size=100, archive_dir=None, output="ndjson", progress=None
+):
+    """Archive and delete jobs in batches.
+
+    Must be called within the app context.
+
+    Parameters
+    ----------
+    job_ids : `list` [`int`]
+        IDs of the jobs.
+    batch_size : `int`
+        Number of jobs deleted per transaction.
+    archive_dir : `str`, optional
+        Archive the jobs to this directory before deleting them, see
+        `squash.transfer.archive_jobs`.
+    output : `str`
+        Format of the archive files.
+    progress : `callable`, optional
+        Called as ``progress(deleted, total)`` after each batch.
+
+    Returns
+    -------
+    counts : `dict`
+        Number of rows deleted per table, and of jobs archived.
+    """
+    counts = {"archived": 0}
+    job_ids = sorted(job_ids)
+    deleted = 0
+    for batch in _batches(job_ids, batch_size):
+        if archive_dir is not None:
+            counts["archived"] += archive_jobs(archive_dir, batch, output)[
+                "job"
+            ]
+        for name, count in delete_jobs(batch).items():
+            counts[name] = counts.get(name, 0) + count
+        deleted += len(batch)
+        if progress is not None:
+            progress(deleted, len(job_ids))
+    return counts
@@ -0,0 +1,184 @@
+"""Implement the routing of the database reads to read replicas.
+
+The SELECT statements of the GET and HEAD requests are executed on a read
+replica, chosen at random among the binds listed in
+``SQUASH_DB_READ_BINDS``, e.g. the ``replica0`` bind of
+``SQLALCHEMY_BINDS``. The other statements, and all the statements of the
+other requests and of the Celery tasks, are executed on the primary
+database.
+
+A client reads its own writes: a successful write request sets a cookie
+that routes the requests of the client to the primary for
+``SQUASH_DB_STICKY_SECONDS``. Clients that do not keep cookies can set the
+``X-Squash-Read-Primary`` header instead.
+
+The replica connections are checked by the pool pre-ping when they are
+checked out. A replica that cannot be connected to, or that raised a
+connection error, is not used for ``SQUASH_DB_REPLICA_RETRY`` seconds, the
+reads of the following requests fall back to the primary. The read that
+failed is not retried, its request fails. The reads routed to each replica
+and the replica failures are exposed by the ``/monitor`` endpoint.
+"""
+
+__all__ = [
+    "Routing",
+    "RoutingSession",
+    "routing",
+    "READ_PRIMARY_HEADER",
+    "STICKY_COOKIE",
+]
+
+import random
+import time
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from .instrumentation import DB_REPLICA_FAILURES, DB_REPLICA_READS
+
+# Request header that routes the reads of a request to the primary
+READ_PRIMARY_HEADER = "X-Squash-Read-Primary"
+
+# Cookie set by write requests to route the reads of the client to the
+# primary
+STICKY_COOKIE = "squash_read_primary"
+
+
+def _is_read(clause):
+    """Return `True` if a statement can run on a read replica."""
+    return (
+        clause is not None
+        and getattr(clause, "is_select", False)
+        and getattr(clause, "_for_update_arg", None) is None
+    )
+
+
+class RoutingSession(Session):
+    """Session that executes the reads of read-only requests on replicas."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Select the engine of a statement.
+
+        The reads of a read-only request are executed on the replica chosen
+        for the request, the other statements on the bind of the model,
+        see `flask_sqlalchemy.session.Session.get_bind`.
+        """
+        if bind is None and not self._flushing and _is_read(clause):
+            engine = routing.read_engine(self._db.engines)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+class Routing:
+    """Route the reads of the read-only requests to read replicas.
+
+    Follows the Flask extension pattern, create the `Routing` object once
+    and call `init_app` for each app instance, after the database is
+    initialized.
+    """
+
+    def __init__(self, app=None):
+        self.binds = []
+        self.sticky_seconds = 0
+        self.retry = 30
+        # Monotonic time until which a failed bind is not used
+        self._failed = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the request hooks and the replica error handlers."""
+        app.config.setdefault("SQUASH_DB_READ_BINDS", [])
+        app.config.setdefault("SQUASH_DB_STICKY_SECONDS", 0)
+        app.config.setdefault("SQUASH_DB_REPLICA_RETRY", 30)
+        self.binds = list(app.config["SQUASH_DB_READ_BINDS"])
+        self.sticky_seconds = app.config["SQUASH_DB_STICKY_SECONDS"]
+        self.retry = app.config["SQUASH_DB_REPLICA_RETRY"]
+
+        with app.app_context():
+            engines = app.extensions["sqlalchemy"].engines
+            for key in self.binds:
+                event.listen(engines[key], "handle_error", self._on_error(key))
+
+        app.before_request(self.choose_bind)
+        app.after_request(self.stick)
+
+    def _on_error(self, key):
+        def handle_error(context):
+            if isinstance(context.sqlalchemy_exception, OperationalError):
+                self.fail(key)
+
+        return handle_error
+
+    def fail(self, key):
+        """Do not use a bind for ``SQUASH_DB_REPLICA_RETRY`` seconds."""
+        now = time.monotonic()
+        if self._failed.get(key, 0) <= now:
+            DB_REPLICA_FAILURES.labels(bind=key).inc()
+        self._failed[key] = now + self.retry
+
+    def available(self):
+        """Return the read binds that did not fail recently."""
+        now = time.monotonic()
+        return [key for key in self.binds if self._failed.get(key, 0) <= now]
+
+    def choose_bind(self):
+        """Choose the read replica of the request, if it is read-only.
+
+        The reads of the write requests, and of the requests of a client
+        that wrote recently, are executed on the primary.
+        """
+        g.squash_read_bind = None
+        if request.method not in ["GET", "HEAD"]:
+            return
+        if request.cookies.get(STICKY_COOKIE) or request.headers.get(
+            READ_PRIMARY_HEADER
+        ):
+            return
+        binds = self.available()
+        if binds:
+            g.squash_read_bind = random.choice(binds)
+
+    def stick(self, response):
+        """Route the reads of a client to the primary after a write."""
+        if (
+            self.sticky_seconds
+            and request.method not in ["GET", "HEAD", "OPTIONS"]
+            and response.status_code < 400
+        ):
+            response.set_cookie(
+                STICKY_COOKIE,
+                "1",
+                max_age=self.sticky_seconds,
+                httponly=True,
+            )
+        return response
+
+    def read_engine(self, engines):
+        """Return the engine of the reads of the request.
+
+        Returns
+        -------
+        engine : `sqlalchemy.engine.Engine` or `None`
+            The replica engine, `None` to read from the primary.
+        """
+        if not has_request_context():
+            return None
+        key = g.get("squash_read_bind")
+        if key is None:
+            return None
+
+        # The replica failed recently, in this request or another one
+        if self._failed.get(key, 0) > time.monotonic():
+            g.squash_read_bind = None
+            return None
+
+        DB_REPLICA_READS.labels(bind=key).inc()
+        return engines[key]
+
+
+# Initialize extension
+routing = Routing()
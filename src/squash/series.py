@@ -0,0 +1,221 @@
+"""Implement the time series of the measurements of a metric.
+
+The series is read with a single query joining measurement and job, and
+returned as parallel columns: timestamps, values, job ids and units. Besides
+JSON, the columns can be encoded as a NumPy ``.npy`` structured array or as
+an Arrow IPC stream, if pyarrow is installed.
+"""
+
+__all__ = [
+    "FORMATS",
+    "SeriesQuery",
+    "to_json",
+    "to_npy",
+    "to_arrow",
+    "to_parquet",
+]
+
+import io
+
+import numpy as np
+
+from .models import JobModel, MeasurementModel, db
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# Supported output formats and their content type
+FORMATS = {
+    "json": "application/json",
+    "npy": "application/octet-stream",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+class SeriesQuery:
+    """Query the time series of a metric.
+
+    Parameters
+    ----------
+    metric_id : `int`
+        ID of the metric.
+    dataset : `str`, optional
+        Name of the dataset, e.g. ``HSC``.
+    ci_name : `str`, optional
+        Name of the CI pipeline that ran the jobs.
+    filter_name : `str`, optional
+        Name of the filter (band), e.g. ``r``.
+    start : `datetime.datetime`, optional
+        Include jobs created at this time or later.
+    end : `datetime.datetime`, optional
+        Include jobs created before this time.
+    """
+
+    def __init__(
+        self,
+        metric_id,
+        dataset=None,
+        ci_name=None,
+        filter_name=None,
+        start=None,
+        end=None,
+    ):
+        self.metric_id = metric_id
+        self.dataset = dataset
+        self.ci_name = ci_name
+        self.filter_name = filter_name
+        self.start = start
+        self.end = end
+
+    def query(self):
+        """Return the query for the series ordered by time.
+
+        The time window is selected on the job date copied to the
+        measurements, with the ``(metric_id, date_created)`` index.
+        """
+        query = (
+            db.session.query(
+                MeasurementModel.date_created,
+                MeasurementModel.value,
+                MeasurementModel.job_id,
+                MeasurementModel.unit,
+            )
+            .join(JobModel, MeasurementModel.job_id == JobModel.id)
+            .filter(MeasurementModel.metric_id == self.metric_id)
+        )
+        if self.dataset is not None:
+            query = query.filter(JobModel.ci_dataset == self.dataset)
+        if self.ci_name is not None:
+            query = query.filter(
+                JobModel.env["ci_name"].as_string() == self.ci_name
+            )
+        if self.filter_name is not None:
+            query = query.filter(
+                JobModel.meta["filter_name"].as_string() == self.filter_name
+            )
+        if self.start is not None:
+            query = query.filter(MeasurementModel.date_created >= self.start)
+        if self.end is not None:
+            query = query.filter(MeasurementModel.date_created < self.end)
+
+        return query.order_by(
+            MeasurementModel.date_created, MeasurementModel.job_id
+        )
+
+    def columns(self):
+        """Run the query and return the series columns.
+
+        Returns
+        -------
+        columns : `dict` [`str`, `numpy.ndarray`]
+            ``timestamps`` (datetime64[s]), ``values`` (float64, NaN for
+            missing values), ``job_ids`` (int64) and ``units`` (str).
+        """
+        rows = self.query().all()
+        timestamps, values, job_ids, units = (
+            zip(*rows) if rows else ([], [], [], [])
+        )
+        return {
+            "timestamps": np.array(timestamps, dtype="datetime64[s]"),
+            "values": np.array(
+                [np.nan if v is None else v for v in values], dtype="f8"
+            ),
+            "job_ids": np.array(job_ids, dtype="i8"),
+            "units": np.array(units, dtype="U"),
+        }
+
+
+def to_json(columns):
+    """Return the series columns as JSON serializable lists.
+
+    Timestamps are formatted in ISO 8601, missing values are `None`.
+    """
+    output = {}
+    for name, column in columns.items():
+        if column.dtype.kind == "M":
+            output[name] = np.datetime_as_string(
+                column, unit="s", timezone="UTC"
+            ).tolist()
+        elif column.dtype.kind == "f":
+            output[name] = [
+                None if missing else value
+                for value, missing in zip(column.tolist(), np.isnan(column))
+            ]
+        else:
+            output[name] = column.tolist()
+    return output
+
+
+def to_npy(columns):
+    """Return the series columns as a NumPy structured array in npy format.
+
+    The fields of the array are named after the columns. Read it with
+    ``numpy.load(io.BytesIO(data))``.
+    """
+    dtype = [
+        # An empty string column has no itemsize
+        (name, "U1" if column.dtype == np.dtype("U") else column.dtype)
+        for name, column in columns.items()
+    ]
+    size = len(next(iter(columns.values()), []))
+    array = np.empty(size, dtype=dtype)
+    for name, column in columns.items():
+        array[name] = column
+
+    f = io.BytesIO()
+    np.save(f, array, allow_pickle=False)
+    return f.getvalue()
+
+
+def _arrow_table(columns):
+    """Return the columns as an Arrow table, missing values are null."""
+    if pyarrow is None:
+        raise RuntimeError("The arrow and parquet formats require pyarrow.")
+
+    arrays = {}
+    for name, column in columns.items():
+        if column.dtype.kind == "U":
+            arrays[name] = pyarrow.array(column.tolist(), pyarrow.string())
+        else:
+            arrays[name] = pyarrow.array(
+                column, from_pandas=column.dtype.kind == "f"
+            )
+    return pyarrow.table(arrays)
+
+
+def to_arrow(columns):
+    """Return the series columns as an Arrow IPC stream.
+
+    Read it with ``pyarrow.ipc.open_stream(data).read_all()``, missing values
+    are null.
+
+    Raises
+    ------
+    RuntimeError
+        If pyarrow is not installed.
+    """
+    table = _arrow_table(columns)
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def to_parquet(columns):
+    """Return the series columns as a compressed Parquet file.
+
+    Read it with ``pyarrow.parquet.read_table(io.BytesIO(data))`` or
+    ``pandas.read_parquet``, missing values are null.
+
+    Raises
+    ------
+    RuntimeError
+        If pyarrow is not installed.
+    """
+    table = _arrow_table(columns)
+    sink = io.BytesIO()
+    pyarrow.parquet.write_table(table, sink, compression="zstd")
+    return sink.getvalue()
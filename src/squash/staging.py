@@ -0,0 +1,130 @@
+"""Implement the staging area for job documents ingested asynchronously.
+
+Uploaded job documents are staged to a location shared between the API and
+the Celery workers, either a local directory (e.g. a shared volume) given by
+a ``file://`` URL or an object store bucket given by a ``s3://`` URL.
+"""
+
+__all__ = ["LocalStaging", "S3Staging", "get_staging"]
+
+import os
+import shutil
+import tempfile
+import urllib.parse
+import uuid
+
+import boto3
+
+
+class LocalStaging:
+    """Stage job documents in a local directory.
+
+    Parameters
+    ----------
+    directory : `str`
+        Path to the staging directory, created if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, f):
+        """Stage the content of a file.
+
+        Parameters
+        ----------
+        f : file-like
+            A binary file with the job document.
+
+        Returns
+        -------
+        uri : `str`
+            URI of the staged job document.
+        """
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.json")
+        with open(path, "wb") as staged:
+            shutil.copyfileobj(f, staged, 1024**2)
+        return f"file://{path}"
+
+    def open(self, uri):
+        """Open a staged job document for reading."""
+        return open(urllib.parse.urlparse(uri).path, "rb")
+
+    def delete(self, uri):
+        """Delete a staged job document."""
+        os.remove(urllib.parse.urlparse(uri).path)
+
+
+class S3Staging:
+    """Stage job documents in a S3 bucket.
+
+    Parameters
+    ----------
+    bucket : `str`
+        Name of the bucket.
+    prefix : `str`
+        Prefix for the object keys.
+    spool_dir : `str`, optional
+        Directory where staged documents are downloaded to be read.
+    """
+
+    def __init__(self, bucket, prefix="", spool_dir=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.spool_dir = spool_dir
+        self._client = boto3.client("s3")
+
+    def _key(self, uri):
+        return urllib.parse.urlparse(uri).path.lstrip("/")
+
+    def put(self, f):
+        """Stage the content of a file.
+
+        Parameters
+        ----------
+        f : file-like
+            A binary file with the job document.
+
+        Returns
+        -------
+        uri : `str`
+            URI of the staged job document.
+        """
+        key = "/".join(filter(None, [self.prefix, f"{uuid.uuid4().hex}.json"]))
+        self._client.upload_fileobj(f, self.bucket, key)
+        return f"s3://{self.bucket}/{key}"
+
+    def open(self, uri):
+        """Download a staged job document and open it for reading."""
+        f = tempfile.TemporaryFile(dir=self.spool_dir)
+        self._client.download_fileobj(self.bucket, self._key(uri), f)
+        f.seek(0)
+        return f
+
+    def delete(self, uri):
+        """Delete a staged job document."""
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(uri))
+
+
+def get_staging(url, spool_dir=None):
+    """Return the staging area for a given URL.
+
+    Parameters
+    ----------
+    url : `str`
+        A ``file://`` or ``s3://`` URL.
+    spool_dir : `str`, optional
+        Directory where documents staged in S3 are downloaded.
+
+    Returns
+    -------
+    staging : `LocalStaging` or `S3Staging`
+        The staging area.
+    """
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == "file":
+        return LocalStaging(parsed.path)
+    if parsed.scheme == "s3":
+        return S3Staging(parsed.netloc, parsed.path, spool_dir)
+    raise ValueError(f"Unsupported staging URL `{url}`.")
@@ -1,2 +1,4 @@
 """Implement SQuaSH API tasks with Celery."""
 from .influxdb import *  # noqa F403
+from .ingest import *  # noqa F403
+from .retention import *  # noqa F403
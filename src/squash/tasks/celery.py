@@ -5,7 +5,10 @@ See https://blog.miguelgrinberg.com/post/using-celery-with-flask
 
 import os
 
-from celery import Celery
+from celery import Celery, signals
+
+from squash.instrumentation import start_metrics_server
+from squash.tracing import instrument_celery
 
 CELERY_BROKER_URL = os.environ.get(
     "CELERY_BROKER_URL", "redis://localhost:6379"
@@ -14,3 +17,18 @@ CELERY_BROKER_URL = os.environ.get(
 squash_tasks = Celery(
     "squash.tasks", backend=CELERY_BROKER_URL, broker=CELERY_BROKER_URL
 )
+
+# Propagate the trace context from the API to the tasks
+instrument_celery()
+
+
+@signals.worker_ready.connect
+def serve_metrics(**kwargs):
+    """Serve the worker metrics if SQUASH_WORKER_METRICS_PORT is set.
+
+    Set PROMETHEUS_MULTIPROC_DIR to aggregate the metrics of the worker
+    processes.
+    """
+    port = os.environ.get("SQUASH_WORKER_METRICS_PORT")
+    if port:
+        start_metrics_server(int(port))
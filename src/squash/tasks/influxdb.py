@@ -3,15 +3,30 @@
 __all__ = [
     "create_influxdb_database",
     "write_influxdb_line",
+    "write_influxdb_lines",
+    "ExportStats",
     "job_to_influxdb",
+    "jobs_to_influxdb",
 ]
 
 import importlib
 import logging
 import os
+import time
+from contextlib import contextmanager
 
 import requests
 
+from squash.instrumentation import (
+    EXPORT_BYTES,
+    EXPORT_JOBS,
+    EXPORT_LINES,
+    EXPORT_RETRIES,
+    EXPORT_STAGE_DURATION,
+)
+from squash.routing import READ_PRIMARY_HEADER
+from squash.tracing import inject, start_span
+
 from .celery import squash_tasks
 from .utils.transformation import Transformer
 
@@ -61,7 +76,9 @@ def create_influxdb_database(
 
     status_code = 500
     try:
-        r = requests.post(url=f"{influxdb_api_url}/query", params=params)
+        r = requests.post(
+            url=f"{influxdb_api_url}/query", params=params, headers=inject()
+        )
         r.raise_for_status()
         status_code = r.status_code
     except requests.exceptions.RequestException as err:
@@ -73,20 +90,28 @@ def create_influxdb_database(
     return status_code
 
 
-def write_influxdb_line(
-    line,
+def write_influxdb_lines(
+    lines,
     influxdb_database,
     influxdb_api_url,
     influxdb_username=None,
     influxdb_password=None,
+    max_retries=0,
+    backoff=0.5,
 ):
-    """Write a line to InfluxDB.
+    """Write a batch of lines to InfluxDB in a single request.
+
+    Writes that fail with a connection error or a server error are retried.
 
     Parameters
     ----------
-    line : `str`
-        An InfluxDB line formatted according to the line protocol:
+    lines : `list` [`str`]
+        InfluxDB lines formatted according to the line protocol:
         See https://docs.influxdata.com/influxdb/v1.8/write_protocols/
+    max_retries : `int`
+        Maximum number of retries.
+    backoff : `float`
+        Time in seconds before the first retry, doubled at each retry.
 
     Returns
     -------
@@ -95,6 +120,8 @@ def write_influxdb_line(
         204: The request was processed successfully.
         400: Malformed syntax or bad query.
         401: Unathenticated request.
+    retries : `int`
+        Number of retries.
     """
     params = {
         "db": influxdb_database,
@@ -103,15 +130,241 @@ def write_influxdb_line(
     }
 
     url = f"{influxdb_api_url}/write"
+    data = "\n".join(lines).encode()
     status_code = 500
-    try:
-        r = requests.post(url=url, params=params, data=line)
-        r.raise_for_status()
-        status_code = r.status_code
-    except requests.exceptions.RequestException as err:
-        message = f"Could not write line to InfluxDB {line}.\n{err}"
-        logger.error(message)
+    retries = 0
+    with start_span(
+        "write_influxdb_lines", lines=len(lines), bytes=len(data)
+    ) as span:
+        while True:
+            try:
+                r = requests.post(
+                    url=url, params=params, data=data, headers=inject()
+                )
+                status_code = r.status_code
+                r.raise_for_status()
+                break
+            except requests.exceptions.HTTPError as err:
+                logger.error(f"Could not write lines to InfluxDB.\n{err}")
+                # Do not retry client errors, e.g. malformed lines
+                if status_code < 500:
+                    break
+            except requests.exceptions.RequestException as err:
+                logger.error(f"Could not write lines to InfluxDB.\n{err}")
+                status_code = 500
+            if retries == max_retries:
+                break
+            time.sleep(backoff * 2**retries)
+            retries += 1
+
+        if span is not None:
+            span.set_attribute("http.status_code", status_code)
+            span.set_attribute("retries", retries)
+
+    return status_code, retries
+
+
+def write_influxdb_line(
+    line,
+    influxdb_database,
+    influxdb_api_url,
+    influxdb_username=None,
+    influxdb_password=None,
+):
+    """Write a line to InfluxDB.
+
+    Parameters
+    ----------
+    line : `str`
+        An InfluxDB line formatted according to the line protocol:
+        See https://docs.influxdata.com/influxdb/v1.8/write_protocols/
+
+    Returns
+    -------
+    status_code : `int`
+        Status code from the InfluxDB HTTP API.
+        204: The request was processed successfully.
+        400: Malformed syntax or bad query.
+        401: Unathenticated request.
+    """
+    status_code, _ = write_influxdb_lines(
+        [line],
+        influxdb_database,
+        influxdb_api_url,
+        influxdb_username,
+        influxdb_password,
+    )
+    return status_code
+
+
+class ExportStats:
+    """Record the stage timings and the throughput of a job export.
+
+    The stage timings and the number of lines, bytes and retries are also
+    recorded in the worker metrics.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.batches = []
+
+    @contextmanager
+    def stage(self, name, **attributes):
+        """Time an export stage, also traced as a span."""
+        start = time.perf_counter()
+        try:
+            with start_span(name, **attributes):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0) + elapsed
+            EXPORT_STAGE_DURATION.labels(stage=name).observe(elapsed)
+
+    def add_batch(self, lines, size, duration, retries, status_code):
+        """Record a write batch."""
+        self.batches.append(
+            {
+                "lines": lines,
+                "bytes": size,
+                "duration": duration,
+                "retries": retries,
+                "status_code": status_code,
+            }
+        )
+        EXPORT_RETRIES.inc(retries)
+        if status_code == 204:
+            EXPORT_LINES.inc(lines)
+            EXPORT_BYTES.inc(size)
+
+    def to_dict(self):
+        """Return the timings in seconds and the throughput."""
+        written = [b for b in self.batches if b["status_code"] == 204]
+        lines = sum(b["lines"] for b in written)
+        size = sum(b["bytes"] for b in written)
+        write_time = self.timings.get("write", 0)
+        return {
+            "timings": {
+                name: round(elapsed, 6)
+                for name, elapsed in self.timings.items()
+            },
+            "batches": [
+                dict(b, duration=round(b["duration"], 6)) for b in self.batches
+            ],
+            "lines": lines,
+            "bytes": size,
+            "retries": sum(b["retries"] for b in self.batches),
+            "lines_per_second": (
+                round(lines / write_time, 3) if write_time else None
+            ),
+            "bytes_per_second": (
+                round(size / write_time, 3) if write_time else None
+            ),
+        }
+
+
+def _fetch_job_lines(job_id, stats, primary=False):
+    """Get a job from the SQuaSH API and transform it into InfluxDB lines.
+
+    Parameters
+    ----------
+    job_id : `int`
+        ID for the SQuaSH job
+    stats : `ExportStats`
+        Records the stage timings.
+    primary : `bool`
+        Read the job from the primary database. A job that was just
+        ingested may be partially replicated, the measurements and the
+        change points are committed after the job.
+
+    Returns
+    -------
+    lines : `list` [`str`] or `None`
+        The InfluxDB lines, `None` if the job could not be fetched.
+    message : `str`
+        Error message if the job could not be fetched.
+    status_code : `int`
+        Status code from the SQuaSH API.
+    """
+    # Get job data from the SQuaSH API
+    job_url = f"{config.SQUASH_API_URL}/job/{job_id}"
+    status_code = 500
+    message = f"Failed to establish connection with {config.SQUASH_API_URL}."
+    with stats.stage("fetch", job_id=job_id):
+        headers = inject()
+        if primary:
+            headers[READ_PRIMARY_HEADER] = "1"
+        try:
+            r = requests.get(url=job_url, headers=headers)
+            if r.status_code == 404 and not primary:
+                # The job may not be replicated yet, read it and its change
+                # points from the primary database
+                headers[READ_PRIMARY_HEADER] = "1"
+                r = requests.get(url=job_url, headers=headers)
+            r.raise_for_status()
+            status_code = r.status_code
+            data = r.json()
+        except requests.exceptions.RequestException as err:
+            logger.error(message, err)
+
+        # Change points are exported as fields of the job measurements,
+        # there is at most one change point per measurement
+        change_points = []
+        if status_code == 200:
+            limit = max(len(data.get("measurements") or []), 1)
+            try:
+                r = requests.get(
+                    url=f"{config.SQUASH_API_URL}/change_points",
+                    params={"job_id": job_id, "limit": limit},
+                    headers=headers,
+                )
+                r.raise_for_status()
+                change_points = r.json()["change_points"]
+            except requests.exceptions.RequestException as err:
+                logger.warning(
+                    f"Could not get the change points of job {job_id}. {err}"
+                )
+
+    if status_code != 200:
+        return None, message, status_code
+
+    transformer = Transformer(
+        squash_api_url=config.SQUASH_API_URL,
+        data=data,
+        change_points=change_points,
+    )
+
+    with stats.stage("timestamp", job_id=job_id):
+        timestamp = transformer.get_timestamp()
+
+    with stats.stage("transform", job_id=job_id):
+        influxdb_lines = transformer.to_influxdb_line(timestamp)
+
+    return influxdb_lines, None, status_code
 
+
+def _write_batch(batch, stats):
+    """Write a batch of lines to InfluxDB and record it in the stats.
+
+    Returns
+    -------
+    status_code : `int`
+        Status code from the InfluxDB HTTP API.
+    """
+    start = time.perf_counter()
+    status_code, retries = write_influxdb_lines(
+        batch,
+        config.INFLUXDB_DATABASE,
+        config.INFLUXDB_API_URL,
+        max_retries=config.INFLUXDB_MAX_RETRIES,
+        backoff=config.INFLUXDB_RETRY_BACKOFF,
+    )
+    stats.add_batch(
+        len(batch),
+        len("\n".join(batch).encode()),
+        time.perf_counter() - start,
+        retries,
+        status_code,
+    )
     return status_code
 
 
@@ -119,6 +372,9 @@ def write_influxdb_line(
 def job_to_influxdb(self, job_id):
     """Transform a SQuaSH job into InfluxDB lines and send to InfluxDB.
 
+    Enqueued after the job is ingested, the job is read from the primary
+    database.
+
     Parameters
     ----------
     job_id : `int`
@@ -126,49 +382,130 @@ def job_to_influxdb(self, job_id):
 
     Returns
     -------
-    status_code : `int`
-        Status code from the InfluxDB or SQuaSH APIs
+    result : `dict`
+        Message, status code from the InfluxDB or SQuaSH APIs and export
+        statistics: stage timings in seconds, the write batches, number of
+        lines, bytes and retries and the write throughput.
+        Status codes:
         200 or 204: The request was processed successfully
         400: Malformed syntax or bad query
         401: Unathenticated request.
     """
-    status_code = create_influxdb_database(
-        config.INFLUXDB_DATABASE, config.INFLUXDB_API_URL
-    )
+    stats = ExportStats()
 
-    if status_code != 200:
-        message = "Could not create InfluxDB database."
-        return {"message": message, "status_code": status_code}
+    def result(message, status_code):
+        EXPORT_JOBS.labels(status_code=status_code).inc()
+        return {
+            "message": message,
+            "status_code": status_code,
+            "stats": stats.to_dict(),
+        }
 
-    # Get job data from the SQuaSH API
-    job_url = f"{config.SQUASH_API_URL}/job/{job_id}"
-    status_code = 500
-    try:
-        r = requests.get(url=job_url)
-        r.raise_for_status()
-        status_code = r.status_code
-    except requests.exceptions.RequestException as err:
-        message = (
-            f"Failed to establish connection with {config.SQUASH_API_URL}."
+    with stats.stage("create_database"):
+        status_code = create_influxdb_database(
+            config.INFLUXDB_DATABASE, config.INFLUXDB_API_URL
         )
-        logger.error(message, err)
 
     if status_code != 200:
-        return {"message": message, "status_code": status_code}
+        message = "Could not create InfluxDB database."
+        return result(message, status_code)
 
-    data = r.json()
-    transformer = Transformer(squash_api_url=config.SQUASH_API_URL, data=data)
+    influxdb_lines, message, status_code = _fetch_job_lines(
+        job_id, stats, primary=True
+    )
+    if influxdb_lines is None:
+        return result(message, status_code)
+
+    batch_size = config.INFLUXDB_BATCH_SIZE
+    with stats.stage("write", job_id=job_id, lines=len(influxdb_lines)):
+        for i in range(0, len(influxdb_lines), batch_size):
+            status_code = _write_batch(
+                influxdb_lines[i : i + batch_size], stats
+            )
+            if status_code != 204:
+                message = f"Failed to write Job {job_id} to InfluxDB."
+                return result(message, status_code)
+
+    message = f"Job {job_id} sucessfully written to InfluxDB."
+    return result(message, status_code)
+
+
+@squash_tasks.task(bind=True)
+def jobs_to_influxdb(self, job_ids):
+    """Transform SQuaSH jobs into InfluxDB lines and send to InfluxDB.
 
-    influxdb_lines = transformer.to_influxdb_line()
+    Export many jobs in a single pass, e.g. after a bulk load. The jobs are
+    read from the read replicas, if any. The lines of consecutive jobs are
+    written in the same batches. Jobs that cannot be fetched are skipped,
+    the export stops at the first failed write.
 
-    for line in influxdb_lines:
-        status_code = write_influxdb_line(
-            line, config.INFLUXDB_DATABASE, config.INFLUXDB_API_URL
+    Parameters
+    ----------
+    job_ids : `list` [`int`]
+        IDs for the SQuaSH jobs
+
+    Returns
+    -------
+    result : `dict`
+        Message, status code from the InfluxDB API, the number of jobs
+        whose lines were all written, the IDs of the jobs that could not be
+        fetched and the export statistics, see `job_to_influxdb`.
+    """
+    stats = ExportStats()
+    failed = []
+    exported = 0
+
+    def result(message, status_code):
+        EXPORT_JOBS.labels(status_code=status_code).inc(exported)
+        return {
+            "message": message,
+            "status_code": status_code,
+            "jobs": exported,
+            "failed": failed,
+            "stats": stats.to_dict(),
+        }
+
+    with stats.stage("create_database"):
+        status_code = create_influxdb_database(
+            config.INFLUXDB_DATABASE, config.INFLUXDB_API_URL
         )
 
+    if status_code != 200:
+        message = "Could not create InfluxDB database."
+        return result(message, status_code)
+
+    batch_size = config.INFLUXDB_BATCH_SIZE
+    pending = []
+    # Number of jobs whose lines are pending
+    pending_jobs = 0
+    status_code = 204
+    for job_id in job_ids:
+        influxdb_lines, _, fetch_status_code = _fetch_job_lines(job_id, stats)
+        if influxdb_lines is None:
+            EXPORT_JOBS.labels(status_code=fetch_status_code).inc()
+            failed.append(job_id)
+            continue
+        pending.extend(influxdb_lines)
+        pending_jobs += 1
+
+        with stats.stage("write", lines=len(pending)):
+            while len(pending) >= batch_size:
+                status_code = _write_batch(pending[:batch_size], stats)
+                if status_code != 204:
+                    message = "Failed to write the jobs to InfluxDB."
+                    return result(message, status_code)
+                del pending[:batch_size]
+        if not pending:
+            exported += pending_jobs
+            pending_jobs = 0
+
+    if pending:
+        with stats.stage("write", lines=len(pending)):
+            status_code = _write_batch(pending, stats)
         if status_code != 204:
-            message = f"Failed to write Job {job_id} to InfluxDB."
-            return {"message": message, "status_code": status_code}
+            message = "Failed to write the jobs to InfluxDB."
+            return result(message, status_code)
+    exported += pending_jobs
 
-    message = f"Job {job_id} sucessfully written to InfluxDB."
-    return {"message": message, "status_code": status_code}
+    message = f"{exported} jobs sucessfully written to InfluxDB."
+    return result(message, status_code)
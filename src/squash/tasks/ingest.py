@@ -0,0 +1,112 @@
+"""Implement Celery task to ingest a staged SQuaSH job."""
+
+__all__ = ["ingest_job"]
+
+import logging
+import os
+
+from squash.error import ApiError
+from squash.evaluation import evaluate_jobs, summarize
+from squash.ingest import JobDocument, JobLoader
+from squash.staging import get_staging
+
+from .celery import squash_tasks
+from .influxdb import job_to_influxdb
+
+profile = os.environ.get("SQUASH_API_PROFILE", "squash.config.Development")
+
+logger = logging.getLogger("squash")
+
+# Flask app used by the worker process to access the database
+_app = None
+
+
+def get_app():
+    """Create the Flask app once per worker process."""
+    global _app
+    if _app is None:
+        # Import here to avoid a circular import, the app imports the
+        # resources that enqueue this task
+        from squash.app import create_app
+
+        _app = create_app(profile)
+    return _app
+
+
+@squash_tasks.task(bind=True)
+def ingest_job(self, uri, evaluate=False):
+    """Load a staged job into the database and export it to InfluxDB.
+
+    The task state is ``PROGRESS`` while the job is loaded, with the current
+    ingest stage in the task info.
+
+    Parameters
+    ----------
+    uri : `str`
+        URI of the staged job document.
+    evaluate : `bool`
+        Evaluate the job against the metric specifications once loaded.
+
+    Returns
+    -------
+    result : `dict`
+        Message and status code of the ingest, the ID of the job created,
+        the ID of the task that exports the job to InfluxDB and, if
+        requested, the summary of the job evaluation.
+    """
+    # Import here to avoid a circular import
+    from squash.api_v1.job import invalidate_job
+
+    app = get_app()
+    completed = []
+
+    def progress(stage, **counts):
+        if stage not in completed:
+            completed.append(stage)
+        self.update_state(
+            state="PROGRESS",
+            meta={
+                "stage": "ingest",
+                "step": stage,
+                "completed": completed[:-1],
+                **counts,
+            },
+        )
+
+    with app.app_context():
+        staging = get_staging(
+            app.config["SQUASH_STAGING_URL"], app.config["SQUASH_SPOOL_DIR"]
+        )
+        with staging.open(uri) as f:
+            loader = JobLoader(
+                JobDocument(f),
+                app.config["SQUASH_INGEST_BATCH_SIZE"],
+                progress=progress,
+                detect=app.config["SQUASH_DETECTION"],
+            )
+            try:
+                job_id = loader.run()
+            except ApiError as err:
+                # Keep the staged document for inspection
+                logger.error(f"Could not ingest {uri}. {err.message}")
+                return {"message": err.message, "status_code": err.status_code}
+
+        staging.delete(uri)
+        invalidate_job(job_id)
+
+        evaluation = None
+        if evaluate:
+            evaluation = summarize(evaluate_jobs([job_id]))
+
+    export = job_to_influxdb.delay(job_id)
+
+    message = f"Job {job_id} sucessfully ingested."
+    result = {
+        "message": message,
+        "status_code": 201,
+        "job_id": job_id,
+        "export_task_id": export.id,
+    }
+    if evaluation is not None:
+        result["evaluation"] = evaluation
+    return result
@@ -0,0 +1,62 @@
+"""Implement Celery task to purge old SQuaSH jobs."""
+
+__all__ = ["purge_jobs"]
+
+from squash.retention import RetentionPolicy, plan, purge
+
+from .celery import squash_tasks
+from .ingest import get_app
+
+
+@squash_tasks.task(bind=True)
+def purge_jobs(self, job_ids=None, policies=None, archive=False):
+    """Archive and delete SQuaSH jobs in batches.
+
+    The task state is ``PROGRESS`` while the jobs are deleted, with the
+    number of jobs deleted so far.
+
+    Parameters
+    ----------
+    job_ids : `list` [`int`], optional
+        IDs of the jobs to purge.
+    policies : `list` [`dict`], optional
+        Retention policies selecting the jobs to purge if ``job_ids`` is not
+        given, by default ``SQUASH_RETENTION_POLICIES``.
+    archive : `bool`
+        Archive the jobs to ``SQUASH_RETENTION_ARCHIVE_DIR`` before
+        deleting them.
+
+    Returns
+    -------
+    result : `dict`
+        Message, status code and the number of rows deleted per table.
+    """
+    # Import here to avoid a circular import
+    from squash.api_v1.job import invalidate_jobs
+
+    app = get_app()
+
+    def progress(deleted, total):
+        self.update_state(
+            state="PROGRESS",
+            meta={"stage": "purge", "deleted": deleted, "total": total},
+        )
+
+    with app.app_context():
+        if job_ids is None:
+            if policies is None:
+                policies = app.config["SQUASH_RETENTION_POLICIES"]
+            job_ids, _ = plan(
+                [RetentionPolicy.from_dict(policy) for policy in policies]
+            )
+
+        counts = purge(
+            job_ids,
+            app.config["SQUASH_RETENTION_BATCH_SIZE"],
+            app.config["SQUASH_RETENTION_ARCHIVE_DIR"] if archive else None,
+            progress=progress,
+        )
+        invalidate_jobs(job_ids)
+
+    message = f"{len(job_ids)} jobs successfully purged."
+    return {"message": message, "status_code": 200, "report": counts}
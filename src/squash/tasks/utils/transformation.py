@@ -15,6 +15,7 @@ import requests
 import yaml
 
 from squash.tasks.utils.format import Formatter
+from squash.tracing import inject
 
 logger = logging.getLogger("squash")
 
@@ -28,13 +29,21 @@ class Transformer(Formatter):
         SQuaSH API URL.
     data : `str`
         SQuaSH job data in JSON.
+    change_points : `list` [`dict`], optional
+        Change points flagged for the job, as returned by the
+        ``/change_points`` endpoint.
     """
 
-    def __init__(self, squash_api_url, data):
+    def __init__(self, squash_api_url, data, change_points=None):
         super().__init__(squash_api_url=squash_api_url)
 
         self.squash_api_url = squash_api_url
         self.data = data
+        # Direction of the change points by metric
+        self.change_points = {
+            change_point["metric"]: change_point["direction"]
+            for change_point in change_points or []
+        }
         self.mapping = self.load_mapping()
 
     def load_mapping(self):
@@ -111,7 +120,7 @@ class Transformer(Formatter):
             # Get timestamp from Jenkins
             jenkins_url = f"{self.squash_api_url}/jenkins/{ci_id}"
             try:
-                r = requests.get(jenkins_url)
+                r = requests.get(jenkins_url, headers=inject())
                 r.raise_for_status()
             except requests.exceptions.RequestException as err:
                 message = f"Failed to establish connection with {jenkins_url}."
@@ -217,6 +226,10 @@ class Transformer(Formatter):
 
         By grouping verify measurements by package we can send them to InfluxDB
         in batch. A package is mapped to an InfluxDB measurement.
+
+        Metrics with a change point in this job have an additional
+        ``<metric>_change_point`` field, 1 if the series mean shifted up and
+        -1 if it shifted down.
         """
         meas_by_package = {}
         for meas in self.data["measurements"]:
@@ -240,17 +253,31 @@ class Transformer(Formatter):
                         meas_by_package[package] = []
                     meas_by_package[package].append(f"{metric}={value}")
 
+                direction = self.change_points.get(meas["metric"])
+                if direction and package in meas_by_package:
+                    meas_by_package[package].append(
+                        f"{metric}_change_point="
+                        f"{1 if direction == 'up' else -1}"
+                    )
+
         return meas_by_package
 
-    def to_influxdb_line(self):
+    def to_influxdb_line(self, timestamp=None):
         """Process job data and make the InfluxDB lines.
 
+        Parameters
+        ----------
+        timestamp : `int`, optional
+            Timestamp of the InfluxDB lines, by default obtained with
+            `get_timestamp`.
+
         Returns
         -------
         influxdb_lines : `list`
             A list with strings representing each InfluxDB line.
         """
-        timestamp = self.get_timestamp()
+        if timestamp is None:
+            timestamp = self.get_timestamp()
 
         self.update_metadata()
 
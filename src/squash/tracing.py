@@ -0,0 +1,394 @@
+"""Implement tracing of the job upload across the API and Celery workers.
+
+A trace is a tree of timed spans, e.g. the upload request, the loading
+stages, the ``job_to_influxdb`` task, its requests back to the API and its
+InfluxDB writes. The trace context is propagated across processes in the
+W3C ``traceparent`` format: in the HTTP request headers and in the Celery
+task message headers.
+
+Finished spans are sent to the exporter configured with
+``SQUASH_TRACING_EXPORTER``:
+
+``null`` or empty
+    Tracing is disabled (default), `start_span` returns right away.
+``console``
+    Write spans as JSON lines to the standard error.
+``file:///path/to/spans.jsonl``
+    Append spans as JSON lines to a file, for offline analysis.
+
+Other exporters implement the ``export(span)`` method and are installed with
+`configure`.
+"""
+
+__all__ = [
+    "Span",
+    "NullExporter",
+    "ConsoleExporter",
+    "FileExporter",
+    "Tracing",
+    "tracing",
+    "configure",
+    "get_exporter",
+    "current_span",
+    "start_span",
+    "inject",
+    "parse_traceparent",
+    "instrument_celery",
+]
+
+import contextvars
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+from flask import g, request
+
+TRACEPARENT = re.compile(
+    r"^[\da-f]{2}-(?P<trace_id>[\da-f]{32})-(?P<span_id>[\da-f]{16})"
+    r"-[\da-f]{2}$"
+)
+
+_current_span = contextvars.ContextVar("squash_span", default=None)
+
+
+class Span:
+    """A timed operation in a trace.
+
+    Parameters
+    ----------
+    name : `str`
+        Name of the operation, e.g. ``insert_measurements``.
+    trace_id : `str`
+        Trace identifier, 32 hex digits.
+    parent_id : `str`, optional
+        Identifier of the parent span, 16 hex digits.
+    attributes : `dict`, optional
+        Attributes of the operation, e.g. a job id.
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self.duration = None
+        self._start = time.perf_counter()
+
+    @property
+    def traceparent(self):
+        """Return the span context in the W3C traceparent format."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key, value):
+        """Set an attribute of the span."""
+        self.attributes[key] = value
+
+    def finish(self):
+        """Record the span duration."""
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self):
+        """Return the span as a JSON serializable dict."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class NullExporter:
+    """Discard spans, tracing is disabled."""
+
+    enabled = False
+
+    def export(self, span):
+        """Discard a span."""
+
+
+class ConsoleExporter:
+    """Write spans as JSON lines to a stream.
+
+    Parameters
+    ----------
+    stream : file-like, optional
+        A text stream, by default the standard error.
+    """
+
+    enabled = True
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        """Write a span."""
+        stream = self.stream or sys.stderr
+        with self._lock:
+            stream.write(json.dumps(span.to_dict(), default=str) + "\n")
+            stream.flush()
+
+
+class FileExporter:
+    """Append spans as JSON lines to a file.
+
+    Each span is written with a single append, the file can be shared by
+    several processes.
+
+    Parameters
+    ----------
+    path : `str`
+        Path to the file, created if it does not exist.
+    """
+
+    enabled = True
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, span):
+        """Append a span."""
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with open(self.path, "a") as f:
+            f.write(line)
+
+
+def get_exporter(url):
+    """Return the span exporter for a given URL.
+
+    Parameters
+    ----------
+    url : `str` or `None`
+        ``null``, ``console`` or a ``file://`` URL.
+    """
+    if not url or url == "null":
+        return NullExporter()
+    if url == "console":
+        return ConsoleExporter()
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == "file":
+        return FileExporter(parsed.path)
+    raise ValueError(f"Unsupported tracing exporter `{url}`.")
+
+
+_exporter = get_exporter(os.environ.get("SQUASH_TRACING_EXPORTER"))
+
+
+def configure(exporter):
+    """Set the span exporter of the process.
+
+    Parameters
+    ----------
+    exporter : `str` or exporter
+        An exporter URL, see `get_exporter`, or an object with an ``export``
+        method and an ``enabled`` attribute.
+    """
+    global _exporter
+    if exporter is None or isinstance(exporter, str):
+        exporter = get_exporter(exporter)
+    _exporter = exporter
+
+
+def current_span():
+    """Return the current span or `None`."""
+    return _current_span.get()
+
+
+def parse_traceparent(header):
+    """Parse a W3C traceparent header.
+
+    Returns
+    -------
+    context : `tuple` or `None`
+        The trace id and the parent span id, or `None` if the header is
+        missing or invalid.
+    """
+    match = TRACEPARENT.match((header or "").strip().lower())
+    if match is None:
+        return None
+    return match["trace_id"], match["span_id"]
+
+
+def _start(name, traceparent=None, attributes=None):
+    """Create a span and make it the current span."""
+    context = parse_traceparent(traceparent)
+    parent = _current_span.get()
+    if context is not None:
+        trace_id, parent_id = context
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    span = Span(name, trace_id, parent_id, attributes)
+    return span, _current_span.set(span)
+
+
+def _finish(span, token, exc=None):
+    """Export a span and restore the previous current span."""
+    span.finish()
+    if exc is not None:
+        span.status = "error"
+        span.set_attribute("error", repr(exc))
+    _current_span.reset(token)
+    _exporter.export(span)
+
+
+@contextmanager
+def start_span(name, traceparent=None, **attributes):
+    """Time a block of code as a span of the current trace.
+
+    Parameters
+    ----------
+    name : `str`
+        Name of the span.
+    traceparent : `str`, optional
+        Context of a remote parent span in the W3C traceparent format. By
+        default the parent is the current span, if any.
+    **attributes
+        Attributes of the span.
+
+    Yields
+    ------
+    span : `Span` or `None`
+        The span, `None` if tracing is disabled.
+    """
+    if not _exporter.enabled:
+        yield None
+        return
+
+    span, token = _start(name, traceparent, attributes)
+    try:
+        yield span
+    except BaseException as exc:
+        _finish(span, token, exc)
+        raise
+    _finish(span, token)
+
+
+def inject(headers=None):
+    """Add the current span context to a dict of headers.
+
+    Parameters
+    ----------
+    headers : `dict`, optional
+        HTTP or Celery message headers.
+
+    Returns
+    -------
+    headers : `dict`
+        The headers, with ``traceparent`` if there is a current span.
+    """
+    headers = {} if headers is None else headers
+    span = _current_span.get()
+    if span is not None:
+        headers["traceparent"] = span.traceparent
+    return headers
+
+
+class Tracing:
+    """Trace the API requests.
+
+    Follows the Flask extension pattern, create the `Tracing` object once
+    and call `init_app` for each app instance. The request hooks are
+    registered only if tracing is enabled.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the exporter and register the request hooks."""
+        configure(app.config.get("SQUASH_TRACING_EXPORTER"))
+        if not _exporter.enabled:
+            return
+
+        app.before_request(self.start_request)
+        app.after_request(self.record_response)
+        app.teardown_request(self.finish_request)
+
+    @staticmethod
+    def start_request():
+        """Start the request span, child of the caller span if any."""
+        span, token = _start(
+            f"{request.method} {request.endpoint}",
+            request.headers.get("traceparent"),
+            {"http.method": request.method, "http.target": request.path},
+        )
+        g.squash_span = (span, token)
+
+    @staticmethod
+    def record_response(response):
+        """Record the response status code and return the trace context."""
+        span = g.get("squash_span", (None, None))[0]
+        if span is not None:
+            span.set_attribute("http.status_code", response.status_code)
+            response.headers["traceparent"] = span.traceparent
+        return response
+
+    @staticmethod
+    def finish_request(exc=None):
+        """Finish and export the request span."""
+        span, token = g.pop("squash_span", (None, None))
+        if span is not None:
+            _finish(span, token, exc)
+
+
+def instrument_celery():
+    """Propagate the trace context through the Celery task messages.
+
+    The current span context is added to the headers of the task messages
+    and each task runs in a span, child of the span that enqueued it.
+    """
+    from celery import signals
+
+    spans = {}
+
+    @signals.before_task_publish.connect(weak=False)
+    def inject_context(headers=None, **kwargs):
+        if headers is not None:
+            inject(headers)
+
+    @signals.task_prerun.connect(weak=False)
+    def start_task(task_id=None, task=None, **kwargs):
+        if not _exporter.enabled:
+            return
+        spans[task_id] = _start(
+            task.name,
+            task.request.get("traceparent"),
+            {"celery.task_id": task_id},
+        )
+
+    @signals.task_postrun.connect(weak=False)
+    def finish_task(task_id=None, state=None, **kwargs):
+        span, token = spans.pop(task_id, (None, None))
+        if span is not None:
+            span.set_attribute("celery.state", state)
+            _finish(span, token)
+
+    @signals.task_failure.connect(weak=False)
+    def record_failure(task_id=None, exception=None, **kwargs):
+        span = spans.get(task_id, (None, None))[0]
+        if span is not None:
+            span.status = "error"
+            span.set_attribute("error", repr(exception))
+
+
+# Initialize extension
+tracing = Tracing()
@@ -0,0 +1,563 @@
+"""Implement the export and import of the SQuaSH database.
+
+The database is exported to a directory with one sub-directory per table.
+The reference tables ``env``, ``metric`` and ``spec`` are written in a
+single file each. The jobs are written in chunks of job ids, each chunk has
+one file per table with the jobs and their packages, blobs, measurements and
+measurement-blob associations. The rows are read with streaming queries in
+id order and written as gzip compressed NDJSON, or as Parquet if pyarrow is
+installed. Primary keys are preserved, the relations stay consistent without
+remapping ids.
+
+The files of a chunk are written to temporary files and renamed, the jobs
+file last, so that an interrupted export is resumed by skipping the chunks
+whose jobs file exists. A chunk is imported in a single transaction with
+bulk inserts and skipped if its jobs already exist in the database, so that
+an interrupted import is resumed by running it again. Both run on a range of
+job ids, several processes can export or import disjoint ranges in
+parallel. The blobs shared by the chunks of several ranges are inserted
+once. The reference tables are imported by each process, import them first,
+e.g. with an empty range, before starting the parallel imports. The jobs
+archived with `archive_jobs` before they are deleted are imported the same
+way.
+
+The users, the series states and the change points are not exported, the
+change points are rebuilt with ``squash backfill-change-points``.
+"""
+
+__all__ = ["FORMATS", "archive_jobs", "export_database", "import_database"]
+
+import gzip
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import JSON, DateTime, Float, Integer, and_, func, select
+
+from .migrations import set_measurement_dates
+from .models import MeasurementModel, db
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# Supported formats and their file extension
+FORMATS = {"ndjson": ".ndjson.gz", "parquet": ".parquet"}
+
+# Tables exported in a single file, in import order
+REFERENCE_TABLES = ["env", "metric", "spec"]
+
+# Tables exported per chunk of jobs, in import order. The job file is
+# written last and marks the chunk as complete.
+JOB_TABLES = ["job", "package", "blob", "measurement", "measurement_blob"]
+
+
+def _table(name):
+    return db.metadata.tables[name]
+
+
+def _kind(column):
+    """Return how the values of a column are encoded."""
+    if isinstance(column.type, JSON):
+        return "json"
+    if isinstance(column.type, DateTime):
+        return "datetime"
+    if isinstance(column.type, Integer):
+        return "int"
+    if isinstance(column.type, Float):
+        return "float"
+    return "str"
+
+
+def _chunk_name(start, end):
+    return f"{start:012d}-{end:012d}"
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+class _NDJSONWriter:
+    """Write rows as gzip compressed JSON lines."""
+
+    def __init__(self, path, table):
+        self._file = gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row, default=_json_default))
+            self._file.write("\n")
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    """Write rows as a Parquet file, JSON values are stored as strings."""
+
+    TYPES = {
+        "int": "int64",
+        "float": "float64",
+        "str": "string",
+        "json": "string",
+    }
+
+    def __init__(self, path, table):
+        if pyarrow is None:
+            raise RuntimeError("The parquet format requires pyarrow.")
+        self._json = [c.name for c in table.columns if _kind(c) == "json"]
+        self._schema = pyarrow.schema(
+            [
+                (
+                    c.name,
+                    (
+                        pyarrow.timestamp("us")
+                        if _kind(c) == "datetime"
+                        else pyarrow.type_for_alias(self.TYPES[_kind(c)])
+                    ),
+                )
+                for c in table.columns
+            ]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(
+            path, self._schema, compression="zstd"
+        )
+
+    def write(self, rows):
+        for row in rows:
+            for name in self._json:
+                if row[name] is not None:
+                    row[name] = json.dumps(row[name])
+        self._writer.write_table(
+            pyarrow.Table.from_pylist(rows, schema=self._schema)
+        )
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {"ndjson": _NDJSONWriter, "parquet": _ParquetWriter}
+
+
+def _read_rows(path, table, batch_size=10000):
+    """Read the rows of a table file in the database types.
+
+    Yields
+    ------
+    rows : `list` [`dict`]
+        Batches of rows.
+    """
+    kinds = {c.name: _kind(c) for c in table.columns}
+    if path.endswith(FORMATS["parquet"]):
+        if pyarrow is None:
+            raise RuntimeError("The parquet format requires pyarrow.")
+        json_columns = [n for n, kind in kinds.items() if kind == "json"]
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size):
+            rows = batch.to_pylist()
+            for row in rows:
+                for name in json_columns:
+                    if row[name] is not None:
+                        row[name] = json.loads(row[name])
+            yield rows
+        return
+
+    datetime_columns = [n for n, kind in kinds.items() if kind == "datetime"]
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        rows = []
+        for line in f:
+            row = json.loads(line)
+            for name in datetime_columns:
+                # Missing in the files exported by older versions
+                if row.get(name) is not None:
+                    row[name] = datetime.fromisoformat(row[name])
+            rows.append(row)
+            if len(rows) == batch_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+
+def _write_table(path, table, output, query, batch_size):
+    """Stream the rows of a query to a table file.
+
+    The file is written under a temporary name and renamed when complete.
+
+    Returns
+    -------
+    count : `int`
+        Number of rows written.
+    """
+    tmp = path + ".tmp"
+    writer = WRITERS[output](tmp, table)
+    count = 0
+    try:
+        result = db.session.execute(
+            query, execution_options={"yield_per": batch_size}
+        )
+        for partition in result.mappings().partitions():
+            rows = [dict(row) for row in partition]
+            writer.write(rows)
+            count += len(rows)
+    finally:
+        writer.close()
+    os.replace(tmp, path)
+    return count
+
+
+def _job_queries(selected):
+    """Return the queries of the rows of a set of jobs.
+
+    Parameters
+    ----------
+    selected : `callable`
+        Return the condition on a job id column that selects the jobs,
+        e.g. a range of ids.
+    """
+    job = _table("job")
+    package = _table("package")
+    blob = _table("blob")
+    measurement = _table("measurement")
+    measurement_blob = _table("measurement_blob")
+
+    associations = measurement_blob.join(
+        measurement, measurement_blob.c.measurement_id == measurement.c.id
+    )
+    blob_ids = (
+        select(measurement_blob.c.blob_id).select_from(associations)
+    ).where(selected(measurement.c.job_id))
+
+    return {
+        "job": select(job).where(selected(job.c.id)).order_by(job.c.id),
+        "package": select(package)
+        .where(selected(package.c.job_id))
+        .order_by(package.c.id),
+        "blob": select(blob)
+        .where(blob.c.id.in_(blob_ids))
+        .order_by(blob.c.id),
+        "measurement": select(measurement)
+        .where(selected(measurement.c.job_id))
+        .order_by(measurement.c.id),
+        "measurement_blob": select(measurement_blob)
+        .select_from(associations)
+        .where(selected(measurement.c.job_id))
+        .order_by(
+            measurement_blob.c.measurement_id, measurement_blob.c.blob_id
+        ),
+    }
+
+
+def _write_jobs(directory, chunk, output, queries, batch_size, counts):
+    """Write the files of a chunk of jobs, the job file last."""
+    extension = FORMATS[output]
+    for name in JOB_TABLES[1:] + JOB_TABLES[:1]:
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+        path = os.path.join(directory, name, chunk + extension)
+        counts[name] += _write_table(
+            path, _table(name), output, queries[name], batch_size
+        )
+
+
+def _chunk_starts(chunk_size, start_id=None, end_id=None):
+    """Return the first ids of the chunks of jobs in a range.
+
+    Chunks are aligned on multiples of the chunk size, a chunk belongs to
+    the range that contains its first id. Disjoint ranges thus have
+    disjoint chunks.
+    """
+    job = _table("job")
+    first, last = db.session.execute(
+        select(func.min(job.c.id), func.max(job.c.id))
+    ).one()
+    if first is None:
+        return []
+    return [
+        start
+        for start in range(first - first % chunk_size, last + 1, chunk_size)
+        if (start_id is None or start >= start_id)
+        and (end_id is None or start < end_id)
+    ]
+
+
+def _check_manifest(directory, output, chunk_size):
+    """Check that an export continues with the same format and chunks."""
+    path = os.path.join(directory, "manifest.json")
+    manifest = {"format": output, "chunk_size": chunk_size}
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = json.load(f)
+        if existing != manifest:
+            raise ValueError(
+                "The directory has an export with format {format} and chunk "
+                "size {chunk_size}.".format(**existing)
+            )
+        return
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+
+
+def export_database(
+    directory,
+    output="ndjson",
+    start_id=None,
+    end_id=None,
+    chunk_size=1000,
+    batch_size=10000,
+):
+    """Export the database to a directory.
+
+    Must be called within the app context. The export is a snapshot, the
+    chunks already in the directory are not updated.
+
+    Parameters
+    ----------
+    directory : `str`
+        The output directory, created if needed.
+    output : `str`
+        Format of the files, see `FORMATS`.
+    start_id : `int`, optional
+        Export the chunks of jobs that start at this id or larger.
+    end_id : `int`, optional
+        Export the chunks of jobs that start before this id.
+    chunk_size : `int`
+        Number of job ids per chunk. Chunks are aligned on multiples of
+        the chunk size, so that exports of different ranges write the same
+        chunks.
+    batch_size : `int`
+        Number of rows fetched and written at a time.
+
+    Returns
+    -------
+    counts : `dict`
+        Number of rows exported per table, and of chunks skipped because
+        they were already exported.
+
+    Raises
+    ------
+    ValueError
+        If the directory has an export with another format or chunk size.
+    RuntimeError
+        If the format requires pyarrow and it is not installed.
+    """
+    extension = FORMATS[output]
+    for name in REFERENCE_TABLES + JOB_TABLES:
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+    _check_manifest(directory, output, chunk_size)
+
+    counts = dict.fromkeys(REFERENCE_TABLES + JOB_TABLES, 0)
+    counts["skipped"] = 0
+
+    for name in REFERENCE_TABLES:
+        table = _table(name)
+        path = os.path.join(directory, name, "all" + extension)
+        if os.path.exists(path):
+            continue
+        query = select(table).order_by(table.c.id)
+        counts[name] += _write_table(path, table, output, query, batch_size)
+
+    for start in _chunk_starts(chunk_size, start_id, end_id):
+        end = start + chunk_size
+        chunk = _chunk_name(start, end)
+        if os.path.exists(os.path.join(directory, "job", chunk + extension)):
+            counts["skipped"] += 1
+            continue
+
+        queries = _job_queries(
+            lambda column: and_(column >= start, column < end)
+        )
+        # The job file is written last, it marks the chunk as complete
+        _write_jobs(directory, chunk, output, queries, batch_size, counts)
+        # Release the connection between chunks
+        db.session.rollback()
+
+    return counts
+
+
+def archive_jobs(directory, job_ids, output="ndjson", batch_size=10000):
+    """Export a set of jobs to a directory, e.g. before deleting them.
+
+    The jobs are written as a single chunk, named after their range of
+    ids, that can be imported with `import_database`. Must be called within
+    the app context.
+
+    Parameters
+    ----------
+    directory : `str`
+        The archive directory, created if needed.
+    job_ids : `list` [`int`]
+        IDs of the jobs.
+    output : `str`
+        Format of the files, see `FORMATS`.
+    batch_size : `int`
+        Number of rows fetched and written at a time.
+
+    Returns
+    -------
+    counts : `dict`
+        Number of rows archived per table.
+    """
+    counts = dict.fromkeys(JOB_TABLES, 0)
+    if not job_ids:
+        return counts
+    chunk = _chunk_name(min(job_ids), max(job_ids) + 1)
+    queries = _job_queries(lambda column: column.in_(job_ids))
+    _write_jobs(directory, chunk, output, queries, batch_size, counts)
+    return counts
+
+
+def _chunk_range(filename):
+    """Return the range of job ids of a chunk file."""
+    start, end = filename.split(".", 1)[0].split("-")
+    return int(start), int(end)
+
+
+def _files(directory, name):
+    """Return the table files of a directory, sorted by chunk."""
+    path = os.path.join(directory, name)
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        filename
+        for filename in os.listdir(path)
+        if filename.endswith(tuple(FORMATS.values()))
+    )
+
+
+def _insert(table, path, batch_size, exclude=None, ignore=False):
+    """Insert the rows of a table file with bulk inserts.
+
+    Parameters
+    ----------
+    exclude : `set` [`int`], optional
+        Ids of the rows not to insert, e.g. already in the database.
+    ignore : `bool`
+        Skip the rows whose key is already in the database instead of
+        failing, e.g. rows inserted concurrently by another import.
+
+    Returns
+    -------
+    count : `int`
+        Number of rows inserted.
+    """
+    statement = table.insert()
+    if ignore:
+        statement = statement.prefix_with("IGNORE", dialect="mysql")
+        statement = statement.prefix_with("OR IGNORE", dialect="sqlite")
+    count = 0
+    for rows in _read_rows(path, table, batch_size):
+        if exclude:
+            rows = [row for row in rows if row["id"] not in exclude]
+        if not rows:
+            continue
+        result = db.session.execute(statement, rows)
+        # The rows ignored are not counted, if the driver reports them
+        count += (
+            result.rowcount if ignore and result.rowcount >= 0 else len(rows)
+        )
+    return count
+
+
+def _existing_ids(table, path, batch_size):
+    """Return the ids of the rows of a table file already in the database."""
+    existing = set()
+    for rows in _read_rows(path, table, batch_size):
+        ids = [row["id"] for row in rows]
+        existing.update(
+            db.session.execute(
+                select(table.c.id).where(table.c.id.in_(ids))
+            ).scalars()
+        )
+    return existing
+
+
+def import_database(directory, start_id=None, end_id=None, batch_size=10000):
+    """Import an exported database.
+
+    Must be called within the app context. The database tables must exist.
+    Rows of the reference tables already in the database are not imported,
+    chunks whose jobs are already in the database are skipped.
+
+    Parameters
+    ----------
+    directory : `str`
+        The directory written by `export_database`.
+    start_id : `int`, optional
+        Import the chunks of jobs that start at this id or larger.
+    end_id : `int`, optional
+        Import the chunks of jobs that start before this id.
+    batch_size : `int`
+        Number of rows read and inserted at a time.
+
+    Returns
+    -------
+    counts : `dict`
+        Number of rows imported per table, and of chunks skipped because
+        they were already imported.
+
+    Raises
+    ------
+    RuntimeError
+        If the files are in Parquet and pyarrow is not installed.
+    """
+    counts = dict.fromkeys(REFERENCE_TABLES + JOB_TABLES, 0)
+    counts["skipped"] = 0
+
+    for name in REFERENCE_TABLES:
+        table = _table(name)
+        for filename in _files(directory, name):
+            path = os.path.join(directory, name, filename)
+            try:
+                counts[name] += _insert(
+                    table,
+                    path,
+                    batch_size,
+                    _existing_ids(table, path, batch_size),
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    job = _table("job")
+    for filename in _files(directory, "job"):
+        start, end = _chunk_range(filename)
+        if (start_id is not None and start < start_id) or (
+            end_id is not None and start >= end_id
+        ):
+            continue
+
+        path = os.path.join(directory, "job", filename)
+        if _existing_ids(job, path, batch_size):
+            counts["skipped"] += 1
+            continue
+
+        try:
+            for name in JOB_TABLES:
+                table = _table(name)
+                path = os.path.join(directory, name, filename)
+                if not os.path.exists(path):
+                    continue
+                # Blobs referenced by several chunks are exported with each,
+                # and may be inserted concurrently by the import of another
+                # range
+                exclude = None
+                if name == "blob":
+                    exclude = _existing_ids(table, path, batch_size)
+                counts[name] += _insert(
+                    table, path, batch_size, exclude, ignore=name == "blob"
+                )
+            # Measurements exported by older versions have no date
+            set_measurement_dates(
+                MeasurementModel.job_id >= start, MeasurementModel.job_id < end
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return counts
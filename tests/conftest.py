@@ -1,13 +1,15 @@
 """squash-api pytest fixtures."""
 
 import os
+from contextlib import contextmanager
 
 import pymysql
 import pytest
 import redis
 
-from squash.config import Development
-from squash.models import UserModel
+from squash.config import Development, Testing
+from squash.instrumentation import count_statements
+from squash.models import EnvModel, JobModel, MetricModel, UserModel, db
 
 # timeout in seconds to get the docker services running
 DOCKER_SERVICE_TIMEOUT = 120
@@ -88,3 +90,74 @@ def test_client(ensure_redis_service, ensure_mysql_service):
     ctx.push()
     yield testing_client  # this is where the testing happens!
     ctx.pop()
+
+
+@pytest.fixture
+def sqlite_app(tmp_path):
+    """Create an app with a SQLite database, without external services."""
+    from squash.app import create_app
+
+    class SQLite(Testing):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///{}".format(tmp_path / "squash.db")
+        SQLALCHEMY_ECHO = False
+
+    app = create_app(SQLite)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def auth_headers(sqlite_app):
+    """Return the headers of the requests of the default user."""
+    response = sqlite_app.test_client().post(
+        "/auth",
+        json={
+            "username": sqlite_app.config["DEFAULT_USER"],
+            "password": sqlite_app.config["DEFAULT_PASSWORD"],
+        },
+    )
+    return {"Authorization": "JWT {}".format(response.json["access_token"])}
+
+
+@pytest.fixture
+def sqlite_job(sqlite_app):
+    """Create a job of 2019 and the validate_drp.AM1 metric.
+
+    Returns the ID of the job.
+    """
+    with sqlite_app.app_context():
+        env = EnvModel("jenkins")
+        env.save_to_db()
+        job = JobModel(
+            env.id,
+            {"ci_dataset": "HSC", "date": "2019-01-31T12:00:00Z"},
+            {},
+            etl_mode=True,
+        )
+        db.session.add(job)
+        MetricModel("validate_drp.AM1", unit="marcsec").save_to_db()
+        return job.id
+
+
+@pytest.fixture
+def max_queries():
+    """Assert the maximum number of SQL statements executed by a block.
+
+    Usage::
+
+        with max_queries(2):
+            test_client.get("/jobs")
+    """
+
+    @contextmanager
+    def check(n):
+        with count_statements() as statements:
+            yield statements
+        assert (
+            len(statements) <= n
+        ), "{} SQL statements, expected {}:\n{}".format(
+            len(statements), n, "\n".join(statements)
+        )
+
+    return check
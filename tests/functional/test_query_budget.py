@@ -0,0 +1,110 @@
+"""Test the number of SQL statements executed by the squash-api routes.
+
+Guard against N+1 queries, the number of statements must not depend on the
+number of measurements, blobs or packages in the job, neither to read nor
+to delete the job.
+"""
+
+import json
+import os
+
+import pytest
+from flask import current_app
+
+from squash.cache import NullBackend
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+@pytest.fixture(scope="module")
+def job(test_client):
+    """Load the metrics, specifications and a job from the test data."""
+    with open(os.path.join(DATA_DIR, "verify_job_with_null.json")) as f:
+        data = json.load(f)
+    data["meta"]["env"].update(env_name="jenkins", ci_id="budget")
+
+    response = test_client.post(
+        "/auth", json={"username": "mole", "password": "desert"}
+    )
+    headers = {"Authorization": "JWT " + response.json["access_token"]}
+
+    test_client.post(
+        "/metrics", json={"metrics": data["metrics"]}, headers=headers
+    )
+    test_client.post("/specs", json={"specs": data["specs"]}, headers=headers)
+    test_client.post("/job", json=data, headers=headers)
+    return {
+        "id": test_client.get("/jobs").json["ids"][-1],
+        "ci_id": "budget",
+        "metric": data["metrics"][0]["name"],
+        "spec": data["specs"][0]["name"],
+        "package": next(iter(data["meta"]["packages"])),
+        "headers": headers,
+    }
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch, test_client):
+    """Do not read responses from the cache."""
+    monkeypatch.setitem(current_app.extensions, "squash_cache", NullBackend())
+
+
+@pytest.mark.parametrize(
+    "url,budget",
+    [
+        ("/", 0),
+        ("/jobs", 1),
+        ("/compare?base={id}&head={id}", 5),
+        ("/matrix", 3),
+        ("/job/{id}", 2),
+        ("/jenkins/{ci_id}", 3),
+        ("/code_changes?ci_name=unknown&start={ci_id}&end={ci_id}", 3),
+        ("/measurement/{id}", 4),
+        ("/measurements", 2),
+        ("/metric/{metric}", 1),
+        ("/metric/{metric}/series", 2),
+        ("/evaluation?job_id={id}", 3),
+        ("/change_points?job_id={id}", 1),
+        ("/metrics", 1),
+        ("/spec/{spec}", 1),
+        ("/specs", 1),
+        ("/datasets", 1),
+        ("/packages", 1),
+        ("/package/{package}/history", 2),
+        ("/users", 1),
+        ("/user/mole", 1),
+        ("/stats", 5),
+        ("/version", 0),
+    ],
+)
+def test_query_budget(test_client, job, max_queries, url, budget):
+    """Check the number of SQL statements executed by GET requests."""
+    with max_queries(budget):
+        response = test_client.get(url.format(**job))
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "url,budget",
+    [
+        # Authentication, find the metric, delete its measurements and
+        # their blob associations, and a DELETE of the metric whose other
+        # rows are deleted by the ON DELETE CASCADE foreign keys
+        ("/metric/{metric}", 5),
+        # Authentication, find the job, find its blobs, delete its
+        # measurements and their blob associations, its orphaned blobs and
+        # a DELETE of the job whose other rows are deleted by the ON DELETE
+        # CASCADE foreign keys, see squash.retention.delete_jobs
+        ("/job/{id}", 7),
+    ],
+)
+def test_delete_budget(test_client, job, max_queries, url, budget):
+    """Check the number of SQL statements executed by DELETE requests.
+
+    Run after the GET requests, which need the job and its metrics.
+    """
+    with max_queries(budget):
+        response = test_client.delete(
+            url.format(**job), headers=job["headers"]
+        )
+    assert response.status_code == 200
@@ -0,0 +1,141 @@
+"""Test squash-api bulkload module."""
+
+import io
+import json
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from squash.bulkload import BulkLoader, find_documents, validate_document
+from squash.ingest import JobDocument, JobLoader
+from squash.instrumentation import count_statements
+from squash.models import BlobModel, EnvModel, JobModel, MetricModel, db
+
+VALID = {
+    "meta": {
+        "env": {
+            "env_name": "jenkins",
+            "ci_id": "1",
+            "ci_name": "validate_drp",
+            "date": "2019-01-31T12:00:00Z",
+        },
+        "packages": {},
+    },
+    "measurements": [
+        {"metric": "validate_drp.AM1", "value": 1.5, "unit": "marcsec"}
+    ],
+    "blobs": [],
+}
+
+# The measurement has no metric name
+INVALID = dict(VALID, measurements=[{"value": 1.5}])
+
+
+@pytest.fixture
+def documents(tmp_path):
+    """Write a valid and an invalid job document in a directory tree."""
+    (tmp_path / "2019").mkdir()
+    valid = tmp_path / "2019" / "valid.json"
+    valid.write_text(json.dumps(VALID))
+    invalid = tmp_path / "invalid.json"
+    invalid.write_text(json.dumps(INVALID))
+    (tmp_path / "README.rst").write_text("Not a job document.")
+    return str(valid), str(invalid)
+
+
+@pytest.mark.unit
+def test_find_documents(tmp_path, documents):
+    """Test that the documents are found in the sub-directories."""
+    valid, invalid = documents
+    assert find_documents(str(tmp_path)) == sorted([valid, invalid])
+
+
+@pytest.mark.unit
+def test_validate_document(sqlite_app, documents):
+    """Test that the invalid document is reported."""
+    valid, invalid = documents
+    with sqlite_app.app_context():
+        assert validate_document(valid) is None
+        assert "metric name" in validate_document(invalid)
+
+
+@pytest.mark.unit
+def test_load(sqlite_app, documents):
+    """Test that the valid document is loaded and the error reported."""
+    valid, invalid = documents
+    with sqlite_app.app_context():
+        MetricModel("validate_drp.AM1", unit="marcsec").save_to_db()
+
+    loader = BulkLoader(sqlite_app, "squash.config.Testing")
+    results = list(loader.load([valid, invalid]))
+    assert [path for path, _, _ in results] == [valid, invalid]
+    (_, job_id, error), (_, no_job_id, invalid_error) = results
+    assert error is None and no_job_id is None
+    assert "metric name" in invalid_error
+
+    with sqlite_app.app_context():
+        job = db.session.get(JobModel, job_id)
+        assert job.date_created.year == 2019
+        assert len(job.measurements) == 1
+
+
+@pytest.mark.unit
+def test_env_created_concurrently(sqlite_app, monkeypatch):
+    """Test that an env created by another worker is reused."""
+    with sqlite_app.app_context():
+        env = EnvModel("jenkins")
+        env.save_to_db()
+        env_id = env.id
+
+        # The env is created after the other worker looked it up
+        find_by_name = EnvModel.find_by_name
+        lookups = []
+
+        def find_after_insert(name):
+            lookups.append(name)
+            if len(lookups) == 1:
+                return None
+            return find_by_name(name)
+
+        monkeypatch.setattr(EnvModel, "find_by_name", find_after_insert)
+        loader = JobLoader(JobDocument(None))
+        loader.meta = VALID["meta"]
+        assert loader.check_or_create_env() == env_id
+        assert lookups == ["jenkins", "jenkins"]
+        assert EnvModel.query.filter_by(name="jenkins").count() == 1
+
+
+@pytest.mark.unit
+def test_env_name_unique(sqlite_app):
+    """Test that the env names are unique."""
+    with sqlite_app.app_context():
+        EnvModel("jenkins").save_to_db()
+        with pytest.raises(IntegrityError):
+            EnvModel("jenkins").save_to_db()
+
+
+@pytest.mark.unit
+def test_insert_blobs(sqlite_app):
+    """Test that the blobs are inserted without a statement per blob."""
+    blobs = [
+        {"identifier": f"{i:032x}", "name": f"blob{i}", "data": {}}
+        for i in range(5)
+    ]
+    document = dict(
+        VALID,
+        measurements=[
+            dict(m, blob_refs=[b["identifier"] for b in blobs])
+            for m in VALID["measurements"]
+        ],
+        blobs=blobs,
+    )
+    loader = JobLoader(JobDocument(io.BytesIO(json.dumps(document).encode())))
+    with sqlite_app.app_context():
+        loader.scan()
+        with count_statements() as statements:
+            loader.insert_blobs()
+        assert not [s for s in statements if s.startswith("SELECT")]
+
+        ids = dict(db.session.query(BlobModel.identifier, BlobModel.id))
+        assert loader.blob_ids == ids
+        assert len(ids) == 5
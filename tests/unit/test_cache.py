@@ -0,0 +1,97 @@
+"""Test squash-api cache module."""
+
+import pytest
+from flask import Flask
+from flask_restful import Api, Resource
+
+from squash.cache import Cache, SimpleBackend
+
+cache = Cache()
+calls = []
+
+
+class Item(Resource):
+    """A resource that records how many times it is computed."""
+
+    @cache.cached("item", item="item_id")
+    def get(self, item_id):
+        """Return an item."""
+        calls.append(item_id)
+        if item_id == 0:
+            return {"message": "Item not found"}, 404
+        return {"id": item_id, "data": "x" * item_id}
+
+
+@pytest.fixture(scope="function")
+def client():
+    """Create an app with a simple cache backend."""
+    app = Flask(__name__)
+    app.config["SQUASH_CACHE_TYPE"] = "simple"
+    app.config["SQUASH_CACHE_TIMEOUTS"] = {"item": 60}
+    app.config["SQUASH_CACHE_MAX_ENTRY_SIZE"] = 100
+    cache.init_app(app)
+    api = Api(app)
+    api.add_resource(Item, "/item/<int:item_id>")
+    calls.clear()
+    with app.app_context():
+        yield app.test_client()
+
+
+@pytest.mark.unit
+def test_simple_backend_timeout():
+    """Test that expired entries are not returned."""
+    backend = SimpleBackend()
+    backend.set("key", b"value", timeout=-1)
+    assert backend.get("key") is None
+    backend.set("key", b"value")
+    assert backend.get("key") == b"value"
+
+
+@pytest.mark.unit
+def test_cached(client):
+    """Test that a response is computed once and then read from cache."""
+    first = client.get("/item/1")
+    second = client.get("/item/1")
+    assert calls == [1]
+    assert first.json == second.json == {"id": 1, "data": "x"}
+    assert cache.stats()["item"]["hits"] == 1
+    assert cache.stats()["item"]["misses"] == 1
+
+
+@pytest.mark.unit
+def test_errors_not_cached(client):
+    """Test that error responses are not cached."""
+    client.get("/item/0")
+    response = client.get("/item/0")
+    assert response.status_code == 404
+    assert calls == [0, 0]
+
+
+@pytest.mark.unit
+def test_entry_size_limit(client):
+    """Test that responses above the size limit are not cached."""
+    client.get("/item/200")
+    client.get("/item/200")
+    assert calls == [200, 200]
+
+
+@pytest.mark.unit
+def test_invalidate(client):
+    """Test invalidation of an item of a resource."""
+    client.get("/item/1")
+    client.get("/item/2")
+    cache.invalidate("item", 1)
+    client.get("/item/1")
+    client.get("/item/2")
+    assert calls == [1, 2, 1]
+
+
+@pytest.mark.unit
+def test_invalidate_resource(client):
+    """Test that invalidating a resource invalidates all its items."""
+    client.get("/item/1")
+    client.get("/item/2")
+    cache.invalidate("item")
+    client.get("/item/1")
+    client.get("/item/2")
+    assert calls == [1, 2, 1, 2]
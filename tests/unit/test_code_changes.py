@@ -0,0 +1,56 @@
+"""Test squash-api code_changes resources."""
+
+import pytest
+
+from squash.models import EnvModel, JobModel, PackageModel, db
+
+
+@pytest.fixture
+def runs(sqlite_app):
+    """Create four runs of validate_drp, the second one with two jobs."""
+    with sqlite_app.app_context():
+        env = EnvModel("jenkins")
+        env.save_to_db()
+        for day, ci_id in enumerate(["1", "2", "2", "3", "4"], start=1):
+            job = JobModel(
+                env.id,
+                {
+                    "ci_id": ci_id,
+                    "ci_name": "validate_drp",
+                    "date": f"2020-01-{day:02d}T00:00:00Z",
+                },
+                {},
+                etl_mode=True,
+            )
+            db.session.add(job)
+            db.session.flush()
+            db.session.add(PackageModel(job.id, "afw", f"sha{ci_id}"))
+        db.session.commit()
+
+
+def get(app, start, end):
+    """Get the code changes between two runs."""
+    return app.test_client().get(
+        "/code_changes",
+        query_string={"ci_name": "validate_drp", "start": start, "end": end},
+    )
+
+
+@pytest.mark.unit
+def test_code_changes_range(sqlite_app, runs, max_queries):
+    """Test the package changes of the runs in a range."""
+    with max_queries(3):
+        response = get(sqlite_app, "2", "4")
+    assert response.status_code == 200
+    assert response.json["runs"] == 3
+    assert [step["ci_id"] for step in response.json["steps"]] == ["3", "4"]
+    assert [step["previous_id"] for step in response.json["steps"]] == [2, 4]
+
+
+@pytest.mark.unit
+def test_code_changes_range_errors(sqlite_app, runs):
+    """Test a range with an unknown run or in reverse order."""
+    assert get(sqlite_app, "2", "5").status_code == 404
+    response = get(sqlite_app, "3", "1")
+    assert response.status_code == 400
+    assert response.json["message"] == "start must precede end."
@@ -0,0 +1,70 @@
+"""Test squash-api compare module."""
+
+import numpy as np
+import pytest
+
+from squash.compare import align_measurements, compare_specs, diff_packages
+
+
+@pytest.mark.unit
+def test_diff_packages():
+    """Return the new and updated packages of the current job."""
+    previous = [("afw", "a1", "url"), ("daf_butler", "b1", "url")]
+    current = [("afw", "a2", "url"), ("daf_butler", "b1", "url")]
+    current.append(("pipe_tasks", "c1", "url"))
+    assert diff_packages(previous, current) == {
+        "packages": [("afw", "a2", "url"), ("pipe_tasks", "c1", "url")],
+        "counts": 2,
+    }
+    assert diff_packages(current, current) == {"packages": [], "counts": 0}
+
+
+@pytest.mark.unit
+def test_align_measurements():
+    """Align by metric name and compute deltas in the base unit."""
+    base = {
+        "metrics": np.array(["p.AM1", "p.PA1", "p.TE1"]),
+        "values": np.array([10.0, 0.02, 1.0]),
+        "units": np.array(["marcsec", "mag", ""]),
+    }
+    head = {
+        "metrics": np.array(["p.PA1", "p.AM1", "p.AD1"]),
+        "values": np.array([25.0, 12.0, 3.0]),
+        "units": np.array(["mmag", "marcsec", "marcsec"]),
+    }
+    columns = align_measurements(base, head)
+    assert columns["metrics"].tolist() == ["p.AD1", "p.AM1", "p.PA1", "p.TE1"]
+    assert columns["units"].tolist() == ["marcsec", "marcsec", "mag", ""]
+    assert np.allclose(
+        columns["deltas"], [np.nan, 2.0, 0.005, np.nan], equal_nan=True
+    )
+    assert np.allclose(
+        columns["relative_deltas"], [np.nan, 0.2, 0.25, np.nan], equal_nan=True
+    )
+
+
+@pytest.mark.unit
+def test_compare_specs():
+    """Return the specifications whose status changed."""
+    base = {
+        "specs": np.array(["p.AM1.design", "p.AM1.stretch", "p.PA1.design"]),
+        "metrics": np.array(["p.AM1", "p.AM1", "p.PA1"]),
+        "status": np.array(["pass", "fail", "pass"], dtype="U7"),
+        "margins": np.array([1.0, -1.0, 2.0]),
+    }
+    head = {
+        "specs": np.array(["p.PA1.design", "p.AM1.design", "p.AD1.design"]),
+        "metrics": np.array(["p.PA1", "p.AM1", "p.AD1"]),
+        "status": np.array(["pass", "fail", "unknown"], dtype="U7"),
+        "margins": np.array([3.0, -0.5, np.nan]),
+    }
+    columns, summary = compare_specs(base, head)
+    assert columns["specs"].tolist() == [
+        "p.AD1.design",
+        "p.AM1.design",
+        "p.AM1.stretch",
+    ]
+    assert columns["metrics"].tolist() == ["p.AD1", "p.AM1", "p.AM1"]
+    assert columns["base_status"].tolist() == ["", "pass", "fail"]
+    assert columns["head_status"].tolist() == ["unknown", "fail", ""]
+    assert summary == {"passed": 1, "regressions": 1, "fixes": 0}
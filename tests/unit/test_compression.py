@@ -0,0 +1,82 @@
+"""Test squash-api compression module."""
+
+import gzip
+import json
+
+import pytest
+import zstandard
+from flask import Flask, request
+
+from squash.compression import Compression
+
+
+@pytest.fixture(scope="module")
+def client():
+    """Create an app that echoes the request body."""
+    app = Flask(__name__)
+    app.config["SQUASH_MAX_DECOMPRESSED_SIZE"] = 1024
+    app.config["SQUASH_COMPRESS_MIN_SIZE"] = 100
+    Compression(app)
+
+    @app.route("/echo", methods=["GET", "POST"])
+    def echo():
+        if request.method == "POST":
+            return request.get_json()
+        return {"data": "x" * int(request.args["size"])}
+
+    return app.test_client()
+
+
+def post(client, body, encoding):
+    """Post a body with a given content encoding."""
+    return client.post(
+        "/echo",
+        data=body,
+        headers={
+            "Content-Encoding": encoding,
+            "Content-Type": "application/json",
+        },
+    )
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "encoding, compress",
+    [("gzip", gzip.compress), ("zstd", zstandard.compress)],
+)
+def test_compressed_request(client, encoding, compress):
+    """Test decompression of the request body."""
+    body = json.dumps({"measurements": [1.0] * 10}).encode()
+    response = post(client, compress(body), encoding)
+    assert response.status_code == 200
+    assert response.json == {"measurements": [1.0] * 10}
+
+
+@pytest.mark.unit
+def test_decompressed_size_limit(client):
+    """Test that bodies larger than the limit are rejected."""
+    body = json.dumps({"data": "x" * 2048}).encode()
+    response = post(client, gzip.compress(body), "gzip")
+    assert response.status_code == 413
+
+
+@pytest.mark.unit
+def test_invalid_request(client):
+    """Test invalid compressed bodies and unsupported encodings."""
+    assert post(client, b"not gzip", "gzip").status_code == 400
+    assert post(client, b"{}", "br").status_code == 415
+
+
+@pytest.mark.unit
+def test_compressed_response(client):
+    """Test negotiation of the response encoding."""
+    headers = {"Accept-Encoding": "gzip"}
+    response = client.get("/echo?size=1000", headers=headers)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.data)) == {"data": "x" * 1000}
+
+    response = client.get("/echo?size=10", headers=headers)
+    assert "Content-Encoding" not in response.headers
+
+    response = client.get("/echo?size=1000")
+    assert "Content-Encoding" not in response.headers
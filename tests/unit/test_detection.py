@@ -0,0 +1,63 @@
+"""Test squash-api detection module."""
+
+import pytest
+
+from squash.detection import Detector
+from squash.models import SeriesStateModel
+
+
+@pytest.mark.unit
+def test_welford():
+    """Update the running mean and variance in constant time."""
+    detector = Detector(min_count=100)
+    state = SeriesStateModel(1)
+    for value in [1.0, 2.0, 3.0, 4.0]:
+        assert detector.update(state, value) is None
+    assert state.count == 4
+    assert state.mean == 2.5
+    assert state.m2 / (state.count - 1) == pytest.approx(5 / 3)
+
+
+@pytest.mark.unit
+def test_change_point():
+    """Flag a shift of the mean and restart from the new level."""
+    detector = Detector(drift=0.5, threshold=5.0, min_count=10)
+    state = SeriesStateModel(1)
+    noise = [0.1, -0.1, 0.05, -0.05, 0.0] * 4
+    for value in noise:
+        assert detector.update(state, 10 + value) is None
+
+    change = detector.update(state, 12.0)
+    assert change["direction"] == "up"
+    assert change["statistic"] > 5.0
+    assert change["mean"] == pytest.approx(10.0)
+    assert state.count == 1
+    assert state.mean == 12.0
+    assert state.cusum_pos == state.cusum_neg == 0.0
+
+
+@pytest.mark.unit
+def test_small_shifts_accumulate():
+    """Flag a sustained shift smaller than the threshold."""
+    detector = Detector(drift=0.5, threshold=5.0, min_count=10)
+    state = SeriesStateModel(1)
+    for value in [-1.0, 1.0] * 10:
+        detector.update(state, value)
+
+    changes = [detector.update(state, -2.0) for _ in range(5)]
+    assert changes[0] is None
+    assert [c["direction"] for c in changes if c] == ["down"]
+
+
+@pytest.mark.unit
+def test_min_count():
+    """Require two values to estimate the standard deviation."""
+    for min_count in [0, 1]:
+        with pytest.raises(ValueError, match="min_count"):
+            Detector(min_count=min_count)
+
+    detector = Detector(threshold=1.0, min_count=2)
+    state = SeriesStateModel(1)
+    assert detector.update(state, 1.0) is None
+    assert detector.update(state, 1.0) is None
+    assert detector.update(state, 2.0)["direction"] == "up"
@@ -0,0 +1,66 @@
+"""Test squash-api downsample module."""
+
+import numpy as np
+import pytest
+
+from squash.downsample import aggregate, downsample, lttb, minmax
+
+
+@pytest.mark.unit
+def test_lttb():
+    """Select n points, including the first, the last and the peak."""
+    x = np.arange(100)
+    y = np.zeros(100)
+    y[42] = 10
+    indices = lttb(x, y, 10)
+    assert len(indices) == 10
+    assert indices[0] == 0 and indices[-1] == 99
+    assert 42 in indices
+    assert np.all(np.diff(indices) > 0)
+    assert lttb(x[:5], y[:5], 10).tolist() == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.unit
+def test_minmax():
+    """Select the minimum and maximum values of each bucket."""
+    x = np.arange(100)
+    y = np.sin(x / 5)
+    indices = minmax(x, y, 10)
+    assert len(indices) <= 10
+    assert np.argmin(y) in indices and np.argmax(y) in indices
+
+    for n in range(4):
+        assert len(minmax(x, y, n)) <= n
+    assert minmax(x, y, 1).tolist() == [0]
+
+
+@pytest.mark.unit
+def test_aggregate():
+    """Aggregate the values in time buckets, skip empty buckets and NaN."""
+    timestamps = np.array([0, 10, 20, 30, 35, 90], dtype="i8").astype(
+        "datetime64[s]"
+    )
+    values = np.array([1.0, 2.0, 6.0, np.nan, 4.0, 5.0])
+    columns = aggregate(timestamps, values, 3)
+    assert columns["timestamps"].astype("i8").tolist() == [0, 31, 62]
+    assert columns["count"].tolist() == [3, 1, 1]
+    assert columns["mean"].tolist() == [3.0, 4.0, 5.0]
+    assert columns["median"].tolist() == [2.0, 4.0, 5.0]
+    assert columns["min"].tolist() == [1.0, 4.0, 5.0]
+    assert columns["max"].tolist() == [6.0, 4.0, 5.0]
+
+
+@pytest.mark.unit
+def test_downsample():
+    """Return the selected rows of all the columns without NaN."""
+    columns = {
+        "timestamps": np.arange(10).astype("datetime64[s]"),
+        "values": np.array([np.nan] + [1.0] * 9),
+        "job_ids": np.arange(10),
+    }
+    selected = downsample(columns, "lttb", 3)
+    assert len(selected["job_ids"]) == 3
+    assert selected["job_ids"][0] == 1 and selected["job_ids"][-1] == 9
+    assert not np.isnan(selected["values"]).any()
+    with pytest.raises(ValueError):
+        downsample(columns, "bogus", 3)
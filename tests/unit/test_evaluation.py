@@ -0,0 +1,90 @@
+"""Test squash-api evaluation module."""
+
+import numpy as np
+import pytest
+
+from squash.evaluation import SpecTable, summarize, unit_scale
+
+
+@pytest.fixture
+def table():
+    """Compile threshold specifications of two metrics."""
+    return SpecTable(
+        [
+            (
+                "a.M1.design",
+                1,
+                "a.M1",
+                {"operator": "<=", "value": 10.0, "unit": "mmag"},
+                {},
+            ),
+            (
+                "a.M1.r",
+                1,
+                "a.M1",
+                {"operator": "<=", "value": 5.0, "unit": "mmag"},
+                {"filter_name": "r"},
+            ),
+            (
+                "a.M2.design",
+                2,
+                "a.M2",
+                {"operator": ">", "value": 50, "unit": "%"},
+                {"instrument": "any"},
+            ),
+            ("a.M2.invalid", 2, "a.M2", {"operator": "~", "value": 1}, {}),
+        ]
+    )
+
+
+@pytest.mark.unit
+def test_unit_scale():
+    """Convert between units of the same type only."""
+    assert unit_scale("mmag", "mag") == 1e-3
+    assert unit_scale("", "%") == 100
+    assert unit_scale(None, "") == 1
+    assert np.isnan(unit_scale("mmag", "arcsec"))
+    assert np.isnan(unit_scale("furlong", "mag"))
+
+
+@pytest.mark.unit
+def test_evaluate(table):
+    """Evaluate the applicable specifications in one pass."""
+    measurements = {
+        "measurement_ids": np.array([1, 2, 3, 4]),
+        "job_ids": np.array([10, 10, 11, 11]),
+        "metric_ids": np.array([1, 2, 1, 2]),
+        "values": np.array([0.008, 0.6, 7.0, np.nan]),
+        "units": np.array(["mag", "", "mmag", ""]),
+    }
+    metas = {10: {"filter_name": "g"}, 11: {"filter_name": "r"}}
+    results = table.evaluate(measurements, metas)
+
+    assert results["measurement_ids"].tolist() == [1, 3, 3]
+    assert results["specs"].tolist() == [
+        "a.M1.design",
+        "a.M1.design",
+        "a.M1.r",
+    ]
+    assert results["status"].tolist() == ["pass", "pass", "fail"]
+    assert np.allclose(results["thresholds"], [0.01, 10, 5])
+    assert np.allclose(results["margins"], [0.002, 3, -2])
+
+
+@pytest.mark.unit
+def test_evaluate_unknown(table):
+    """Report missing values and incomparable units as unknown."""
+    measurements = {
+        "measurement_ids": np.array([1, 2]),
+        "job_ids": np.array([10, 10]),
+        "metric_ids": np.array([2, 1]),
+        "values": np.array([np.nan, 1.0]),
+        "units": np.array(["", "arcsec"]),
+    }
+    results = table.evaluate(measurements, {10: {"instrument": "HSC"}})
+    assert results["specs"].tolist() == ["a.M2.design", "a.M1.design"]
+    assert results["status"].tolist() == ["unknown", "unknown"]
+
+    summary = summarize(results)
+    assert (summary["passed"], summary["failed"]) == (0, 0)
+    assert summary["unknown"] == 2
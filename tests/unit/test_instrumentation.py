@@ -0,0 +1,133 @@
+"""Test squash-api instrumentation module."""
+
+import pytest
+from flask import Flask, g
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+
+from squash.cache import cache
+from squash.instrumentation import (
+    Instrumentation,
+    _keep_slowest,
+    count_statements,
+    generate_metrics,
+)
+
+
+@pytest.fixture(scope="module")
+def client():
+    """Create an app that runs a given number of SQL statements."""
+    app = Flask(__name__)
+    app.config.update(
+        SQUASH_CACHE_TYPE="simple",
+        SQUASH_CACHE_KEY_PREFIX="test",
+        SQUASH_CACHE_TIMEOUTS={"jobs": 60},
+        SQUASH_SQL_MAX_STATEMENTS=3,
+        SQUASH_SQL_MAX_DURATION=0,
+        SQUASH_SQL_BUDGETS={"GET unlimited": (0, 0)},
+        SQUASH_SQL_LOG_SLOWEST=3,
+    )
+    cache.init_app(app)
+    Instrumentation(app)
+    engine = create_engine("sqlite://")
+
+    @app.route("/query/<int:n>")
+    @app.route("/unlimited/<int:n>", endpoint="unlimited")
+    def query(n):
+        with engine.connect() as conn:
+            for _ in range(n):
+                conn.execute(text("SELECT 1"))
+        return {"statements": g.get("squash_sql_statements", 0)}
+
+    @app.route("/monitor")
+    def monitor():
+        data, content_type = generate_metrics()
+        return data, 200, {"Content-Type": content_type}
+
+    return app.test_client()
+
+
+def sample(name, **labels):
+    """Return the value of a sample in the default registry."""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.unit
+def test_sql_statements_per_request(client):
+    """Count the SQL statements executed by each request."""
+    labels = {"method": "GET", "endpoint": "query"}
+    count = sample("squash_request_sql_statements_count", **labels)
+    total = sample("squash_request_sql_statements_sum", **labels)
+
+    assert client.get("/query/3").json == {"statements": 3}
+    assert client.get("/query/0").json == {"statements": 0}
+
+    assert sample("squash_request_sql_statements_count", **labels) == count + 2
+    assert sample("squash_request_sql_statements_sum", **labels) == total + 3
+
+
+@pytest.mark.unit
+def test_request_latency(client):
+    """Record the latency labeled by endpoint and status code."""
+    labels = {"method": "GET", "endpoint": "query", "status": "200"}
+    count = sample("squash_request_duration_seconds_count", **labels)
+    client.get("/query/1")
+    assert sample("squash_request_duration_seconds_count", **labels) == (
+        count + 1
+    )
+
+
+@pytest.mark.unit
+def test_generate_metrics(client):
+    """Expose the request and cache metrics in the Prometheus format."""
+    client.get("/query/1")
+    response = client.get("/monitor")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    body = response.get_data(as_text=True)
+    assert "squash_request_duration_seconds_bucket" in body
+    assert 'squash_cache_hits_total{resource="jobs"} 0.0' in body
+
+
+@pytest.mark.unit
+def test_sql_budget(client, caplog):
+    """Log the slowest SQL statements of the requests over the budget."""
+    client.get("/query/3")
+    assert "exceeded the SQL budget" not in caplog.text
+
+    client.get("/query/4")
+    assert "GET /query/4? exceeded the SQL budget: 4 statements" in (
+        caplog.text
+    )
+    assert "The 3 slowest statements:" in caplog.text
+    assert caplog.text.count("SELECT 1") == 3
+
+    caplog.clear()
+    client.get("/unlimited/4")
+    assert "exceeded the SQL budget" not in caplog.text
+
+
+@pytest.mark.unit
+def test_count_statements(client):
+    """Record the SQL statements executed within a block."""
+    with count_statements() as statements:
+        client.get("/query/2")
+    client.get("/query/1")
+    assert statements == ["SELECT 1", "SELECT 1"]
+
+
+@pytest.mark.unit
+def test_keep_slowest():
+    """Keep a bounded number of the slowest statements."""
+    slowest = []
+    for i, elapsed in enumerate([0.3, 0.1, 0.5, 0.2, 0.4], 1):
+        _keep_slowest(slowest, (elapsed, i, f"SELECT {i}", 0), 3)
+    assert sorted(slowest, reverse=True) == [
+        (0.5, 3, "SELECT 3", 0),
+        (0.4, 5, "SELECT 5", 0),
+        (0.3, 1, "SELECT 1", 0),
+    ]
+
+    slowest = []
+    _keep_slowest(slowest, (0.1, 1, "SELECT 1", 0), 0)
+    assert slowest == []
@@ -0,0 +1,87 @@
+"""Test squash-api jsonstream module."""
+
+import io
+import json
+import math
+import pathlib
+
+import pytest
+
+from squash.jsonstream import JSONStreamReader
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "data"
+
+
+def read_document(text, chunk_size):
+    """Read a document with the stream reader, item by item."""
+    reader = JSONStreamReader(io.StringIO(text), chunk_size=chunk_size)
+    document = {}
+    for key in reader.iter_object():
+        if key in ("measurements", "blobs"):
+            document[key] = list(reader.iter_array())
+        elif key == "skipped":
+            reader.skip()
+        else:
+            document[key] = reader.decode()
+    return document
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024**2])
+def test_read_document(chunk_size):
+    """Test that values split among chunks are decoded."""
+    data = {
+        "measurements": [{"value": 12345.678, "metric": "a.b"}, {}, 1],
+        "skipped": {"a": ["]}", '"\\"[', [1, 2, {"b": None}]]},
+        "blobs": None,
+        "meta": {"env": {"name": "jenkins"}, "value": 10},
+    }
+    document = read_document(json.dumps(data), chunk_size)
+    assert document == {
+        "measurements": data["measurements"],
+        "blobs": [],
+        "meta": data["meta"],
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("chunk_size", range(1, 9))
+def test_read_numbers(chunk_size):
+    """Test that numbers split among chunks are decoded entirely."""
+    data = {
+        "measurements": [1.5, 2.25, 3e10, -0.5e-3, 10, {"value": 12.75}],
+        "meta": {"value": -1e-7},
+    }
+    text = '{"measurements": [1.5, 2.25, 3e10, -0.5E-3, 10, {"value": 12.75}]'
+    text += ', "meta": {"value": -1e-7}}'
+    assert read_document(text, chunk_size) == data
+
+
+@pytest.mark.unit
+def test_read_nan():
+    """Test that NaN values are read as with the standard library."""
+    with open(DATA_DIR / "verify_job_with_nan.json") as f:
+        reader = JSONStreamReader(f, chunk_size=4096)
+        for key in reader.iter_object():
+            if key == "measurements":
+                values = [m["value"] for m in reader.iter_array()]
+            else:
+                reader.skip()
+    assert any(math.isnan(value) for value in values)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"measurements": [1, 2}',
+        '{"meta" 1}',
+        "[]",
+        '{"skipped": {',
+        '{"skipped": ["a]',
+    ],
+)
+def test_invalid_document(text):
+    """Test that invalid documents raise ValueError."""
+    with pytest.raises(ValueError):
+        read_document(text, chunk_size=2)
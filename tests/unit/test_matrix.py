@@ -0,0 +1,56 @@
+"""Test squash-api matrix module."""
+
+import io
+
+import numpy as np
+import pytest
+
+from squash.matrix import encode, to_columns, to_npz
+
+
+@pytest.fixture
+def matrix():
+    """Create the matrix of two jobs by two metrics with a missing value."""
+    return {
+        "job_ids": np.array([10, 11]),
+        "timestamps": np.array(
+            ["2020-01-01T00:00:00", "2020-01-02T12:00:00"],
+            dtype="datetime64[s]",
+        ),
+        "datasets": np.array(["HSC", "HSC"]),
+        "ci_names": np.array(["validate_drp", "validate_drp"]),
+        "ci_ids": np.array(["1", "2"]),
+        "filter_names": np.array(["r", ""]),
+        "metrics": np.array(["validate_drp.AM1", "validate_drp.PA1"]),
+        "units": np.array(["marcsec", "mmag"]),
+        "values": np.array([[1.5, 10.0], [np.nan, 12.0]]),
+    }
+
+
+@pytest.mark.unit
+def test_to_columns(matrix):
+    """Return the job metadata columns and one column per metric."""
+    columns = to_columns(matrix)
+    assert list(columns)[-2:] == ["validate_drp.AM1", "validate_drp.PA1"]
+    np.testing.assert_array_equal(columns["validate_drp.PA1"], [10.0, 12.0])
+    np.testing.assert_array_equal(columns["ci_ids"], ["1", "2"])
+
+
+@pytest.mark.unit
+def test_to_npz(matrix):
+    """Return a compressed npz archive without pickled arrays."""
+    archive = np.load(io.BytesIO(to_npz(matrix)), allow_pickle=False)
+    assert set(archive.files) == set(matrix)
+    np.testing.assert_array_equal(archive["values"], matrix["values"])
+    np.testing.assert_array_equal(archive["timestamps"], matrix["timestamps"])
+
+
+@pytest.mark.unit
+def test_encode_parquet(matrix):
+    """Return a Parquet file, missing values as null."""
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    table = pyarrow.parquet.read_table(io.BytesIO(encode(matrix, "parquet")))
+    assert table.num_rows == 2
+    assert table.column("validate_drp.AM1").to_pylist() == [1.5, None]
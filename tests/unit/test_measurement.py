@@ -0,0 +1,53 @@
+"""Test squash-api measurement resources."""
+
+import pytest
+
+from squash.models import JobModel, db
+
+MEASUREMENT = {"metric": "validate_drp.AM1", "value": 1.5, "unit": "marcsec"}
+
+
+@pytest.mark.unit
+def test_post_measurement(sqlite_app, auth_headers, sqlite_job):
+    """Test that a posted measurement is dated with its job."""
+    client = sqlite_app.test_client()
+    response = client.post(
+        f"/measurement/{sqlite_job}", json=MEASUREMENT, headers=auth_headers
+    )
+    assert response.status_code == 201
+
+    response = client.get(
+        "/metric/validate_drp.AM1/series",
+        query_string={"start": "2019-01-01", "end": "2019-02-01"},
+    )
+    assert response.json["timestamps"] == ["2019-01-31T12:00:00Z"]
+    assert response.json["values"] == [1.5]
+    assert response.json["job_ids"] == [sqlite_job]
+
+    with sqlite_app.app_context():
+        job = db.session.get(JobModel, sqlite_job)
+        assert job.measurements[0].date_created == job.date_created
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/job/{job_id}",
+        "/measurement/{job_id}",
+        "/metric/validate_drp.AM1/series",
+    ],
+)
+def test_post_measurement_invalidates(
+    sqlite_app, auth_headers, sqlite_job, path
+):
+    """Test that the cached responses of the job are invalidated."""
+    client = sqlite_app.test_client()
+    path = path.format(job_id=sqlite_job)
+    before = client.get(path).json
+    assert client.get(path).json == before
+
+    client.post(
+        f"/measurement/{sqlite_job}", json=MEASUREMENT, headers=auth_headers
+    )
+    assert client.get(path).json != before
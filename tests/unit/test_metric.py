@@ -0,0 +1,32 @@
+"""Test squash-api metric resources."""
+
+import pytest
+
+from squash.models import MeasurementModel, db
+
+
+@pytest.fixture
+def measurement(sqlite_app, sqlite_job):
+    """Create a measurement of the job."""
+    with sqlite_app.app_context():
+        measurement = MeasurementModel(
+            sqlite_job, 1, value=1.5, unit="marcsec"
+        )
+        db.session.add(measurement)
+        db.session.commit()
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("path", ["/job/{job_id}", "/measurement/{job_id}"])
+def test_delete_metric_invalidates(
+    sqlite_app, auth_headers, sqlite_job, measurement, path
+):
+    """Test that the cached responses of every job are invalidated."""
+    client = sqlite_app.test_client()
+    path = path.format(job_id=sqlite_job)
+    before = client.get(path).json
+    assert client.get(path).json == before
+
+    response = client.delete("/metric/validate_drp.AM1", headers=auth_headers)
+    assert response.status_code == 200
+    assert client.get(path).json != before
@@ -1,9 +1,11 @@
 """Test squash-api models."""
 
+from datetime import datetime
+
 import pytest
 from sqlalchemy.sql import null
 
-from squash.models import MeasurementModel
+from squash.models import JobModel, MeasurementModel
 
 
 @pytest.fixture(scope="module")
@@ -24,3 +26,15 @@ def test_new_user(new_user):
 def test_null_measurement(null_measurement):
     """Test whether default value for a measurement is null."""
     assert null_measurement.value is null()
+
+
+@pytest.mark.unit
+def test_job_etl_mode():
+    """Test whether the job date is preserved in ETL mode."""
+    env = {"ci_dataset": "HSC", "date": "2019-01-31T12:00:00Z"}
+    job = JobModel(1, env, {}, etl_mode=True)
+    assert job.date_created == datetime(2019, 1, 31, 12)
+    assert job.ci_dataset == "HSC"
+
+    job = JobModel(1, env, {}, etl_mode=False)
+    assert job.date_created is None
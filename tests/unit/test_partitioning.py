@@ -0,0 +1,34 @@
+"""Test squash-api partitioning module."""
+
+from datetime import datetime
+
+import pytest
+
+from squash.partitioning import _last_month, _months, _partition
+
+
+@pytest.mark.unit
+def test_months():
+    """Test the months spanned by two dates."""
+    assert _months(datetime(2019, 11, 30), datetime(2020, 2, 1)) == [
+        (2019, 11),
+        (2019, 12),
+        (2020, 1),
+        (2020, 2),
+    ]
+    assert _months(datetime(2020, 2, 1), datetime(2020, 1, 1)) == []
+
+
+@pytest.mark.unit
+def test_partition():
+    """Test that a month partition ends at the start of the next month."""
+    assert _partition(2019, 12) == (
+        "PARTITION p201912 VALUES LESS THAN (1577836800)"
+    )
+
+
+@pytest.mark.unit
+def test_last_month():
+    """Test the last month of the existing partitions."""
+    assert _last_month(["p201912", "p202001", "pmax"]) == (2020, 1)
+    assert _last_month(["pmax"]) is None
@@ -0,0 +1,73 @@
+"""Test squash-api pool module."""
+
+import pytest
+from flask import Flask
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, exc
+
+from squash.models import db
+from squash.pool import InstrumentedQueuePool, Pool
+
+
+def sample(name, **labels):
+    """Return the value of a sample in the default registry."""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Create an engine with a pool of a single connection."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    Pool._instrument(engine, "test")
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.unit
+def test_checkout(engine):
+    """Test that the checkouts and the connections are recorded."""
+    waits = sample("squash_db_pool_wait_seconds_count", bind="test")
+    timeouts = sample("squash_db_pool_timeouts_total", bind="test")
+    connections = sample("squash_db_pool_connections", bind="test")
+
+    with engine.connect():
+        assert sample("squash_db_pool_checked_out", bind="test") == 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    assert sample("squash_db_pool_checked_out", bind="test") == 0
+
+    assert sample("squash_db_pool_wait_seconds_count", bind="test") == (
+        waits + 1
+    )
+    assert sample("squash_db_pool_timeouts_total", bind="test") == (
+        timeouts + 1
+    )
+    assert sample("squash_db_pool_connections", bind="test") == (
+        connections + 1
+    )
+
+
+@pytest.mark.unit
+def test_dispose(tmp_path):
+    """Test that the pools are replaced and keep their bind name."""
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+    )
+    db.init_app(app)
+    Pool(app)
+    with app.app_context():
+        engine = db.engine
+        inherited = engine.pool
+        assert isinstance(inherited, InstrumentedQueuePool)
+        assert inherited.bind == "primary"
+
+        Pool.dispose(app)
+        assert engine.pool is not inherited
+        assert engine.pool.bind == "primary"
@@ -0,0 +1,83 @@
+"""Test squash-api profiling module."""
+
+import os
+import time
+
+import pytest
+from flask import Flask
+
+from squash import profiling
+from squash.profiling import Profiler
+
+
+def busy_wait(seconds):
+    """Keep the request thread busy."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """Create an app with profiling enabled."""
+    monkeypatch.setattr(profiling, "require_admin", lambda: None)
+    app = Flask(__name__)
+    app.config.update(
+        SQUASH_PROFILING=True,
+        SQUASH_PROFILE_INTERVAL=0.001,
+        SQUASH_PROFILE_INLINE_LIMIT=10,
+    )
+    Profiler(app)
+
+    @app.route("/busy")
+    def busy():
+        busy_wait(0.05)
+        return {"status": "done"}
+
+    return app
+
+
+@pytest.mark.unit
+def test_disabled():
+    """Do not register request hooks if profiling is disabled."""
+    app = Flask(__name__)
+    Profiler(app)
+    assert not app.before_request_funcs
+    assert not app.after_request_funcs
+
+
+@pytest.mark.unit
+def test_not_requested(app):
+    """Do not profile requests without the profile parameter."""
+    response = app.test_client().get("/busy")
+    assert response.json == {"status": "done"}
+
+
+@pytest.mark.unit
+def test_inline(app):
+    """Return the profile in place of the response."""
+    client = app.test_client()
+
+    response = client.get("/busy?profile=cprofile")
+    assert response.content_type.startswith("text/plain")
+    assert "busy_wait" in response.get_data(as_text=True)
+
+    response = client.get("/busy", headers={"X-Squash-Profile": "sample"})
+    stacks = response.get_data(as_text=True).splitlines()
+    assert stacks
+    assert any("busy_wait" in stack for stack in stacks)
+    assert all(stack.rsplit(" ", 1)[1].isdigit() for stack in stacks)
+
+    response = client.get("/busy?profile=unknown")
+    assert response.status_code == 400
+
+
+@pytest.mark.unit
+def test_directory(app, tmp_path):
+    """Save the profile to the profile directory."""
+    app.config["SQUASH_PROFILE_DIR"] = str(tmp_path)
+    response = app.test_client().get("/busy?profile=cprofile")
+    assert response.json == {"status": "done"}
+    filename = response.headers["X-Squash-Profile-File"]
+    assert filename.endswith("-busy-cprofile.prof")
+    assert os.listdir(tmp_path) == [filename]
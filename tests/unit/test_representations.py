@@ -0,0 +1,43 @@
+"""Test squash-api representations module."""
+
+import json
+import pathlib
+
+import pytest
+
+from squash.representations import dumps, has_non_finite
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "data"
+
+
+def load(filename):
+    """Load a test job document."""
+    with open(DATA_DIR / filename) as f:
+        return json.load(f)
+
+
+@pytest.mark.unit
+def test_has_non_finite():
+    """Test detection of NaN and infinite values."""
+    assert not has_non_finite({"a": [1.0, {"b": None}]})
+    assert has_non_finite({"a": [1.0, {"b": float("nan")}]})
+    assert has_non_finite([float("-inf")])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "filename",
+    ["job-768.json", "verify_job_with_nan.json", "verify_job_with_null.json"],
+)
+def test_dumps(filename):
+    """Test that documents decode as with the standard library."""
+    data = load(filename)
+    assert json.loads(dumps(data)) == json.loads(json.dumps(data))
+
+
+@pytest.mark.unit
+def test_dumps_nan():
+    """Test that non-finite values are encoded as by the standard library."""
+    data = load("verify_job_with_nan.json")
+    assert dumps(data) == json.dumps(data).encode()
+    assert b"NaN" in dumps({"value": float("nan")})
@@ -0,0 +1,155 @@
+"""Test squash-api retention module."""
+
+from datetime import datetime
+
+import pytest
+
+from squash.models import (
+    BlobModel,
+    EnvModel,
+    JobModel,
+    MeasurementModel,
+    MetricModel,
+    db,
+)
+from squash.retention import RetentionPolicy, _batches, delete_jobs
+
+NOW = datetime(2020, 1, 11)
+
+
+@pytest.fixture
+def jobs(sqlite_app):
+    """Create four validate_drp jobs, the second and third on the same date.
+
+    Returns the IDs of the jobs, ordered by date.
+    """
+    with sqlite_app.app_context():
+        env = EnvModel("jenkins")
+        env.save_to_db()
+        job_ids = []
+        for ci_name, day in [
+            ("validate_drp", 1),
+            ("validate_drp", 5),
+            ("validate_drp", 5),
+            ("validate_drp", 10),
+            ("ap_verify", 1),
+        ]:
+            job = JobModel(
+                env.id,
+                {"ci_name": ci_name, "date": f"2020-01-{day:02d}T00:00:00Z"},
+                {},
+                etl_mode=True,
+            )
+            db.session.add(job)
+            db.session.flush()
+            job_ids.append(job.id)
+        db.session.commit()
+    return job_ids[:4]
+
+
+@pytest.mark.unit
+def test_policy_from_dict():
+    """Test a retention policy created from its JSON representation."""
+    policy = {
+        "env_name": "jenkins",
+        "ci_name": "validate_drp",
+        "dataset": "HSC",
+        "keep_days": 365,
+        "keep_runs": None,
+    }
+    assert RetentionPolicy.from_dict(policy).json() == policy
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "policy",
+    [
+        [],
+        {"ci_name": "validate_drp"},
+        {"keep_days": 1, "keep_weeks": 1},
+        {"keep_days": "30"},
+        {"keep_days": -1},
+        {"keep_days": 1.5},
+        {"keep_runs": True},
+        {"keep_runs": -1},
+        {"keep_runs": 0},
+    ],
+)
+def test_invalid_policy(policy):
+    """Test that invalid retention policies are rejected."""
+    with pytest.raises(ValueError):
+        RetentionPolicy.from_dict(policy)
+
+
+@pytest.mark.unit
+def test_batches():
+    """Test the batches of job ids."""
+    assert list(_batches([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(_batches([], 2)) == []
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "keep_days,keep_runs,purged",
+    [
+        # Cutoff on 2020-01-08
+        (3, None, [0, 1, 2]),
+        # Of the jobs of the same date, the one with the greater id is kept
+        (None, 2, [0, 1]),
+        (None, 4, []),
+        (None, 5, []),
+        # Jobs kept by either setting are kept
+        (3, 3, [0]),
+        (8, 1, [0]),
+    ],
+)
+def test_select(sqlite_app, jobs, keep_days, keep_runs, purged):
+    """Test the jobs selected by a policy."""
+    policy = RetentionPolicy(
+        env_name="jenkins",
+        ci_name="validate_drp",
+        keep_days=keep_days,
+        keep_runs=keep_runs,
+    )
+    with sqlite_app.app_context():
+        assert policy.select(NOW) == [jobs[i] for i in purged]
+
+
+@pytest.mark.unit
+def test_delete_jobs(sqlite_app, jobs):
+    """Test that the blobs referenced by other jobs are kept."""
+    with sqlite_app.app_context():
+        metric = MetricModel("validate_drp.AM1")
+        metric.save_to_db()
+        shared = BlobModel("0" * 32, "shared")
+        own = BlobModel("1" * 32, "own")
+        for job_id, blobs in [(jobs[0], [shared, own]), (jobs[1], [shared])]:
+            measurement = MeasurementModel(job_id, metric.id, 1.0)
+            measurement.blobs = blobs
+            db.session.add(measurement)
+        db.session.commit()
+        shared_id, own_id = shared.id, own.id
+
+        counts = delete_jobs([jobs[0]])
+        assert counts["job"] == counts["measurement"] == 1
+        assert counts["measurement_blob"] == 2
+        assert counts["blob"] == 1
+
+        assert db.session.get(JobModel, jobs[0]) is None
+        assert db.session.get(BlobModel, own_id) is None
+        assert db.session.get(BlobModel, shared_id).name == "shared"
+        measurement = MeasurementModel.query.filter_by(job_id=jobs[1]).one()
+        assert [blob.id for blob in measurement.blobs] == [shared_id]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("dry_run", [True, False])
+def test_purge_invalid_policy(sqlite_app, auth_headers, dry_run):
+    """Test that the purges with an invalid policy are rejected."""
+    response = sqlite_app.test_client().post(
+        "/purge",
+        json={"policies": [{"keep_days": "30"}], "dry_run": dry_run},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+    assert response.json["message"] == "keep_days must be an integer."
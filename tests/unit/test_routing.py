@@ -0,0 +1,150 @@
+"""Test squash-api routing module."""
+
+import pytest
+from flask import Flask
+from prometheus_client import REGISTRY
+from sqlalchemy import column, insert, literal, select, table, text
+
+from squash.cache import cache
+from squash.models import EnvModel, db
+from squash.routing import (
+    READ_PRIMARY_HEADER,
+    STICKY_COOKIE,
+    _is_read,
+    routing,
+)
+
+
+@pytest.fixture(scope="module")
+def app():
+    """Create an app with a primary and a replica database."""
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI="sqlite://",
+        SQLALCHEMY_BINDS={"replica0": "sqlite://"},
+        SQUASH_DB_READ_BINDS=["replica0"],
+        SQUASH_DB_STICKY_SECONDS=10,
+        SQUASH_CACHE_TYPE="simple",
+    )
+    db.init_app(app)
+    cache.init_app(app)
+    routing.init_app(app)
+
+    @app.route("/bind", methods=["GET", "POST"])
+    def bind():
+        engine = db.session.get_bind(clause=select(literal(1)))
+        if engine is db.engines["replica0"]:
+            return {"bind": "replica0"}
+        return {"bind": "primary"}
+
+    @app.route("/cached")
+    @cache.cached("cached")
+    def cached():
+        return bind()
+
+    @app.route("/missing")
+    def missing():
+        # The table exists on neither database
+        db.session.execute(select(column("id")).select_from(table("missing")))
+        return {}
+
+    @app.route("/fail", methods=["POST"])
+    def fail():
+        return {}, 500
+
+    yield app
+    routing.binds = []
+    routing._failed.clear()
+    # The replica metadata would be created by the apps of the other tests
+    db.metadatas.pop("replica0")
+
+
+def reads(bind):
+    """Return the number of reads routed to a replica."""
+    return (
+        REGISTRY.get_sample_value(
+            "squash_db_replica_reads_total", {"bind": bind}
+        )
+        or 0
+    )
+
+
+@pytest.mark.unit
+def test_is_read():
+    """Test that only the plain SELECT statements are routed to replicas."""
+    assert _is_read(select(EnvModel))
+    assert not _is_read(select(EnvModel).with_for_update())
+    assert not _is_read(insert(EnvModel))
+    assert not _is_read(text("SELECT 1"))
+    assert not _is_read(None)
+
+
+@pytest.mark.unit
+def test_read_requests(app):
+    """Test that the reads of GET requests are routed to the replica."""
+    client = app.test_client()
+    count = reads("replica0")
+    assert client.get("/bind").json == {"bind": "replica0"}
+    assert reads("replica0") == count + 1
+    assert client.post("/bind").json == {"bind": "primary"}
+
+    headers = {READ_PRIMARY_HEADER: "1"}
+    assert client.get("/bind", headers=headers).json == {"bind": "primary"}
+
+
+@pytest.mark.unit
+def test_read_your_writes(app):
+    """Test that the reads of a client follow its writes to the primary."""
+    client = app.test_client()
+    client.post("/fail")
+    assert client.get_cookie(STICKY_COOKIE) is None
+    assert client.get("/bind").json == {"bind": "replica0"}
+
+    client.post("/bind")
+    assert client.get_cookie(STICKY_COOKIE) is not None
+    assert client.get("/bind").json == {"bind": "primary"}
+
+
+@pytest.mark.unit
+def test_replica_failure(app):
+    """Test that the reads fall back to the primary if the replica failed."""
+    client = app.test_client()
+    routing.fail("replica0")
+    try:
+        assert client.get("/bind").json == {"bind": "primary"}
+    finally:
+        routing._failed.clear()
+    assert client.get("/bind").json == {"bind": "replica0"}
+
+
+@pytest.mark.unit
+def test_replica_error(app):
+    """Test that the requests after a replica error read from the primary."""
+    client = app.test_client()
+    failures = REGISTRY.get_sample_value(
+        "squash_db_replica_failures_total", {"bind": "replica0"}
+    )
+    try:
+        # The failed read is not retried on the primary
+        assert client.get("/missing").status_code == 500
+        assert client.get("/bind").json == {"bind": "primary"}
+    finally:
+        routing._failed.clear()
+    assert (
+        REGISTRY.get_sample_value(
+            "squash_db_replica_failures_total", {"bind": "replica0"}
+        )
+        == (failures or 0) + 1
+    )
+
+
+@pytest.mark.unit
+def test_replica_cache(app):
+    """Test that replica reads are not cached right after an invalidation."""
+    client = app.test_client()
+    with app.app_context():
+        cache.invalidate("cached")
+    assert client.get("/cached").json == {"bind": "replica0"}
+    headers = {READ_PRIMARY_HEADER: "1"}
+    assert client.get("/cached", headers=headers).json == {"bind": "primary"}
+    assert client.get("/cached").json == {"bind": "primary"}
@@ -0,0 +1,97 @@
+"""Test squash-api series module."""
+
+import io
+
+import numpy as np
+import pytest
+
+from squash.models import EnvModel, JobModel, MeasurementModel, MetricModel, db
+from squash.series import SeriesQuery, to_arrow, to_json, to_npy
+
+
+@pytest.fixture
+def columns():
+    """Create the columns of a time series with a missing value."""
+    return {
+        "timestamps": np.array(
+            ["2020-01-01T00:00:00", "2020-01-02T12:00:00"],
+            dtype="datetime64[s]",
+        ),
+        "values": np.array([1.5, np.nan]),
+        "job_ids": np.array([10, 11]),
+        "units": np.array(["mag", "mag"]),
+    }
+
+
+@pytest.mark.unit
+def test_to_json(columns):
+    """Return parallel lists, missing values as null."""
+    assert to_json(columns) == {
+        "timestamps": ["2020-01-01T00:00:00Z", "2020-01-02T12:00:00Z"],
+        "values": [1.5, None],
+        "job_ids": [10, 11],
+        "units": ["mag", "mag"],
+    }
+
+
+@pytest.mark.unit
+def test_to_npy(columns):
+    """Return a structured array in npy format."""
+    array = np.load(io.BytesIO(to_npy(columns)))
+    assert array.dtype.names == ("timestamps", "values", "job_ids", "units")
+    assert array["job_ids"].tolist() == [10, 11]
+    assert np.isnan(array["values"][1])
+    assert array["timestamps"][1] == np.datetime64("2020-01-02T12:00:00")
+
+
+@pytest.mark.unit
+def test_to_npy_empty():
+    """Encode an empty series."""
+    empty = {
+        "timestamps": np.array([], dtype="datetime64[s]"),
+        "values": np.array([], dtype="f8"),
+        "job_ids": np.array([], dtype="i8"),
+        "units": np.array([], dtype="U"),
+    }
+    assert len(np.load(io.BytesIO(to_npy(empty)))) == 0
+
+
+@pytest.mark.unit
+def test_to_arrow(columns):
+    """Return an Arrow IPC stream."""
+    pyarrow = pytest.importorskip("pyarrow")
+    table = pyarrow.ipc.open_stream(to_arrow(columns)).read_all()
+    assert table.column_names == ["timestamps", "values", "job_ids", "units"]
+    assert table.column("values").to_pylist() == [1.5, None]
+
+
+@pytest.mark.unit
+def test_series_query(sqlite_app):
+    """Test the series of a CI pipeline and a filter."""
+    with sqlite_app.app_context():
+        env = EnvModel("jenkins")
+        env.save_to_db()
+        metric = MetricModel("validate_drp.AM1")
+        metric.save_to_db()
+        for day, ci_name, filter_name in [
+            (1, "validate_drp", "r"),
+            (2, "validate_drp", "i"),
+            (3, "ap_verify", "r"),
+        ]:
+            job = JobModel(
+                env.id,
+                {"ci_name": ci_name, "date": f"2020-01-0{day}T00:00:00Z"},
+                {"filter_name": filter_name},
+                etl_mode=True,
+            )
+            db.session.add(job)
+            db.session.flush()
+            measurement = MeasurementModel(job.id, metric.id, float(day))
+            measurement.date_created = job.date_created
+            db.session.add(measurement)
+        db.session.commit()
+
+        query = SeriesQuery(
+            metric.id, ci_name="validate_drp", filter_name="r"
+        ).query()
+        assert [value for _, value, _, _ in query] == [1.0]
@@ -0,0 +1,35 @@
+"""Test squash-api staging module."""
+
+import io
+
+import pytest
+
+from squash.staging import LocalStaging, S3Staging, get_staging
+
+
+@pytest.mark.unit
+def test_local_staging(tmp_path):
+    """Test staging a job document in a local directory."""
+    staging = get_staging(f"file://{tmp_path}/staging")
+    assert isinstance(staging, LocalStaging)
+
+    uri = staging.put(io.BytesIO(b'{"meta": {}}'))
+    assert uri.startswith(f"file://{tmp_path}/staging/")
+
+    with staging.open(uri) as f:
+        assert f.read() == b'{"meta": {}}'
+
+    staging.delete(uri)
+    assert not list((tmp_path / "staging").iterdir())
+
+
+@pytest.mark.unit
+def test_get_staging():
+    """Test the staging area selection from its URL."""
+    staging = get_staging("s3://bucket/prefix/")
+    assert isinstance(staging, S3Staging)
+    assert staging.bucket == "bucket"
+    assert staging.prefix == "prefix"
+
+    with pytest.raises(ValueError):
+        get_staging("ftp://host/path")
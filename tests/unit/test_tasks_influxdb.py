@@ -0,0 +1,204 @@
+"""Test squash-api tasks/influxdb module."""
+
+import pytest
+import requests
+
+from squash.tasks import influxdb
+from squash.tasks.influxdb import ExportStats, write_influxdb_lines
+
+
+class FakeResponse:
+    """A response with a given status code."""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        """Raise HTTPError for error status codes."""
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code))
+
+
+@pytest.fixture
+def post(monkeypatch):
+    """Replace requests.post by a function returning given responses."""
+    calls = []
+
+    def set_responses(*responses):
+        responses = list(responses)
+
+        def fake_post(url, params=None, data=None, headers=None):
+            calls.append(data)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return FakeResponse(response)
+
+        monkeypatch.setattr(influxdb.requests, "post", fake_post)
+        return calls
+
+    return set_responses
+
+
+@pytest.mark.unit
+def test_write_lines(post):
+    """Write a batch of lines in a single request."""
+    calls = post(204)
+    status_code, retries = write_influxdb_lines(["a x=1", "b x=2"], "db", "")
+    assert (status_code, retries) == (204, 0)
+    assert calls == [b"a x=1\nb x=2"]
+
+
+@pytest.mark.unit
+def test_write_lines_retries(post):
+    """Retry connection and server errors, not client errors."""
+    post(requests.exceptions.ConnectionError(), 503, 204)
+    assert write_influxdb_lines(["a"], "db", "", max_retries=3, backoff=0) == (
+        204,
+        2,
+    )
+
+    post(503, 503)
+    assert write_influxdb_lines(["a"], "db", "", max_retries=1, backoff=0) == (
+        503,
+        1,
+    )
+
+    post(400)
+    assert write_influxdb_lines(["a"], "db", "", max_retries=3, backoff=0) == (
+        400,
+        0,
+    )
+
+
+@pytest.mark.unit
+def test_export_stats():
+    """Report stage timings, write batches and throughput."""
+    stats = ExportStats()
+    with stats.stage("fetch"):
+        pass
+    with stats.stage("write"):
+        stats.add_batch(10, 100, 0.1, 1, 204)
+        stats.add_batch(5, 50, 0.1, 0, 400)
+
+    result = stats.to_dict()
+    assert set(result["timings"]) == {"fetch", "write"}
+    assert len(result["batches"]) == 2
+    assert (result["lines"], result["bytes"], result["retries"]) == (
+        10,
+        100,
+        1,
+    )
+    assert result["lines_per_second"] > 0
+
+
+@pytest.mark.unit
+def test_jobs_to_influxdb(monkeypatch, post):
+    """Write the lines of consecutive jobs in the same batches."""
+    lines = {1: ["a", "b"], 2: None, 3: ["c", "d", "e"]}
+
+    def fetch_job_lines(job_id, stats):
+        if lines[job_id] is None:
+            return None, "Not found", 500
+        return lines[job_id], None, 200
+
+    monkeypatch.setattr(influxdb, "_fetch_job_lines", fetch_job_lines)
+    monkeypatch.setattr(
+        influxdb, "create_influxdb_database", lambda *args: 200
+    )
+    monkeypatch.setattr(influxdb.config, "INFLUXDB_BATCH_SIZE", 3)
+    calls = post(204, 204)
+
+    result = influxdb.jobs_to_influxdb([1, 2, 3])
+    assert calls == [b"a\nb\nc", b"d\ne"]
+    assert result["status_code"] == 204
+    assert result["jobs"] == 2
+    assert result["failed"] == [2]
+
+
+class FakeGetResponse(FakeResponse):
+    """A successful response with JSON data."""
+
+    def __init__(self, data):
+        super().__init__(200)
+        self.data = data
+
+    def json(self):
+        """Return the data."""
+        return self.data
+
+
+class FakeTransformer:
+    """Return the measurements and change points as InfluxDB lines."""
+
+    def __init__(self, squash_api_url, data, change_points):
+        self.lines = data["measurements"] + [
+            c["metric"] + " change_point=1" for c in change_points
+        ]
+
+    def get_timestamp(self):
+        """Return the job timestamp."""
+        return 0
+
+    def to_influxdb_line(self, timestamp):
+        """Return the InfluxDB lines."""
+        return self.lines
+
+
+@pytest.fixture
+def export(monkeypatch, post):
+    """Export jobs read with a given function replacing requests.get.
+
+    Returns the data posted to InfluxDB.
+    """
+
+    def set_get(fake_get):
+        monkeypatch.setattr(influxdb.requests, "get", fake_get)
+        monkeypatch.setattr(influxdb, "Transformer", FakeTransformer)
+        monkeypatch.setattr(
+            influxdb, "create_influxdb_database", lambda *args: 200
+        )
+        return post(204)
+
+    return set_get
+
+
+@pytest.mark.unit
+def test_job_to_influxdb_reads_primary(export):
+    """Read a job just ingested from the primary, not a lagging replica."""
+
+    def fake_get(url, params=None, headers=None):
+        # The replica has the job row only
+        primary = influxdb.READ_PRIMARY_HEADER in headers
+        if url.endswith("/change_points"):
+            return FakeGetResponse(
+                {"change_points": [{"metric": "a"}] if primary else []}
+            )
+        return FakeGetResponse({"measurements": ["a", "b"] if primary else []})
+
+    calls = export(fake_get)
+
+    result = influxdb.job_to_influxdb(1)
+    assert result["status_code"] == 204
+    assert calls == [b"a\nb\na change_point=1"]
+
+
+@pytest.mark.unit
+def test_job_to_influxdb_change_points(export):
+    """Export the change points of every measurement of the job."""
+    metrics = [f"m{i}" for i in range(150)]
+
+    def fake_get(url, params=None, headers=None):
+        if url.endswith("/change_points"):
+            limit = params.get("limit", 100)
+            return FakeGetResponse(
+                {"change_points": [{"metric": m} for m in metrics[:limit]]}
+            )
+        return FakeGetResponse({"measurements": metrics})
+
+    calls = export(fake_get)
+
+    influxdb.job_to_influxdb(1)
+    lines = calls[0].decode().split("\n")
+    assert len(lines) == 2 * len(metrics)
+    assert lines[-1] == "m149 change_point=1"
@@ -0,0 +1,119 @@
+"""Test squash-api tasks/ingest module."""
+
+import pytest
+from celery.backends.cache import CacheBackend
+
+from squash.models import JobModel, MetricModel, db
+from squash.tasks import ingest
+from squash.tasks.celery import squash_tasks
+
+JOB = {
+    "meta": {
+        "env": {
+            "env_name": "jenkins",
+            "ci_id": "1",
+            "ci_name": "validate_drp",
+            "date": "2019-01-31T12:00:00Z",
+        },
+        "packages": {},
+    },
+    "measurements": [
+        {"metric": "validate_drp.AM1", "value": 1.5, "unit": "marcsec"}
+    ],
+    "blobs": [],
+}
+
+
+class FakeResult:
+    """The result of a task that did not run."""
+
+    id = "export"
+
+
+@pytest.fixture
+def eager(sqlite_app, tmp_path, monkeypatch):
+    """Run the ingest tasks eagerly with the SQLite app.
+
+    The task states are kept in memory, the exports to InfluxDB are not
+    run. Returns the recorded ``PROGRESS`` states.
+    """
+    sqlite_app.config["SQUASH_STAGING_URL"] = f"file://{tmp_path}/staging"
+    monkeypatch.setattr(ingest, "_app", sqlite_app)
+    monkeypatch.setattr(
+        squash_tasks._local,
+        "backend",
+        CacheBackend(app=squash_tasks, backend="memory"),
+        raising=False,
+    )
+    monkeypatch.setitem(squash_tasks.conf, "task_always_eager", True)
+    monkeypatch.setitem(squash_tasks.conf, "task_store_eager_result", True)
+    monkeypatch.setattr(
+        ingest.job_to_influxdb, "delay", lambda job_id: FakeResult()
+    )
+
+    states = []
+    update_state = ingest.ingest_job.update_state
+
+    def record_state(state=None, meta=None, **kwargs):
+        states.append((state, meta))
+        update_state(state=state, meta=meta, **kwargs)
+
+    monkeypatch.setattr(ingest.ingest_job, "update_state", record_state)
+    return states
+
+
+@pytest.mark.unit
+def test_ingest_job(sqlite_app, auth_headers, tmp_path, eager, monkeypatch):
+    """Test a job ingested by the task from the staged document."""
+    with sqlite_app.app_context():
+        MetricModel("validate_drp.AM1", unit="marcsec").save_to_db()
+
+    client = sqlite_app.test_client()
+    response = client.post(
+        "/job", query_string={"async": "true"}, json=JOB, headers=auth_headers
+    )
+    assert response.status_code == 202
+
+    # The staged document is deleted once loaded
+    assert not list((tmp_path / "staging").iterdir())
+
+    # Each loading step is reported, then its counts
+    steps = [
+        "scan",
+        "check_or_create_env",
+        "create_job",
+        "insert_packages",
+        "insert_blobs",
+        "insert_measurements",
+        "detect_change_points",
+    ]
+    assert [state for state, _ in eager] == ["PROGRESS"] * len(eager)
+    assert [meta["step"] for _, meta in eager[:6]] == steps[:6]
+    assert eager[6][1] == {
+        "stage": "ingest",
+        "step": "insert_measurements",
+        "completed": steps[:5],
+        "measurements": 1,
+    }
+    assert eager[-1][1] == {
+        "stage": "ingest",
+        "step": "detect_change_points",
+        "completed": steps[:6],
+        "change_points": 0,
+    }
+
+    # Read the task result as the API does
+    monkeypatch.setitem(squash_tasks.conf, "task_always_eager", False)
+    status = client.get(response.json["status"]).json
+    job_id = status.pop("job_id")
+    assert status == {
+        "status": "SUCCESS",
+        "message": f"Job {job_id} sucessfully ingested.",
+        "status_code": 201,
+        "export": {"status": "PENDING"},
+    }
+
+    with sqlite_app.app_context():
+        job = db.session.get(JobModel, job_id)
+        assert job.env["ci_id"] == "1"
+        assert len(job.measurements) == 1
@@ -29,3 +29,22 @@ def test_get_meas_by_package(data):
     assert "metric=0.0" in result["package"]
     assert "pmetric=0.0" in result["package"]
     assert "p.metric=0.0" in result["package"]
+
+
+@pytest.mark.unit
+def test_get_meas_by_package_change_points(data):
+    """Test the change point fields."""
+    t = Transformer(
+        "",
+        data,
+        change_points=[
+            {"metric": "package.metric", "direction": "up"},
+            {"metric": "package.pmetric", "direction": "down"},
+        ],
+    )
+
+    result = t.get_meas_by_package()
+
+    assert "metric_change_point=1" in result["package"]
+    assert "pmetric_change_point=-1" in result["package"]
+    assert len(result["package"]) == 5
@@ -0,0 +1,163 @@
+"""Test squash-api tracing module."""
+
+import json
+
+import pytest
+from celery import signals
+from flask import Flask
+
+from squash import tracing
+from squash.tasks.celery import squash_tasks
+from squash.tracing import (
+    FileExporter,
+    Tracing,
+    current_span,
+    inject,
+    parse_traceparent,
+    start_span,
+)
+
+
+class MemoryExporter:
+    """Keep the exported spans in memory."""
+
+    enabled = True
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        """Keep a span."""
+        self.spans.append(span)
+
+
+@pytest.fixture
+def exporter():
+    """Install the in-memory exporter."""
+    exporter = MemoryExporter()
+    tracing.configure(exporter)
+    yield exporter
+    tracing.configure(None)
+
+
+@pytest.mark.unit
+def test_disabled():
+    """Do not create spans if tracing is disabled."""
+    with start_span("stage") as span:
+        assert span is None
+        assert inject() == {}
+
+
+@pytest.mark.unit
+def test_nested_spans(exporter):
+    """Nest spans in the same trace."""
+    with start_span("parent", job_id=1) as parent:
+        with start_span("child") as child:
+            assert current_span() is child
+        assert current_span() is parent
+    assert current_span() is None
+
+    child, parent = exporter.spans
+    assert child.trace_id == parent.trace_id
+    assert child.parent_id == parent.span_id
+    assert parent.parent_id is None
+    assert parent.attributes == {"job_id": 1}
+    assert parent.duration >= child.duration
+
+
+@pytest.mark.unit
+def test_error(exporter):
+    """Record the exception raised in a span."""
+    with pytest.raises(ValueError):
+        with start_span("stage"):
+            raise ValueError("invalid")
+    assert exporter.spans[0].status == "error"
+    assert current_span() is None
+
+
+@pytest.mark.unit
+def test_traceparent(exporter):
+    """Continue a remote trace from the traceparent header."""
+    assert parse_traceparent("invalid") is None
+    assert parse_traceparent(None) is None
+
+    with start_span("remote") as remote:
+        headers = inject({"Accept": "application/json"})
+    assert headers["traceparent"] == remote.traceparent
+
+    with start_span("local", headers["traceparent"]) as local:
+        pass
+    assert (local.trace_id, local.parent_id) == (
+        remote.trace_id,
+        remote.span_id,
+    )
+
+
+@pytest.mark.unit
+def test_request(exporter):
+    """Trace requests as children of the caller span."""
+    app = Flask(__name__)
+    app.config["SQUASH_TRACING_EXPORTER"] = exporter
+    Tracing(app)
+
+    @app.route("/job/<int:job_id>")
+    def job(job_id):
+        with start_span("query"):
+            return {"id": job_id}
+
+    with start_span("task") as task:
+        headers = inject()
+    response = app.test_client().get("/job/1", headers=headers)
+
+    query, request = exporter.spans[1:]
+    assert request.name == "GET job"
+    assert request.parent_id == task.span_id
+    assert request.attributes["http.status_code"] == 200
+    assert query.parent_id == request.span_id
+    assert response.headers["traceparent"] == request.traceparent
+
+
+@pytest.mark.unit
+def test_celery(exporter):
+    """Propagate the trace context in the Celery task headers."""
+
+    @squash_tasks.task
+    def job_to_influxdb():
+        pass
+
+    with start_span("request"):
+        headers = {}
+        signals.before_task_publish.send(sender="task", headers=headers)
+    request = exporter.spans[0]
+
+    task = job_to_influxdb
+    task.push_request(**headers)
+    signals.task_prerun.send(sender=task, task_id="1", task=task)
+    signals.task_postrun.send(
+        sender=task, task_id="1", task=task, state="SUCCESS"
+    )
+
+    task.pop_request()
+
+    span = exporter.spans[1]
+    assert span.name.endswith("job_to_influxdb")
+    assert span.parent_id == request.span_id
+    assert span.attributes["celery.state"] == "SUCCESS"
+
+
+@pytest.mark.unit
+def test_file_exporter(tmp_path):
+    """Append spans as JSON lines."""
+    path = tmp_path / "traces" / "spans.jsonl"
+    tracing.configure(f"file://{path}")
+    try:
+        with start_span("parent"):
+            with start_span("child"):
+                pass
+    finally:
+        tracing.configure(None)
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [span["name"] for span in spans] == ["child", "parent"]
+    assert isinstance(tracing.get_exporter("null"), tracing.NullExporter)
+    assert isinstance(FileExporter(str(path)), FileExporter)
@@ -0,0 +1,79 @@
+"""Test squash-api transfer module."""
+
+from datetime import datetime
+
+import pytest
+
+from squash.models import BlobModel, db
+from squash.transfer import WRITERS, _insert, _read_rows
+
+
+@pytest.fixture
+def rows():
+    """Create job rows with JSON, date and missing values."""
+    return [
+        {
+            "id": 1,
+            "env_id": 1,
+            "ci_dataset": "HSC",
+            "date_created": datetime(2020, 1, 31, 12, 30, 5),
+            "env": {"ci_id": "1", "ci_name": "validate_drp"},
+            "meta": {"packages": {"afw": {"git_sha": "abc"}}},
+            "s3_uri": None,
+        },
+        {
+            "id": 2,
+            "env_id": 1,
+            "ci_dataset": None,
+            "date_created": datetime(2020, 2, 1),
+            "env": None,
+            "meta": {},
+            "s3_uri": "s3://bucket/job",
+        },
+    ]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "output,extension", [("ndjson", ".ndjson.gz"), ("parquet", ".parquet")]
+)
+def test_round_trip(tmp_path, rows, output, extension):
+    """Read back the rows written, in batches, with the database types."""
+    if output == "parquet":
+        pytest.importorskip("pyarrow")
+    table = db.metadata.tables["job"]
+    path = str(tmp_path / ("chunk" + extension))
+
+    writer = WRITERS[output](path, table)
+    writer.write([dict(row) for row in rows])
+    writer.close()
+
+    batches = list(_read_rows(path, table, batch_size=1))
+    assert len(batches) == 2
+    assert [row for batch in batches for row in batch] == rows
+
+
+@pytest.mark.unit
+def test_insert_ignore(sqlite_app, tmp_path):
+    """Test that the blobs inserted by another import are skipped."""
+    table = db.metadata.tables["blob"]
+    path = str(tmp_path / "chunk.ndjson.gz")
+    writer = WRITERS["ndjson"](path, table)
+    writer.write(
+        [
+            {"id": 1, "identifier": "0" * 32, "name": "a", "s3_uri": None},
+            {"id": 2, "identifier": "1" * 32, "name": "b", "s3_uri": None},
+        ]
+    )
+    writer.close()
+
+    with sqlite_app.app_context():
+        # Inserted after the existing blobs were looked up
+        blob = BlobModel("0" * 32, "a")
+        blob.id = 1
+        db.session.add(blob)
+        db.session.commit()
+
+        assert _insert(table, path, batch_size=10, ignore=True) == 1
+        db.session.commit()
+        assert db.session.query(BlobModel.name).count() == 2